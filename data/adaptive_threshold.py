@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import insort
+
+from metrics import registry
+
+ADAPTIVE_THRESHOLDS_PATH = "/data/adaptive_thresholds.json"
+
+
+class P2Quantile:
+    """
+    Estimateur de quantile en flux (algorithme P² de Jain et Chlamtac).
+
+    Cinq marqueurs suffisent, quel que soit le nombre d'observations : leurs
+    hauteurs sont ajustées par interpolation parabolique à chaque valeur, le
+    marqueur central suit le quantile p.
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.heights = []  # Hauteurs des marqueurs (les 5 premières valeurs triées au départ)
+        self.positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.desired = [1.0, 1.0 + 2 * p, 1.0 + 4 * p, 3.0 + 2 * p, 5.0]
+        self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x):
+        """Ajoute une observation"""
+        self.count += 1
+        q = self.heights
+        if self.count <= 5:
+            insort(q, x)
+            return
+        n = self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= x < q[i + 1])
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < height < q[i + 1]:
+                    # Interpolation linéaire si la parabole sort de l'intervalle
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def value(self):
+        """Estimation courante du quantile, ou None sans observation"""
+        if not self.heights:
+            return None
+        if self.count <= 5:
+            return self.heights[min(len(self.heights) - 1, int(self.p * len(self.heights)))]
+        return self.heights[2]
+
+    def to_dict(self):
+        return {
+            'p': self.p, 'count': self.count, 'heights': self.heights,
+            'positions': self.positions, 'desired': self.desired
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        estimator = cls(float(data['p']))
+        estimator.count = int(data['count'])
+        estimator.heights = [float(v) for v in data['heights']]
+        if estimator.count > 5:
+            estimator.positions = [float(v) for v in data['positions']]
+            estimator.desired = [float(v) for v in data['desired']]
+        return estimator
+
+
+class SourceStatistics:
+    """
+    Distributions du score de clap et du RMS de fond d'une source.
+
+    Deux jeux d'estimateurs se relaient pour suivre les changements
+    d'environnement : le jeu actif sert au calcul du seuil, le suivant
+    accumule les observations et le remplace après horizon fenêtres.
+    """
+
+    def __init__(self, score_quantile, rms_quantile=0.5):
+        self.score_quantile = score_quantile
+        self.rms_quantile = rms_quantile
+        self.active = self._new_estimators()
+        self.next = self._new_estimators()
+
+    def _new_estimators(self):
+        return {'score': P2Quantile(self.score_quantile), 'rms': P2Quantile(self.rms_quantile)}
+
+    @property
+    def count(self):
+        return self.active['score'].count
+
+    def add(self, score, rms, horizon):
+        for estimators in (self.active, self.next):
+            estimators['score'].add(score)
+            if rms is not None:
+                estimators['rms'].add(rms)
+        if self.next['score'].count >= horizon:
+            self.active, self.next = self.next, self._new_estimators()
+
+    def to_dict(self):
+        return {
+            name: {key: estimator.to_dict() for key, estimator in estimators.items()}
+            for name, estimators in (('active', self.active), ('next', self.next))
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        active = {key: P2Quantile.from_dict(value) for key, value in data['active'].items()}
+        stats = cls(active['score'].p, active['rms'].p)
+        stats.active = active
+        stats.next = {key: P2Quantile.from_dict(value) for key, value in data['next'].items()}
+        return stats
+
+
+class AdaptiveThresholds:
+    """
+    Seuils de détection propres à chaque source, déduits de son bruit de fond.
+
+    Pour chaque source, le quantile quantile des scores de clap de toutes ses
+    fenêtres (les claps sont rares, ce quantile mesure le fond) et le RMS médian
+    des fenêtres sont estimés en flux. Le seuil de la source est ce quantile
+    plus margin, borné par [min_threshold, max_threshold] ; une fenêtre ne
+    déclenche en outre que si son RMS dépasse energy_ratio fois le RMS médian.
+    Tant qu'une source a moins de warmup fenêtres, le seuil global
+    (default_threshold) s'applique. Les statistiques sont enregistrées dans un
+    fichier JSON pour survivre aux redémarrages.
+    """
+
+    def __init__(self, path=ADAPTIVE_THRESHOLDS_PATH, default_threshold=0.5, quantile=0.99, margin=0.15,
+                 min_threshold=0.2, max_threshold=0.95, energy_ratio=1.5, warmup=300, horizon=100000,
+                 save_interval=300.0):
+        """
+        Initialise les seuils et charge les statistiques enregistrées.
+
+        Args:
+            path (str): Fichier JSON des statistiques
+            default_threshold (float): Seuil global, utilisé pendant la période d'apprentissage
+            quantile (float): Quantile des scores de clap servant de niveau de fond
+            margin (float): Écart ajouté au niveau de fond pour obtenir le seuil
+            min_threshold (float): Seuil minimal
+            max_threshold (float): Seuil maximal
+            energy_ratio (float): RMS minimal d'une fenêtre déclenchante, relatif au RMS médian (0 = désactivé)
+            warmup (int): Fenêtres observées avant d'utiliser le seuil adaptatif
+            horizon (int): Fenêtres après lesquelles les statistiques sont renouvelées
+            save_interval (float): Intervalle (s) entre deux enregistrements
+        """
+        self.path = path
+        self.default_threshold = default_threshold
+        self.quantile = quantile
+        self.margin = margin
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.energy_ratio = energy_ratio
+        self.warmup = warmup
+        self.horizon = max(horizon, warmup)
+        self.save_interval = save_interval
+        self.sources = {}  # source_id -> SourceStatistics
+        self._last_save = time.monotonic()
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Charge les statistiques enregistrées (fichier absent ou illisible : départ à vide)"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            sources = {source_id: SourceStatistics.from_dict(stats) for source_id, stats in data.items()}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.error(f"Statistiques de seuil adaptatif illisibles ({self.path}): {e}")
+            return
+        with self._lock:
+            for source_id, stats in sources.items():
+                # Un changement de quantile invalide les statistiques de score
+                if stats.score_quantile == self.quantile:
+                    self.sources[source_id] = stats
+        logging.info(f"Statistiques de seuil adaptatif chargées pour {len(self.sources)} source(s)")
+
+    def save(self):
+        """Écrit les statistiques de manière atomique (fichier temporaire puis renommage)"""
+        with self._lock:
+            data = {source_id: stats.to_dict() for source_id, stats in self.sources.items()}
+            self._last_save = time.monotonic()
+        directory = os.path.dirname(self.path)
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Impossible d'enregistrer les statistiques de seuil adaptatif: {e}")
+
+    def trigger_level(self, source_id):
+        """
+        Seuil de détection courant d'une source.
+
+        Args:
+            source_id (str): Identifiant de la source
+
+        Returns:
+            tuple: (seuil de score, RMS minimal d'une fenêtre déclenchante ou None)
+        """
+        stats = self.sources.get(source_id)
+        if stats is None or stats.count < self.warmup:
+            return self.default_threshold, None
+        background = stats.active['score'].value()
+        threshold = min(self.max_threshold, max(self.min_threshold, background + self.margin))
+        rms = stats.active['rms'].value()
+        min_rms = self.energy_ratio * rms if self.energy_ratio > 0 and rms is not None else None
+        return threshold, min_rms
+
+    def update(self, source_id, score, rms=None):
+        """
+        Ajoute le score de clap et le RMS d'une fenêtre aux statistiques de la source.
+
+        Args:
+            source_id (str): Identifiant de la source
+            score (float): Score de clap de la fenêtre
+            rms (float, optional): RMS de la fenêtre
+        """
+        with self._lock:
+            stats = self.sources.get(source_id)
+            if stats is None:
+                stats = self.sources[source_id] = SourceStatistics(self.quantile)
+            stats.add(score, rms, self.horizon)
+            if stats.count == self.warmup:
+                logging.info(f"Seuil adaptatif actif pour {source_id}")
+            due = time.monotonic() - self._last_save >= self.save_interval
+        if due:
+            self.save()
+
+    def get_levels(self):
+        """Seuil et RMS médian de chaque source : source_id -> (seuil, RMS médian ou None)"""
+        return {
+            source_id: (self.trigger_level(source_id)[0], stats.active['rms'].value())
+            for source_id, stats in list(self.sources.items())
+        }
+
+
+# Instance globale partagée par les détecteurs
+adaptive_thresholds = None
+_thresholds_lock = threading.Lock()
+
+def get_adaptive_thresholds(**kwargs):
+    """Retourne les seuils adaptatifs globaux, créés au premier appel"""
+    global adaptive_thresholds
+    with _thresholds_lock:
+        if adaptive_thresholds is None:
+            adaptive_thresholds = AdaptiveThresholds(**kwargs)
+        return adaptive_thresholds
+
+def collect_metrics():
+    """Seuil et RMS de fond de chaque source (collecteur du registre de métriques)"""
+    levels = adaptive_thresholds.get_levels() if adaptive_thresholds else {}
+    yield (
+        'claptrap_adaptive_threshold', 'gauge', "Seuil de score de clap de la source",
+        [({'source': source_id}, threshold) for source_id, (threshold, _) in levels.items()]
+    )
+    yield (
+        'claptrap_background_rms', 'gauge', "RMS médian des fenêtres de la source",
+        [({'source': source_id}, rms) for source_id, (_, rms) in levels.items() if rms is not None]
+    )
+
+registry.register_collector(collect_metrics)
+
+def shutdown_adaptive_thresholds():
+    """Enregistre les statistiques et libère l'instance globale"""
+    global adaptive_thresholds
+    with _thresholds_lock:
+        if adaptive_thresholds:
+            adaptive_thresholds.save()
+            adaptive_thresholds = None
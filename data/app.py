@@ -1,9 +1,14 @@
-from classify import start_detection, stop_detection
+from model_cache import PROCESS_START, log_phase, resolve_model_path, warm_up_async
+from classify import (start_detection, stop_detection, get_enabled_sources, apply_settings, inference_settings,
+                      ingest_settings, get_custom_sounds_options, INFERENCE_BACKEND)
+from config_watcher import ConfigWatcher
 import json
 from vban_manager import init_vban_detector as init_vban, cleanup_vban_detector
+from metrics import METRICS_PORT, start_metrics_server, shutdown_metrics_server
 import os
 import logging
 import atexit
+import time
 
 # Configuration du logging
 logging.basicConfig(
@@ -16,9 +21,6 @@ logging.getLogger('werkzeug').setLevel(logging.WARNING)
 
 SETTINGS_FILE = "/data/options.json"
 
-# Initialiser le détecteur VBAN
-init_vban()
-
 def load_settings():
     if os.path.exists(SETTINGS_FILE):
         with open(SETTINGS_FILE, 'r') as f:
@@ -29,11 +31,54 @@ def load_settings():
 
 SETTINGS = load_settings()
 
+log_phase("import des modules", PROCESS_START)
+
+def is_vban_enabled(settings):
+    """Indique si au moins une source VBAN est activée"""
+    if not settings:
+        return False
+    saved_sources = settings.get('saved_vban_sources') or []
+    if any(source.get('enabled', True) for source in saved_sources):
+        return True
+    vban_settings = settings.get('vban') or []
+    if isinstance(vban_settings, dict):
+        vban_settings = [vban_settings]
+    return any(isinstance(source, dict) and source.get('enabled', False) for source in vban_settings)
+
+def uses_vban_thread(settings):
+    """Indique si le détecteur VBAN à thread dédié doit écouter (en mode asyncio, le cœur d'ingestion reçoit les paquets)"""
+    return is_vban_enabled(settings) and ingest_settings.get('mode', 'threads') != 'async'
+
+def apply_metrics_settings(settings):
+    """Démarre ou arrête le serveur de métriques selon la section metrics de options.json"""
+    metrics_settings = (settings or {}).get('metrics') or {}
+    if metrics_settings.get('enabled', False):
+        start_metrics_server(int(metrics_settings.get('port', METRICS_PORT)))
+    else:
+        shutdown_metrics_server()
+
+# Rechargement à chaud de options.json
+config_watcher = None
+
 @atexit.register
 def cleanup():
     """Nettoie les ressources lors de l'arrêt"""
+    if config_watcher:
+        config_watcher.stop()
     stop_detection_route()
     cleanup_vban_detector()
+    shutdown_metrics_server()
+
+def on_settings_changed(previous, settings):
+    """Applique une modification de options.json sans redémarrer la détection"""
+    global SETTINGS
+    SETTINGS = settings
+    if uses_vban_thread(settings):
+        init_vban()
+    if (previous or {}).get('metrics') != settings.get('metrics'):
+        shutdown_metrics_server()
+        apply_metrics_settings(settings)
+    apply_settings(previous, settings)
 
 class VBANSource:
     def __init__(self, name, ip, port, stream_name, enabled=True):
@@ -74,7 +119,7 @@ def start_detection_route():
             microphone_enabled = False
 
         if not microphone_enabled:
-            print("Microphone désactivé - aucune capture audio ne sera effectuée")
+            logging.info("Microphone désactivé - aucune capture audio ne sera effectuée")
 
         # Préparer les paramètres pour start_detection avec gestion des valeurs null
         try:
@@ -83,44 +128,18 @@ def start_detection_route():
                 logging.error("global dict is not valid, using empty dict")
                 global_settings = {}
 
-            microphone_settings = detection_settings.get('microphone', {})
-            if not isinstance(microphone_settings, dict):
-                logging.error("microphone dict is not valid, using empty dict")
-                microphone_settings = {}
-
             detection_params = {
-                'model': "yamnet.tflite",
+                'model': resolve_model_path(inference_settings.get('model')),
                 'score_threshold': float(global_settings.get('threshold', '0.2')),
                 'overlapping_factor': 0.8,
-                'audio_source': microphone_settings.get('audio_source') if microphone_enabled else None,
-                'rtsp_url': None
+                'sources': get_enabled_sources(detection_settings)
             }
 
-            # Check for RTSP sources first
-            rtsp_sources = detection_settings.get('rtsp', [])
-            for source in rtsp_sources:
-                if source.get('enabled', False):
-                    detection_params['audio_source'] = f"rtsp://{source['url']}"
-                    detection_params['rtsp_url'] = source['url']
-                    logging.info(f"Utilisation de la source RTSP: {source.get('name', 'Unknown')} ({source['url']})")
-                    break
-
-            # If no RTSP source is enabled, check for VBAN sources
-            if not detection_params['audio_source'] and not microphone_enabled:
-                # Vérifier d'abord saved_vban_sources
-                saved_vban_sources = detection_settings.get('saved_vban_sources', [])
-                if saved_vban_sources:
-                    # Utiliser la première source VBAN active
-                    for source in saved_vban_sources:
-                        if source.get('enabled', True):
-                            detection_params['audio_source'] = f"vban://{source['ip']}"
-                            logging.info(f"Utilisation de la source VBAN: {source['name']} ({source['ip']})")
-                            break
-                    else:
-                        if not any(source.get('enabled', True) for source in saved_vban_sources):
-                            logging.info("Aucune source VBAN active n'est activée")
-                else:
-                    logging.info("Aucune source VBAN configurée")
+            # Toutes les sources activées (micro, RTSP, VBAN) sont démarrées ensemble
+            for source in detection_params['sources']:
+                logging.info(f"Source activée: {source['source_id']} ({source['audio_source']})")
+            if not detection_params['sources']:
+                logging.info("Aucune source audio activée")
         except (ValueError, TypeError) as e:
             logging.error(f"Erreur lors de la préparation des paramètres de détection: {str(e)}")
 
@@ -147,6 +166,28 @@ def stop_detection_route():
 
 if __name__ == '__main__':
     try:
+        # Charger le modèle en parallèle de la détection des sources
+        warm_up_async(
+            resolve_model_path(inference_settings.get('model')),
+            backend=INFERENCE_BACKEND,
+            workers=int(inference_settings.get('workers', 0)),
+            threads=inference_settings.get('threads'),
+            # Mêmes options que les détecteurs, qui récupèrent le backend TFLite créé ici
+            custom_sounds=get_custom_sounds_options(),
+            streaming_frontend=bool(inference_settings.get('streaming_frontend', True))
+        )
+
+        apply_metrics_settings(SETTINGS)
+
+        # Initialiser le détecteur VBAN seulement si une source VBAN est activée
+        # (pas à l'import : les workers d'inférence réimportent ce module au démarrage)
+        if uses_vban_thread(SETTINGS):
+            start = time.monotonic()
+            init_vban()
+            log_phase("démarrage de l'écoute VBAN", start)
+
+        config_watcher = ConfigWatcher(SETTINGS_FILE, on_settings_changed, initial=SETTINGS)
+        config_watcher.start()
         start_detection_route()
     except KeyboardInterrupt:
         logging.info("Arrêt du serveur...")
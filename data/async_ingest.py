@@ -0,0 +1,499 @@
+import asyncio
+import json
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ffmpeg_monitor import get_ffmpeg_monitor
+from hot_log import hot_log
+from metrics import DROPPED
+from vban_dispatcher import VBAN_PORT, get_vban_dispatcher
+
+TARGET_SAMPLE_RATE = 16000
+
+
+def ffmpeg_rtsp_command(rtsp_url, sample_rate, buffer_size, channels=1):
+    """Ligne de commande ffmpeg décodant un flux RTSP en float32 entrelacé sur stdout (mono si channels=1)"""
+    return [
+        'ffmpeg',
+        '-rtsp_transport', 'udp',
+        '-i', rtsp_url,
+        '-f', 'f32le',
+        '-ac', str(channels),
+        '-acodec', 'pcm_f32le',
+        '-ar', str(sample_rate),
+        '-buffer_size', str(buffer_size),
+        'pipe:'
+    ]
+
+
+class VBANProtocol(asyncio.DatagramProtocol):
+    """Réception des paquets VBAN sur la boucle asyncio, transmis au répartiteur partagé"""
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+
+    def datagram_received(self, data, addr):
+        self.dispatcher.feed(data, addr)
+
+    def error_received(self, exc):
+        hot_log.log(logging.WARNING, 'vban_error', "Erreur de réception VBAN: %s", exc)
+
+
+class AsyncMQTTPublisher:
+    """
+    Publication MQTT intégrée à la boucle asyncio.
+
+    Le socket de paho est surveillé par la boucle (add_reader/add_writer) au lieu
+    du thread loop_start() ; loop_misc est appelé périodiquement par une tâche.
+    publish() peut être appelé depuis n'importe quel thread.
+    """
+
+    def __init__(self, loop, host, port=1883, username=None, password=None, client_id=None, max_pending=1000):
+        """
+        Initialise le publieur.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): Boucle d'ingestion
+            host (str): Adresse du broker
+            port (int): Port du broker
+            username (str, optional): Identifiant
+            password (str, optional): Mot de passe
+            client_id (str, optional): Identifiant client MQTT
+            max_pending (int): Nombre maximal de messages en attente de connexion
+        """
+        import paho.mqtt.client as mqtt
+
+        self.loop = loop
+        self.host = host
+        self.port = port
+        self.client = mqtt.Client(client_id=client_id)
+        if username and password:
+            self.client.username_pw_set(username, password)
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.dropped = 0  # Messages abandonnés (file pleine)
+        self._connected = False
+        self._tasks = []
+
+    # Les callbacks de socket peuvent être appelés hors de la boucle (connexion dans l'executor)
+    def _on_socket_open(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self.loop.add_reader, sock, client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self.loop.remove_reader, sock)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self.loop.add_writer, sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.call_soon_threadsafe(self.loop.remove_writer, sock)
+
+    def start(self):
+        """Démarre les tâches de connexion et d'envoi (appelé depuis la boucle)"""
+        self._tasks = [
+            self.loop.create_task(self._maintain_connection()),
+            self.loop.create_task(self._send_loop())
+        ]
+
+    async def _maintain_connection(self):
+        """Connecte le client, appelle loop_misc et se reconnecte avec backoff"""
+        import paho.mqtt.client as mqtt
+
+        backoff = 1.0
+        while True:
+            try:
+                await self.loop.run_in_executor(None, self.client.connect, self.host, self.port)
+                self._connected = True
+                backoff = 1.0
+                logging.info(f"MQTT (asyncio) connecté à {self.host}:{self.port}")
+                while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                    await asyncio.sleep(1.0)
+                logging.warning("Connexion MQTT perdue")
+            except OSError as e:
+                logging.warning(f"Connexion MQTT impossible ({e}), nouvel essai dans {backoff:.0f}s")
+            self._connected = False
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    async def _send_loop(self):
+        """Envoie les messages en attente dès que la connexion est établie"""
+        while True:
+            topic, payload, retain = await self.queue.get()
+            while not self._connected:
+                await asyncio.sleep(0.5)
+            self.client.publish(topic, payload, retain=retain)
+
+    def _enqueue(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def publish(self, topic, payload, retain=False):
+        """Ajoute un message à la file d'envoi (thread-safe)"""
+        self.loop.call_soon_threadsafe(self._enqueue, (topic, payload, retain))
+
+    def stop(self):
+        """Annule les tâches et ferme la connexion (appelé depuis la boucle)"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._connected:
+            self.client.disconnect()
+            self._connected = False
+
+
+class AsyncIngestCore:
+    """
+    Cœur d'ingestion asyncio : une seule boucle (un seul thread) lit tous les flux
+    RTSP (ffmpeg via asyncio.create_subprocess_exec), reçoit les paquets VBAN
+    (DatagramProtocol) et publie en MQTT. L'inférence est exécutée dans un
+    ThreadPoolExecutor de taille fixe : le nombre de threads ne dépend pas du
+    nombre de sources.
+
+    Chaque source a sa propre tâche ; les blocs d'une même source sont traités
+    dans l'ordre, un seul à la fois, par l'executor.
+    """
+
+    def __init__(self, executor_workers=2, vban_port=VBAN_PORT, backoff_initial=1.0,
+                 backoff_max=60.0, stable_after=60.0, max_queue=50, keep_channels=False):
+        """
+        Initialise le cœur d'ingestion.
+
+        Args:
+            executor_workers (int): Nombre de threads de l'executor d'inférence
+            vban_port (int): Port UDP d'écoute VBAN
+            backoff_initial (float): Délai (s) avant la première reconnexion RTSP
+            backoff_max (float): Délai maximal (s) entre deux reconnexions
+            stable_after (float): Durée (s) de lecture après laquelle le backoff est réinitialisé
+            max_queue (int): Nombre maximal de paquets VBAN en attente par source
+            keep_channels (bool): Transmettre des blocs multi-canal [n_échantillons, n_canaux]
+                au lieu de mixer en mono
+        """
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="inference")
+        self.vban_port = vban_port
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.max_queue = max_queue
+        self.keep_channels = keep_channels
+        self.loop = asyncio.new_event_loop()
+        self.tasks = {}  # source_id -> asyncio.Task
+        self.vban_routes = {}  # ip -> (source_id, asyncio.Queue)
+        self.vban_dropped = 0  # Paquets VBAN abandonnés (file de la source pleine)
+        self.vban_dispatcher = get_vban_dispatcher()
+        self.mqtt = None
+        self._vban_transport = None
+        self._thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Démarre la boucle asyncio dans son thread"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run_loop, name="ingest", daemon=True)
+        self._thread.start()
+        logging.info(f"Cœur d'ingestion asyncio démarré (executor: {self.executor._max_workers} threads)")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+            self.stopped.set()
+
+    def _call(self, func, *args, timeout=10.0):
+        """Exécute func(*args) dans la boucle et retourne son résultat"""
+        async def runner():
+            return func(*args)
+        return asyncio.run_coroutine_threadsafe(runner(), self.loop).result(timeout)
+
+    # -- MQTT -----------------------------------------------------------------
+
+    def start_mqtt(self, host, port=1883, username=None, password=None, client_id=None):
+        """
+        Crée le publieur MQTT asynchrone.
+
+        Returns:
+            AsyncMQTTPublisher: Publieur à rattacher au MQTTClient
+        """
+        def create():
+            self.mqtt = AsyncMQTTPublisher(self.loop, host, port, username, password, client_id)
+            self.mqtt.start()
+            return self.mqtt
+        return self._call(create)
+
+    # -- Sources --------------------------------------------------------------
+
+    def add_source(self, source, detector_factory, detector_release):
+        """
+        Démarre une source RTSP ou VBAN sans toucher aux autres.
+
+        Args:
+            source (dict): Source issue de get_enabled_sources
+            detector_factory (callable): detector_factory(sample_rate) -> AudioDetector démarré
+            detector_release (callable): detector_release(detector), appelé à l'arrêt de la source
+
+        Returns:
+            bool: False si la source est déjà active ou n'est pas prise en charge
+        """
+        source_id = source['source_id']
+        audio_source = source['audio_source']
+        if audio_source.startswith("rtsp"):
+            coroutine = self._run_rtsp(source_id, source['rtsp_url'], detector_factory, detector_release)
+        elif audio_source.startswith("vban://"):
+            coroutine = self._run_vban(source_id, audio_source.replace("vban://", ""), detector_factory, detector_release)
+        else:
+            return False
+
+        def create():
+            if source_id in self.tasks:
+                coroutine.close()
+                return False
+            task = self.loop.create_task(coroutine)
+            task.add_done_callback(lambda t: self._forget_task(source_id, t))
+            self.tasks[source_id] = task
+            logging.info(f"Source asyncio ajoutée: {source_id}")
+            return True
+        return self._call(create)
+
+    def remove_source(self, source_id):
+        """Arrête une source et attend la libération de ses ressources"""
+        def cancel():
+            task = self.tasks.pop(source_id, None)
+            if task:
+                task.cancel()
+            return task
+
+        task = self._call(cancel)
+        if task is None:
+            return False
+        try:
+            asyncio.run_coroutine_threadsafe(asyncio.wait([task]), self.loop).result(5.0)
+        except Exception:
+            pass
+        logging.info(f"Source asyncio retirée: {source_id}")
+        return True
+
+    def _forget_task(self, source_id, task):
+        """Retire une tâche terminée d'elle-même (source VBAN en échec)"""
+        if self.tasks.get(source_id) is task:
+            del self.tasks[source_id]
+            if not task.cancelled() and task.exception() is None:
+                logging.warning(f"Source asyncio {source_id} terminée")
+
+    def get_states(self):
+        """Retourne l'état de chaque source (même format que SourceSupervisor.get_states)"""
+        return {source_id: 'running' for source_id in list(self.tasks)}
+
+    async def _create_detector(self, detector_factory, sample_rate):
+        return await self.loop.run_in_executor(self.executor, detector_factory, sample_rate)
+
+    def _release_detector(self, detector_release, detector):
+        if detector:
+            self.executor.submit(detector_release, detector)
+
+    async def _probe_stream(self, rtsp_url):
+        """
+        Lit le taux d'échantillonnage et le nombre de canaux du flux avec ffprobe, sans bloquer la boucle.
+
+        Returns:
+            tuple: (sample_rate, channels)
+        """
+        try:
+            process = await asyncio.create_subprocess_exec(
+                'ffprobe', '-v', 'quiet',
+                '-show_entries', 'stream=sample_rate,channels',
+                '-select_streams', 'a:0',
+                '-of', 'json',
+                rtsp_url,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+        except FileNotFoundError:
+            logging.warning("ffprobe not available, using fallback sample rate 16000 Hz")
+            return TARGET_SAMPLE_RATE, 1
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=10)
+            for stream in json.loads(stdout).get('streams', []):
+                rate = stream.get('sample_rate')
+                if rate and rate != 'N/A':
+                    channels = int(stream.get('channels') or 1)
+                    logging.info(f"Sample rate detected from RTSP: {rate} ({channels} canaux)")
+                    return int(rate), channels
+        except (asyncio.TimeoutError, json.JSONDecodeError, ValueError):
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+        logging.warning("Could not determine sample rate from RTSP stream, using fallback 16000 Hz")
+        return TARGET_SAMPLE_RATE, 1
+
+    async def _monitor_stderr(self, source_id, stream):
+        """Transmet la sortie d'erreur de ffmpeg au moniteur partagé"""
+        monitor = get_ffmpeg_monitor()
+        while True:
+            data = await stream.read(65536)
+            if not data:
+                return
+            monitor.feed(source_id, data)
+
+    async def _run_rtsp(self, source_id, rtsp_url, detector_factory, detector_release):
+        """Lit un flux RTSP avec ffmpeg et le reconnecte avec backoff exponentiel"""
+        detector = None
+        backoff = self.backoff_initial
+        try:
+            while True:
+                started = time.monotonic()
+                result = 'fin'
+                try:
+                    sample_rate, channels = await self._probe_stream(rtsp_url)
+                    channels = channels if self.keep_channels else 1
+                    if detector is None or detector.sample_rate != sample_rate:
+                        self._release_detector(detector_release, detector)
+                        detector = None
+                        detector = await self._create_detector(detector_factory, sample_rate)
+                    await self._read_rtsp(source_id, rtsp_url, sample_rate, channels, detector)
+                    if get_ffmpeg_monitor().restart_requested(source_id):
+                        # Flux coupé par le moniteur (rafale d'erreurs de décodage) : reconnexion immédiate
+                        continue
+                except Exception as e:
+                    logging.error(f"Erreur dans la source {source_id}: {str(e)}")
+                    result = 'échec'
+
+                # Fin du flux ou échec : reconnexion avec backoff exponentiel
+                if time.monotonic() - started >= self.stable_after:
+                    backoff = self.backoff_initial
+                logging.warning(f"Source {source_id} arrêtée ({result}), redémarrage dans {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+        finally:
+            self._release_detector(detector_release, detector)
+
+    async def _read_rtsp(self, source_id, rtsp_url, sample_rate, channels, detector):
+        """Lance ffmpeg et transmet les blocs décodés au détecteur jusqu'à la fin du flux"""
+        block_size = int(sample_rate * 0.1)  # Blocs de 100ms
+        process = await asyncio.create_subprocess_exec(
+            *ffmpeg_rtsp_command(rtsp_url, sample_rate, block_size, channels),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        get_ffmpeg_monitor().attach(source_id, on_restart=process.kill)
+        stderr_task = self.loop.create_task(self._monitor_stderr(source_id, process.stderr))
+        logging.info(f"Détection démarrée pour la source RTSP {source_id}")
+        try:
+            while True:
+                data = await process.stdout.readexactly(block_size * channels * 4)
+                audio_data = np.frombuffer(data, np.float32)
+                if channels > 1:
+                    audio_data = audio_data.reshape(-1, channels)
+                await self.loop.run_in_executor(self.executor, detector.process_audio, audio_data, source_id)
+        except asyncio.IncompleteReadError:
+            logging.info("Détection RTSP terminée")
+        finally:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            stderr_task.cancel()
+
+    async def _ensure_vban_endpoint(self):
+        """Ouvre le socket VBAN au premier usage ; les paquets sont décodés par le répartiteur partagé"""
+        if self._vban_transport is None:
+            self.vban_dispatcher.subscribe(self._on_vban_frame)
+            self._vban_transport, _ = await self.loop.create_datagram_endpoint(
+                lambda: VBANProtocol(self.vban_dispatcher),
+                local_addr=('0.0.0.0', self.vban_port)
+            )
+            logging.info(f"Démarrage de l'écoute VBAN (asyncio) sur le port {self.vban_port}")
+
+    def _on_vban_frame(self, frame):
+        """Place un paquet VBAN décodé dans la file de sa source (abonné du répartiteur)"""
+        route = self.vban_routes.get(frame.ip)
+        if route is None:
+            return
+        if threading.current_thread() is not self._thread:
+            # Paquet reçu par le socket du répartiteur : les files asyncio ne sont manipulées que par la boucle
+            self.loop.call_soon_threadsafe(self._on_vban_frame, frame)
+            return
+
+        source_id, queue = route
+        try:
+            queue.put_nowait((frame.to_float32(self.keep_channels), frame.sample_rate, frame.received_at))
+        except asyncio.QueueFull:
+            self.vban_dropped += 1
+            DROPPED.labels(source_id, 'vban_queue').inc()
+
+    async def _run_vban(self, source_id, vban_ip, detector_factory, detector_release):
+        """Transmet au détecteur les paquets VBAN d'une adresse IP"""
+        detector = None
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        try:
+            await self._ensure_vban_endpoint()
+            detector = await self._create_detector(detector_factory, TARGET_SAMPLE_RATE)
+            self.vban_routes[vban_ip] = (source_id, queue)
+            while True:
+                # Regrouper les paquets déjà reçus en un seul appel à l'executor
+                packets = [await queue.get()]
+                while not queue.empty():
+                    packets.append(queue.get_nowait())
+                await self.loop.run_in_executor(self.executor, self._process_vban, detector, source_id, packets)
+        except Exception as e:
+            logging.error(f"Erreur dans la source {source_id}: {str(e)}")
+        finally:
+            if self.vban_routes.get(vban_ip, (None,))[0] == source_id:
+                del self.vban_routes[vban_ip]
+            self._release_detector(detector_release, detector)
+
+    @staticmethod
+    def _process_vban(detector, source_id, packets):
+        """Rééchantillonne à 16 kHz et transmet les paquets au détecteur (dans l'executor)"""
+        chunks = []
+        for audio_data, sample_rate, _ in packets:
+            if sample_rate != TARGET_SAMPLE_RATE:
+                from scipy.signal import resample_poly
+                g = math.gcd(sample_rate, TARGET_SAMPLE_RATE)
+                audio_data = resample_poly(audio_data, TARGET_SAMPLE_RATE // g, sample_rate // g, axis=0)
+            chunks.append(audio_data.astype(np.float32, copy=False))
+        audio_data = np.concatenate(chunks)
+        # L'horodatage de réception correspond à la fin du dernier paquet
+        capture_time = packets[-1][2] - len(audio_data) / TARGET_SAMPLE_RATE
+        detector.process_audio(audio_data, source_id, capture_time=capture_time)
+
+    # -- Arrêt ----------------------------------------------------------------
+
+    def stop(self, timeout=5.0):
+        """Arrête toutes les sources, le publieur MQTT et la boucle"""
+        if not self._thread:
+            return
+
+        async def shutdown():
+            tasks = list(self.tasks.values())
+            self.tasks.clear()
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.wait(tasks, timeout=timeout)
+            if self.mqtt:
+                self.mqtt.stop()
+            if self._vban_transport:
+                self.vban_dispatcher.unsubscribe(self._on_vban_frame)
+                self._vban_transport.close()
+                self._vban_transport = None
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout + 1.0)
+        except Exception as e:
+            logging.error(f"Erreur lors de l'arrêt du cœur d'ingestion: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+        self.executor.shutdown(wait=True)
+        logging.info("Cœur d'ingestion asyncio arrêté")
@@ -0,0 +1,185 @@
+import logging
+import os
+import re
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ARCHIVE_DIR = "/data/archive"
+CLIPS_DIR = "/data/clips"
+
+# Un seul thread écrit les extraits WAV de toutes les sources
+_clip_writer = None
+_writer_lock = threading.Lock()
+
+
+def _get_clip_writer():
+    global _clip_writer
+    with _writer_lock:
+        if _clip_writer is None:
+            _clip_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip-writer")
+        return _clip_writer
+
+
+def safe_filename(name):
+    """Remplace les caractères non autorisés dans un nom de fichier"""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') or 'source'
+
+
+class AudioArchive:
+    """
+    Archive audio glissante d'une source, stockée en int16 dans un fichier
+    mappé en mémoire de taille fixe.
+
+    Les échantillons sont indexés comme l'horloge d'échantillons du détecteur
+    (index monotone depuis le début de la source) : un extrait se désigne par
+    ses index de début et de fin. L'écriture se fait séquentiellement depuis le
+    chemin d'ingestion, sans allocation par bloc. Les extraits demandés sont
+    écrits en WAV par un thread dédié dès que leur fin a été enregistrée.
+    """
+
+    def __init__(self, source_id, sample_rate, duration=60.0, directory=ARCHIVE_DIR,
+                 clips_directory=CLIPS_DIR, max_clips=100):
+        """
+        Initialise l'archive.
+
+        Args:
+            source_id (str): Identifiant de la source
+            sample_rate (int): Taux d'échantillonnage
+            duration (float): Durée (s) conservée dans l'archive
+            directory (str): Répertoire des fichiers d'archive
+            clips_directory (str): Répertoire des extraits WAV
+            max_clips (int): Nombre maximal d'extraits conservés par source
+        """
+        self.source_id = source_id
+        self.sample_rate = sample_rate
+        self.capacity = int(duration * sample_rate)
+        self.clips_directory = clips_directory
+        self.max_clips = max_clips
+        self.name = safe_filename(source_id)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{self.name}.pcm")
+        self.data = np.memmap(self.path, dtype=np.int16, mode='w+', shape=(self.capacity,))
+        self.write_index = 0  # Index du prochain échantillon écrit
+        self._scratch = np.empty(int(sample_rate), dtype=np.float32)  # Conversion sans allocation
+        self._pending = []  # Extraits en attente de leur fin : (fin, début, chemin)
+        self._lock = threading.Lock()
+
+    def write(self, audio_data):
+        """
+        Ajoute un bloc mono float32 à l'archive.
+
+        Args:
+            audio_data (numpy.ndarray): Bloc à archiver, de valeurs dans [-1, 1]
+        """
+        n = len(audio_data)
+        if n > self.capacity:
+            audio_data = audio_data[-self.capacity:]
+            self.write_index += n - self.capacity
+            n = self.capacity
+        if n > len(self._scratch):
+            self._scratch = np.empty(n, dtype=np.float32)
+
+        scratch = self._scratch[:n]
+        np.multiply(audio_data, 32767.0, out=scratch)
+        np.clip(scratch, -32768.0, 32767.0, out=scratch)
+
+        pos = self.write_index % self.capacity
+        first = min(n, self.capacity - pos)
+        np.copyto(self.data[pos:pos + first], scratch[:first], casting='unsafe')
+        if first < n:
+            np.copyto(self.data[:n - first], scratch[first:], casting='unsafe')
+        self.write_index += n
+
+        if self._pending and self._pending[0][0] <= self.write_index:
+            self._flush_clips()
+
+    def read(self, start_index, end_index):
+        """
+        Copie les échantillons [start_index, end_index) encore présents dans l'archive.
+
+        Returns:
+            numpy.ndarray: Échantillons int16 (tronqués aux données disponibles)
+        """
+        start_index = max(start_index, self.write_index - self.capacity, 0)
+        end_index = min(end_index, self.write_index)
+        if end_index <= start_index:
+            return np.zeros(0, dtype=np.int16)
+        idx = np.arange(start_index, end_index) % self.capacity
+        return self.data[idx]
+
+    def request_clip(self, center_index, before=2.0, after=2.0, timestamp=None):
+        """
+        Demande l'écriture d'un extrait WAV autour d'un échantillon.
+
+        Le fichier est écrit en arrière-plan dès que la fin de l'extrait a été reçue.
+
+        Args:
+            center_index (int): Index de l'échantillon central (onset du clap)
+            before (float): Durée (s) avant l'échantillon central
+            after (float): Durée (s) après l'échantillon central
+            timestamp (float, optional): Heure murale de l'échantillon central, pour le nom du fichier
+
+        Returns:
+            str: Chemin du fichier WAV qui sera écrit
+        """
+        start_index = max(0, center_index - int(before * self.sample_rate))
+        end_index = center_index + int(after * self.sample_rate)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(timestamp or time.time()))
+        millis = int(((timestamp or time.time()) % 1) * 1000)
+        path = os.path.join(self.clips_directory, f"{self.name}_{stamp}.{millis:03d}.wav")
+        with self._lock:
+            self._pending.append((end_index, start_index, path))
+            self._pending.sort()
+        if end_index <= self.write_index:
+            self._flush_clips()
+        return path
+
+    def _flush_clips(self):
+        """Confie au thread d'écriture les extraits dont la fin a été archivée"""
+        with self._lock:
+            ready = [clip for clip in self._pending if clip[0] <= self.write_index]
+            self._pending = [clip for clip in self._pending if clip[0] > self.write_index]
+        for end_index, start_index, path in ready:
+            # Copie immédiate : le thread d'écriture ne lit pas l'archive pendant qu'elle avance
+            samples = self.read(start_index, end_index)
+            _get_clip_writer().submit(self._write_wav, path, samples)
+
+    def _write_wav(self, path, samples):
+        """Écrit un extrait WAV mono 16 bits (thread d'écriture)"""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with wave.open(path, 'wb') as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(self.sample_rate)
+                wav.writeframes(samples.astype('<i2', copy=False).tobytes())
+            logging.info(f"Extrait audio enregistré: {path} ({len(samples) / self.sample_rate:.1f}s)")
+            self._prune_clips()
+        except OSError as e:
+            logging.error(f"Impossible d'écrire l'extrait {path}: {e}")
+
+    def _prune_clips(self):
+        """Supprime les extraits les plus anciens de la source au-delà de max_clips"""
+        prefix = f"{self.name}_"
+        clips = sorted(
+            name for name in os.listdir(self.clips_directory)
+            # Le nom de la source est suivi de la date : exclut les sources de même préfixe
+            if name.startswith(prefix) and name[len(prefix):][:1].isdigit() and name.endswith('.wav')
+        )
+        for name in clips[:max(0, len(clips) - self.max_clips)]:
+            try:
+                os.remove(os.path.join(self.clips_directory, name))
+            except OSError:
+                pass
+
+    def close(self):
+        """Écrit les extraits en attente avec les données disponibles et libère le fichier mappé"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for end_index, start_index, path in pending:
+            _get_clip_writer().submit(self._write_wav, path, self.read(start_index, end_index))
+        self.data.flush()
@@ -1,14 +1,110 @@
 import numpy as np
 import collections
 import threading
-from mediapipe.tasks import python
-from mediapipe.tasks.python import audio
-from mediapipe.tasks.python.components import containers
 import time
 import logging
+import os
+
+from model_cache import get_model_buffer, log_milestone
+from multichannel import ChannelMixer, split_channels
+from metrics import SAMPLES, INFERENCE_LATENCY, DETECTIONS, LABELS
+from hot_log import DEBUG, hot_log
+
+# MediaPipe, scipy et le runtime TFLite sont importés à la première utilisation :
+# seuls les backends réellement configurés sont chargés au démarrage
+
+
+class RateController:
+    """
+    Niveau de délestage partagé par tous les détecteurs.
+
+    Chaque source rapporte le retard de ses résultats de classification sur le
+    temps réel. Le backend d'inférence étant partagé, un retard qui se creuse
+    sur une source signale une machine saturée : le niveau de délestage monte
+    (au plus une fois par intervalle) tant que le retard maximal dépasse
+    lag_high, et redescend sous lag_low.
+    """
+
+    def __init__(self, lag_high=0.5, lag_low=0.2, max_level=3, interval=1.0, smoothing=0.2):
+        """
+        Initialise le contrôleur.
+
+        Args:
+            lag_high (float): Retard (s) au-delà duquel le délestage augmente
+            lag_low (float): Retard (s) en deçà duquel le délestage diminue
+            max_level (int): Niveau de délestage maximal
+            interval (float): Intervalle minimal (s) entre deux changements de niveau
+            smoothing (float): Coefficient de lissage exponentiel du retard
+        """
+        self.lag_high = lag_high
+        self.lag_low = lag_low
+        self.max_level = max_level
+        self.interval = interval
+        self.smoothing = smoothing
+        self.lags = {}  # source_id -> retard lissé (s)
+        self.level = 0
+        self._next_update = 0.0
+        self._lock = threading.Lock()
+
+    def report(self, source_id, lag):
+        """
+        Enregistre le retard d'un résultat et ajuste le niveau de délestage.
+
+        Returns:
+            float: Retard lissé de la source
+        """
+        with self._lock:
+            previous = self.lags.get(source_id)
+            smoothed = lag if previous is None else previous + self.smoothing * (lag - previous)
+            self.lags[source_id] = smoothed
+
+            now = time.monotonic()
+            if now >= self._next_update:
+                worst = max(self.lags.values())
+                level = self.level
+                if worst > self.lag_high:
+                    level = min(level + 1, self.max_level)
+                elif worst < self.lag_low:
+                    level = max(level - 1, 0)
+                if level != self.level:
+                    logging.warning(
+                        f"Délestage de l'inférence: niveau {self.level} -> {level} "
+                        f"(retard max {worst:.2f}s)"
+                    )
+                    self.level = level
+                    self._next_update = now + self.interval
+            return smoothed
+
+    def forget(self, source_id):
+        """Oublie le retard d'une source retirée"""
+        with self._lock:
+            self.lags.pop(source_id, None)
+
+
+# Contrôleur partagé : les détecteurs se partagent le même backend d'inférence
+rate_controller = RateController()
+
+# Classes YAMNet comptées dans le score de clap, et classe soustraite (souvent confondue)
+CLAP_CLASSES = ("Hands", "Clapping", "Cap gun")
+SNAP_CLASS = "Finger snapping"
+
+
+def clap_score(categories):
+    """Score de clap d'une fenêtre : somme des classes de clap moins celle du claquement de doigts"""
+    score = 0.0
+    for category in categories:
+        if category.category_name in CLAP_CLASSES:
+            score += category.score
+        elif category.category_name == SNAP_CLASS:
+            score -= category.score
+    return score
+
 
 class AudioDetector:
-    def __init__(self, model_path, sample_rate, buffer_duration=1.0):
+    def __init__(self, model_path, sample_rate, buffer_duration=1.0, overlapping_factor=0.5, inference_workers=0,
+                 inference_backend='mediapipe', inference_threads=None, score_threshold=0.3, detection_delay=1.0,
+                 archive_duration=0.0, clip_before=2.0, clip_after=2.0, max_clips=100, scheduler_settings=None,
+                 custom_sounds=None, custom_sound_callback=None, streaming_frontend=True, adaptive_threshold=None):
         self.model_path = model_path
         self.sample_rate = sample_rate
         self.buffer_size = int(buffer_duration * sample_rate)
@@ -18,15 +114,113 @@ class AudioDetector:
         self.classifier = None
         self.running = False
         self.lock = threading.Lock()
+        self.score_threshold = score_threshold  # Score de clap minimal pour une détection
+        self.detection_delay = detection_delay  # Délai minimal (s) entre deux détections d'une source
         self.last_detection_time = {}  # Dict pour stocker le dernier temps de détection par source
         self.last_timestamp_ms = {}  # Dict pour stocker le dernier timestamp par source
         self.start_time_ms = None
         self.current_source_id = None  # Pour suivre la source actuelle dans le callback
+        # Horloge d'échantillons : chaque bloc envoyé au classificateur est associé
+        # à l'index de son dernier échantillon pour retrouver l'instant réel du clap
+        self.history_size = int(2.0 * sample_rate)  # Historique conservé pour la recherche d'onset
+        self.onset_window = 0.975  # Durée analysée (s) pour la recherche d'onset, soit une fenêtre YAMNet
+        self.clock_resync_threshold = 0.25  # Écart (s) au-delà duquel l'ancre temporelle est recalée
+        self.block_size = 1600  # Taille des blocs envoyés au classificateur (100 ms à 16 kHz)
+        self.pending_blocks = collections.OrderedDict()  # timestamp_ms de début de bloc -> (source_id, index de fin de bloc)
+        self.max_pending_blocks = 64
+        self._signal_processor = None
+        self.containers = None  # Module mediapipe containers, chargé par initialize()
+        # Mode fenêtré (workers multi-processus ou backend TFLite) : fenêtres YAMNet
+        # complètes avec recouvrement, envoyées à un backend partagé
+        self.inference_backend = inference_backend
+        self.inference_workers = inference_workers
+        self.inference_threads = inference_threads
+        self.streaming_frontend = streaming_frontend  # Backend tflite : log-mel calculé par source avec cache de trames
+        self.windowed = inference_backend == 'tflite' or inference_workers > 0
+        self.pool = None
+        self.window_size = int(0.975 * sample_rate)
+        # Pas aligné sur les trames log-mel de 10 ms : les fenêtres successives partagent leurs trames
+        self.frame_hop = max(1, int(0.010 * sample_rate))
+        hop_size = int(self.window_size * (1 - overlapping_factor))
+        self.hop_size = max(self.frame_hop, round(hop_size / self.frame_hop) * self.frame_hop)
+        # Contrôle de débit : fenêtres plus espacées et fenêtres calmes ignorées quand l'inférence prend du retard
+        self.rate_controller = rate_controller
+        self.quiet_level = 0.01  # Amplitude crête en deçà de laquelle une fenêtre est considérée calme
+        # Ordonnanceur WFQ entre sources (mode fenêtré, None = envoi direct au backend)
+        self.scheduler_settings = scheduler_settings
+        self.scheduler = None
+        self.onset_ratio = 8.0  # Crête / RMS de fond au-delà de laquelle une fenêtre marque une attaque
+        self.channel_routes = {}  # source_id -> {'mode', 'channels', 'mixer', 'callbacks'} des sources multi-canal
+        self.level_callbacks = {}  # source_id -> callback recevant chaque bloc reçu (capteur de niveau sonore)
+        # Archive glissante sur disque (0 = désactivée) et extrait WAV enregistré à chaque détection
+        self.archive_duration = archive_duration
+        self.clip_before = clip_before
+        self.clip_after = clip_after
+        self.max_clips = max_clips
+        # Sons personnalisés (backend tflite) : {'path', 'threshold'}, None = désactivés
+        self.custom_sounds = custom_sounds
+        self.custom_sound_callback = custom_sound_callback
+        self.last_custom_time = {}  # (source_id, son) -> heure de la dernière détection
+        # Seuils propres à chaque source, déduits de son bruit de fond (None = seuil global pour toutes)
+        self.adaptive = None
+        if adaptive_threshold is not None:
+            from adaptive_threshold import get_adaptive_thresholds
+            self.adaptive = get_adaptive_thresholds(default_threshold=score_threshold, **adaptive_threshold)
 
     def initialize(self, max_results=5, score_threshold=0.3):
         """Initialise le classificateur audio"""
         try:
-            base_options = python.BaseOptions(model_asset_path=self.model_path)
+            if self.inference_backend == 'tflite':
+                # Interpréteur TFLite direct, fenêtres de toutes les sources regroupées en batch
+                from tflite_backend import get_tflite_backend
+                custom_index = None
+                if self.custom_sounds:
+                    from custom_sounds import EmbeddingIndex
+                    custom_index = EmbeddingIndex(**self.custom_sounds)
+                self.pool = get_tflite_backend(
+                    self.model_path,
+                    num_threads=self.inference_threads,
+                    max_results=max_results,
+                    score_threshold=score_threshold,
+                    custom_index=custom_index,
+                    streaming_frontend=self.streaming_frontend
+                )
+            elif self.inference_workers > 0:
+                # Classification déportée dans le pool de processus partagé
+                from inference_pool import get_inference_pool
+                self.pool = get_inference_pool(
+                    self.model_path,
+                    self.inference_workers,
+                    max_results=max_results,
+                    score_threshold=score_threshold
+                )
+
+            if self.custom_sounds and self.inference_backend != 'tflite':
+                logging.warning("Les sons personnalisés nécessitent le backend d'inférence tflite")
+
+            if self.pool and self.scheduler_settings is not None:
+                # Les fenêtres passent par l'ordonnanceur, qui décide de leur ordre d'envoi au backend
+                from scheduler import get_inference_scheduler
+                self.scheduler = get_inference_scheduler(self.pool, **self.scheduler_settings)
+                self.pool = self.scheduler
+
+            if self.pool:
+                for source_id in self.sources:
+                    self.pool.register(source_id, self._handle_pool_result)
+                self.running = True
+                logging.info(
+                    f"Classification fenêtrée via le backend {self.inference_backend} "
+                    f"(modèle: {os.path.basename(self.model_path)}, workers: {self.inference_workers}, "
+                    f"fenêtre: {self.window_size}, pas: {self.hop_size} échantillons)"
+                )
+                return
+
+            from mediapipe.tasks import python
+            from mediapipe.tasks.python import audio
+            from mediapipe.tasks.python.components import containers
+            self.containers = containers
+
+            base_options = python.BaseOptions(model_asset_buffer=get_model_buffer(self.model_path))
             
             # Créer un seul classificateur en mode stream
             options = audio.AudioClassifierOptions(
@@ -38,7 +232,10 @@ class AudioDetector:
             )
             self.classifier = audio.AudioClassifier.create_from_options(options)
             self.running = True
-            logging.info(f"Classificateur audio initialisé avec succès (sample_rate: {self.sample_rate}Hz)")
+            logging.info(
+                f"Classificateur audio initialisé avec succès (modèle: {os.path.basename(self.model_path)}, "
+                f"sample_rate: {self.sample_rate}Hz)"
+            )
             logging.info(f"Options du classificateur: max_results={max_results}, score_threshold={score_threshold}")
         except Exception as e:
             logging.error(f"Erreur lors de l'initialisation du classificateur: {str(e)}")
@@ -46,8 +243,36 @@ class AudioDetector:
             logging.error(traceback.format_exc())
             raise
         
-    def add_source(self, source_id, detection_callback=None, labels_callback=None):
-        """Ajoute une nouvelle source audio avec ses callbacks"""
+    def add_source(self, source_id, detection_callback=None, labels_callback=None, channel_mode='mono',
+                   level_callback=None):
+        """
+        Ajoute une nouvelle source audio avec ses callbacks.
+
+        Args:
+            source_id (str): Identifiant de la source
+            detection_callback (callable, optional): Appelé à chaque détection
+            labels_callback (callable, optional): Appelé avec les 3 labels principaux de chaque fenêtre
+            channel_mode (str): Traitement des blocs multi-canal : 'mono', 'per_channel'
+                (une sous-source "<source_id>_ch<k>" par canal), 'beamform' ou 'max_energy'
+            level_callback (callable, optional): Appelé avec chaque bloc reçu, avant mixage des canaux
+        """
+        if level_callback:
+            self.level_callbacks[source_id] = level_callback
+        if channel_mode == 'per_channel' and not self.windowed:
+            # Le classificateur MediaPipe en mode stream ne traite qu'un flux continu :
+            # les canaux ne peuvent pas y être entrelacés
+            logging.warning(
+                "Le mode per_channel nécessite le backend tflite ou des workers d'inférence, "
+                f"utilisation de max_energy pour {source_id}"
+            )
+            channel_mode = 'max_energy'
+        if channel_mode != 'mono':
+            self.channel_routes[source_id] = {
+                'mode': channel_mode,
+                'channels': None,
+                'mixer': None,
+                'callbacks': (detection_callback, labels_callback)
+            }
         with self.lock:
             # Attribuer un ID numérique à la source
             numeric_id = self.next_source_id
@@ -58,69 +283,147 @@ class AudioDetector:
                 'buffer': collections.deque(maxlen=self.buffer_size),
                 'detection_callback': detection_callback,
                 'labels_callback': labels_callback,
-                'numeric_id': numeric_id
+                'numeric_id': numeric_id,
+                'sample_index': 0,  # Nombre total d'échantillons reçus
+                'anchor_time': None,  # Heure murale de l'échantillon 0
+                'history': np.zeros(self.history_size, dtype=np.float32),
+                'next_window_end': self.window_size,  # Index de fin de la prochaine fenêtre (mode fenêtré)
+                'archive': None,
+                'lag': None,  # Retard lissé (s) des résultats sur le temps réel
+                'windows_submitted': 0,
+                'windows_shed': 0,  # Fenêtres non classifiées par délestage
+                'noise_floor': None  # RMS de fond lissé des fenêtres (détection d'attaque)
             }
+            # Une source per_channel ne reçoit pas d'audio : seuls ses canaux sont archivés
+            if self.archive_duration > 0 and channel_mode != 'per_channel':
+                from audio_archive import AudioArchive
+                try:
+                    self.sources[source_id]['archive'] = AudioArchive(
+                        source_id, self.sample_rate, duration=self.archive_duration, max_clips=self.max_clips
+                    )
+                except OSError as e:
+                    logging.error(f"Impossible de créer l'archive audio de {source_id}: {e}")
             self.last_detection_time[source_id] = 0
             self.last_timestamp_ms[source_id] = 0
+            if self.pool:
+                self.pool.register(source_id, self._handle_pool_result)
             logging.info(f"Source audio ajoutée: {source_id} (ID interne: {numeric_id})")
 
     def remove_source(self, source_id):
         """Supprime une source audio"""
+        route = self.channel_routes.pop(source_id, None)
+        self.level_callbacks.pop(source_id, None)
+        if route and route['mode'] == 'per_channel' and route['channels']:
+            for k in range(route['channels']):
+                self.remove_source(f"{source_id}_ch{k}")
         with self.lock:
             if source_id in self.sources:
                 numeric_id = self.sources[source_id]['numeric_id']
+                if self.sources[source_id]['archive']:
+                    self.sources[source_id]['archive'].close()
                 del self.source_ids[source_id]
                 del self.sources[source_id]
                 del self.last_detection_time[source_id]
                 del self.last_timestamp_ms[source_id]
+                self.rate_controller.forget(source_id)
+                if self.pool:
+                    self.pool.unregister(source_id)
                 logging.info(f"Source audio supprimée: {source_id} (ID interne: {numeric_id})")
 
+    def update_settings(self, score_threshold=None, detection_delay=None):
+        """Met à jour le seuil et le délai de détection sans réinitialiser le classificateur"""
+        if score_threshold is not None:
+            self.score_threshold = score_threshold
+            if self.adaptive:
+                self.adaptive.default_threshold = score_threshold
+        if detection_delay is not None:
+            self.detection_delay = detection_delay
+        logging.info(
+            f"Paramètres de détection mis à jour: seuil={self.score_threshold}, délai={self.detection_delay}s"
+        )
+
     def _handle_result(self, result, timestamp):
         """Gère les résultats de classification"""
         try:
-            if not result or not result.classifications or not self.current_source_id:
+            if not result or not result.classifications:
                 return
-                
-            classification = result.classifications[0]
-            source_id = self.current_source_id
-            
-            # Log pour déboguer les résultats bruts
-            logging.debug(f"Résultats bruts pour source {source_id}:")
-            for category in classification.categories:
-                if category.score > 0.1:  # Abaisser le seuil pour voir plus de résultats
-                    logging.debug(f"  - {category.category_name}: {category.score}")
+
+            source_id, end_index = self._locate_window(timestamp)
+            if source_id is None:
+                source_id = self.current_source_id
+            if not source_id or source_id not in self.sources:
+                return
+
+            self._process_categories(source_id, end_index, result.classifications[0].categories)
+        except Exception as e:
+            logging.error(f"Erreur dans le traitement du résultat: {str(e)}")
+            import traceback
+            logging.error(traceback.format_exc())
+
+    def _handle_pool_result(self, source_id, end_index, categories):
+        """Gère les résultats renvoyés par le pool d'inférence (tag = index de fin de fenêtre)"""
+        if source_id in self.sources:
+            self._process_categories(source_id, end_index, categories)
+
+    def _process_categories(self, source_id, end_index, categories):
+        """
+        Calcule le score de clap d'une fenêtre classifiée et déclenche les callbacks.
+
+        Args:
+            source_id (str): Identifiant de la source
+            end_index (int): Index du dernier échantillon de la fenêtre, ou None
+            categories (list): Catégories (category_name, score) renvoyées par le modèle
+        """
+        try:
+            log_milestone("premier résultat de classification")
+
+            # Retard du résultat : heure actuelle moins l'heure de capture de la fin de la fenêtre
+            source = self.sources[source_id]
+            if end_index is not None and source['anchor_time'] is not None:
+                lag = time.time() - (source['anchor_time'] + end_index / self.sample_rate)
+                source['lag'] = self.rate_controller.report(source_id, lag)
+                INFERENCE_LATENCY.labels(source_id).observe(lag)
+
+            # Log pour déboguer les résultats bruts (formaté seulement en DEBUG)
+            if hot_log.enabled(DEBUG):
+                hot_log.debug(
+                    (source_id, 'raw'), "Résultats bruts pour source %s: %s", source_id,
+                    ', '.join(f"{c.category_name}: {c.score:.3f}" for c in categories if c.score > 0.1)
+                )
             
             # Calculer le score pour la détection de clap
-            score_sum = sum(
-                category.score
-                for category in classification.categories
-                if category.category_name in ["Hands", "Clapping", "Cap gun"]
-            )
-            score_sum -= sum(
-                category.score
-                for category in classification.categories
-                if category.category_name == "Finger snapping"
-            )
+            score_sum = clap_score(categories)
             
             # Log du score calculé
-            if score_sum > 0.1:  # Abaisser le seuil pour le debug
-                logging.debug(f"Score de clap calculé pour source {source_id}: {score_sum}")
+            if score_sum > 0.1:
+                hot_log.debug((source_id, 'score'), "Score de clap calculé pour source %s: %.3f", source_id, score_sum)
+
+            # Seuil de la source : global, ou déduit de son fond sonore
+            threshold = self.score_threshold
+            loud_enough = True
+            if self.adaptive:
+                threshold, loud_enough = self._adaptive_level(source_id, source, end_index, score_sum)
+
+            # Clap probablement en cours : priorité à la source pour les fenêtres suivantes
+            if self.scheduler and score_sum > threshold / 2:
+                self.scheduler.boost(source_id)
             
             # Préparer les labels pour le callback
             top3_labels = sorted(
-                classification.categories,
+                categories,
                 key=lambda x: x.score,
                 reverse=True
             )[:3]
             labels_data = [
                 {"label": label.category_name, "score": float(label.score)}
                 for label in top3_labels
-                if label.score > 0.5
             ]
             
-            # Log pour déboguer les labels
-            logging.debug(f"Labels détectés pour source {source_id}: {labels_data}")
-            
+            for label in labels_data:
+                if label['score'] > 0.5:
+                    hot_log.debug((source_id, 'labels'), "Label détecté pour source %s: %s", source_id, label)
+                    LABELS.labels(source_id, label['label']).inc()
+
             # Envoyer les labels si un callback est défini
             if self.sources[source_id]['labels_callback'] and labels_data:
                 try:
@@ -128,15 +431,30 @@ class AudioDetector:
                 except Exception as e:
                     logging.error(f"Erreur dans le callback des labels pour source {source_id}: {str(e)}")
             
+            if self.custom_sound_callback:
+                self._process_custom_sounds(source_id, end_index, categories)
+
             # Vérifier si on a détecté un clap
             current_time = time.time()
-            if score_sum > 0.3 and (current_time - self.last_detection_time.get(source_id, 0)) > 1.0:
+            if (score_sum > threshold and loud_enough
+                    and (current_time - self.last_detection_time.get(source_id, 0)) > self.detection_delay):
+                DETECTIONS.labels(source_id).inc()
                 if self.sources[source_id]['detection_callback']:
+                    onset_index, onset_time = self.find_onset(source_id, end_index)
+                    timestamp = onset_time if onset_time is not None else current_time
+                    clip = None
+                    archive = self.sources[source_id]['archive']
+                    if archive:
+                        center = onset_index if onset_index is not None else (end_index or self.sources[source_id]['sample_index'])
+                        clip = archive.request_clip(center, self.clip_before, self.clip_after, timestamp)
                     try:
                         self.sources[source_id]['detection_callback']({
-                            'timestamp': current_time,
+                            'timestamp': timestamp,
+                            'detected_at': current_time,
+                            'onset_sample': onset_index,
                             'score': float(score_sum),
-                            'source_id': source_id
+                            'source_id': source_id,
+                            'clip': clip
                         })
                     except Exception as e:
                         logging.error(f"Erreur dans le callback de détection pour source {source_id}: {str(e)}")
@@ -147,8 +465,229 @@ class AudioDetector:
             import traceback
             logging.error(traceback.format_exc())
 
-    def process_audio(self, audio_data, source_id):
-        """Traite les données audio pour une source spécifique"""
+    def _adaptive_level(self, source_id, source, end_index, score):
+        """
+        Seuil adaptatif de la source pour une fenêtre, puis ajout de la fenêtre à ses statistiques.
+
+        Returns:
+            tuple: (seuil de score, True si le RMS de la fenêtre dépasse le minimum de la source)
+        """
+        threshold, min_rms = self.adaptive.trigger_level(source_id)
+        rms = None
+        if end_index is not None and end_index > source['sample_index'] - self.history_size:
+            _, window = self._read_history(source, end_index, self.window_size)
+            if len(window):
+                rms = float(np.sqrt(np.dot(window, window) / len(window)))
+        self.adaptive.update(source_id, score, rms)
+        loud_enough = min_rms is None or rms is None or rms >= min_rms
+        if score > threshold and not loud_enough:
+            hot_log.debug(
+                (source_id, 'quiet'), "Score %.3f ignoré pour %s : RMS %.4f sous le minimum %.4f",
+                score, source_id, rms, min_rms
+            )
+        return threshold, loud_enough
+
+    def _process_custom_sounds(self, source_id, end_index, categories):
+        """Déclenche le callback des sons personnalisés reconnus dans la fenêtre"""
+        from custom_sounds import CUSTOM_PREFIX
+        current_time = time.time()
+        source = self.sources[source_id]
+        for category in categories:
+            if not category.category_name.startswith(CUSTOM_PREFIX):
+                continue
+            sound = category.category_name[len(CUSTOM_PREFIX):]
+            key = (source_id, sound)
+            if current_time - self.last_custom_time.get(key, 0) <= self.detection_delay:
+                continue
+            self.last_custom_time[key] = current_time
+            timestamp = current_time
+            if end_index is not None and source['anchor_time'] is not None:
+                # Début de la fenêtre classifiée
+                timestamp = source['anchor_time'] + (end_index - self.window_size) / self.sample_rate
+            try:
+                self.custom_sound_callback({
+                    'sound': sound,
+                    'score': category.score,
+                    'source_id': source_id,
+                    'timestamp': timestamp,
+                    'detected_at': current_time
+                })
+            except Exception as e:
+                logging.error(f"Erreur dans le callback des sons personnalisés pour source {source_id}: {str(e)}")
+
+    def _locate_window(self, timestamp_ms):
+        """
+        Retrouve la source et l'index du dernier échantillon de la fenêtre classifiée.
+
+        MediaPipe rapporte le timestamp de début de la fenêtre (0.975 s) ; on cherche
+        le bloc soumis qui contient la fin de cette fenêtre.
+
+        Returns:
+            tuple: (source_id, index de fin de fenêtre), (None, None) si introuvable
+        """
+        window_end_ms = timestamp_ms + int(self.onset_window * 1000)
+        block_ms = 1000 * self.block_size / self.sample_rate
+        found = (None, None)
+        with self.lock:
+            # Les blocs terminés avant le début de la fenêtre ne serviront plus
+            while self.pending_blocks:
+                ts = next(iter(self.pending_blocks))
+                if ts + block_ms > timestamp_ms:
+                    break
+                del self.pending_blocks[ts]
+            for ts, (source_id, end_index) in self.pending_blocks.items():
+                if ts > window_end_ms:
+                    break
+                overshoot = ts + block_ms - window_end_ms
+                found = (source_id, end_index - max(0, int(overshoot * self.sample_rate / 1000)))
+        return found
+
+    def _update_clock(self, source, n_samples, capture_time):
+        """
+        Met à jour l'ancre temporelle (heure murale de l'échantillon 0) d'une source.
+
+        Args:
+            source (dict): État de la source
+            n_samples (int): Nombre d'échantillons du bloc reçu
+            capture_time (float): Heure murale du premier échantillon du bloc, ou None
+                pour l'estimer à partir de l'heure d'arrivée
+        """
+        if capture_time is None:
+            capture_time = time.time() - n_samples / self.sample_rate
+
+        anchor = source['anchor_time']
+        if anchor is None:
+            source['anchor_time'] = capture_time - source['sample_index'] / self.sample_rate
+            return
+
+        expected = anchor + source['sample_index'] / self.sample_rate
+        drift = capture_time - expected
+        if abs(drift) > self.clock_resync_threshold:
+            # Coupure du flux ou dérive trop importante : on recale l'horloge
+            source['anchor_time'] = anchor + drift
+        elif drift < 0:
+            # Le bloc est arrivé plus tôt que prévu : la latence estimée était trop grande
+            source['anchor_time'] = anchor + drift
+
+    def _write_history(self, source, audio_data):
+        """Copie le bloc dans l'historique circulaire de la source, indexé par numéro d'échantillon"""
+        history = source['history']
+        n = len(audio_data)
+        if n >= self.history_size:
+            audio_data = audio_data[-self.history_size:]
+            start = source['sample_index'] + n - self.history_size
+            n = self.history_size
+        else:
+            start = source['sample_index']
+        pos = start % self.history_size
+        first = min(n, self.history_size - pos)
+        history[pos:pos + first] = audio_data[:first]
+        if first < n:
+            history[:n - first] = audio_data[first:]
+
+    def _read_history(self, source, end_index, n_samples):
+        """Lit les n_samples échantillons de l'historique se terminant à end_index"""
+        n_samples = min(n_samples, self.history_size, end_index)
+        oldest = source['sample_index'] - self.history_size
+        start = max(end_index - n_samples, oldest, 0)
+        idx = np.arange(start, end_index) % self.history_size
+        return start, source['history'][idx]
+
+    def find_onset(self, source_id, end_index=None):
+        """
+        Recherche l'instant d'attaque du clap dans la fenêtre ayant déclenché la détection.
+
+        Args:
+            source_id (str): Identifiant de la source
+            end_index (int): Index du dernier échantillon de la fenêtre, ou None
+                pour utiliser les derniers échantillons reçus
+
+        Returns:
+            tuple: (index de l'échantillon d'attaque, heure murale correspondante),
+                (None, None) si aucun pic n'est trouvé
+        """
+        try:
+            source = self.sources.get(source_id)
+            if source is None or source['anchor_time'] is None:
+                return None, None
+            if end_index is None:
+                end_index = source['sample_index']
+
+            start, window = self._read_history(source, end_index, int(self.onset_window * self.sample_rate))
+            envelope = np.abs(window)
+            if len(envelope) == 0 or envelope.max() <= 0:
+                return None, None
+
+            if self._signal_processor is None:
+                from vban_signal_processor import VBANSignalProcessor
+                self._signal_processor = VBANSignalProcessor(sample_rate=self.sample_rate)
+            peaks, _ = self._signal_processor.detect_peaks(window, height=0.5, prominence=0.3)
+            if len(peaks) == 0:
+                return None, None
+
+            # Le pic d'amplitude suit l'attaque de quelques millisecondes : on remonte
+            # jusqu'au premier échantillon dépassant 10% du pic
+            peak = int(peaks[0])
+            search_start = max(0, peak - int(0.01 * self.sample_rate))
+            above = np.nonzero(envelope[search_start:peak + 1] >= 0.1 * envelope[peak])[0]
+            onset = search_start + int(above[0]) if len(above) else peak
+
+            onset_index = start + onset
+            return onset_index, source['anchor_time'] + onset_index / self.sample_rate
+        except Exception as e:
+            logging.error(f"Erreur lors de la recherche d'onset pour source {source_id}: {str(e)}")
+            return None, None
+
+    def _route_channels(self, source_id, route, channels):
+        """Crée les sous-sources ou le mixeur d'une source multi-canal selon son nombre de canaux"""
+        if route['mode'] == 'per_channel':
+            if channels <= (route['channels'] or 0):
+                return
+            detection_callback, labels_callback = route['callbacks']
+            for k in range(route['channels'] or 0, channels):
+                self.add_source(f"{source_id}_ch{k}", detection_callback, labels_callback)
+        elif route['channels'] == channels:
+            return
+        else:
+            route['mixer'] = ChannelMixer(channels, route['mode'], self.sample_rate)
+        route['channels'] = channels
+        logging.info(f"Source {source_id}: {channels} canaux, mode {route['mode']}")
+
+    def process_audio(self, audio_data, source_id, capture_time=None):
+        """
+        Traite les données audio pour une source spécifique
+
+        Args:
+            audio_data (numpy.ndarray): Bloc audio mono, ou multi-canal [n_échantillons, n_canaux]
+            source_id (str): Identifiant de la source
+            capture_time (float, optional): Heure murale du premier échantillon du bloc
+        """
+        SAMPLES.labels(source_id).inc(len(audio_data))
+        level_callback = self.level_callbacks.get(source_id)
+        if level_callback:
+            try:
+                level_callback(audio_data)
+            except Exception as e:
+                hot_log.log(logging.ERROR, (source_id, 'level'), "Erreur dans le callback de niveau pour %s: %s",
+                            source_id, e)
+        if audio_data.ndim == 2:
+            channels = audio_data.shape[1]
+            route = self.channel_routes.get(source_id)
+            if route is None or channels == 1:
+                # Mode mono : mixage immédiat
+                audio_data = audio_data[:, 0] if channels == 1 else audio_data.mean(axis=1)
+            else:
+                self._route_channels(source_id, route, channels)
+                if route['mixer'] is None:
+                    # Une détection par canal, à partir d'un tableau par canal contigu
+                    for k, channel in enumerate(split_channels(audio_data)):
+                        self._process_block(channel, f"{source_id}_ch{k}", capture_time)
+                    return
+                audio_data = route['mixer'].mix(audio_data)
+        self._process_block(audio_data, source_id, capture_time)
+
+    def _process_block(self, audio_data, source_id, capture_time=None):
+        """Traite un bloc mono d'une source (ou d'un canal)"""
         try:
             if source_id not in self.sources:
                 logging.warning(f"Source inconnue: {source_id}")
@@ -171,12 +710,25 @@ class AudioDetector:
             if audio_data.dtype != np.float32:
                 audio_data = audio_data.astype(np.float32)
 
+            # Horodatage à l'échantillon près
+            source = self.sources[source_id]
+            self._update_clock(source, len(audio_data), capture_time)
+            self._write_history(source, audio_data)
+            if source['archive']:
+                source['archive'].write(audio_data)
+            source['sample_index'] += len(audio_data)
+
             # Ajouter les nouvelles données au buffer de la source
-            self.sources[source_id]['buffer'].extend(audio_data)
+            source['buffer'].extend(audio_data)
             
+            # Mode fenêtré : envoyer les fenêtres complètes au backend partagé
+            if self.running and self.pool:
+                self._submit_windows(source_id, source)
+                return
+
             # Traiter avec le classificateur
             if self.running and self.classifier and self.start_time_ms is not None:
-                block_size = 1600
+                block_size = self.block_size
                 buffer_array = np.array(list(self.sources[source_id]['buffer']))
                 
                 blocks_processed = 0  # Compteur pour le debug
@@ -185,31 +737,47 @@ class AudioDetector:
                     buffer_array = buffer_array[block_size:]
                     blocks_processed += 1
                     
-                    # Vérifier les statistiques du bloc avant classification
-                    block_max = np.max(np.abs(block))
-                    if block_max > 0.1:  # Seulement log les blocs avec du son significatif
-                        logging.debug(f"Classification d'un bloc audio (source {source_id}) - amplitude max: {block_max:.4f}")
+                    # Amplitude du bloc : calculée seulement pour le délestage ou le debug
+                    debug = hot_log.enabled(DEBUG)
+                    shedding = self.rate_controller.level > 0
+                    block_max = np.abs(block).max() if debug or shedding else 0.0
+                    if debug and block_max > 0.1:  # Seulement log les blocs avec du son significatif
+                        hot_log.debug(
+                            (source_id, 'block'), "Classification d'un bloc audio (source %s) - amplitude max: %.4f",
+                            source_id, block_max
+                        )
+
+                    # Machine saturée : les blocs calmes ne sont pas classifiés
+                    if shedding and block_max < self.quiet_level:
+                        source['windows_shed'] += 1
+                        continue
+                    source['windows_submitted'] += 1
                     
-                    audio_data_container = containers.AudioData.create_from_array(
+                    audio_data_container = self.containers.AudioData.create_from_array(
                         block,
                         self.sample_rate
                     )
                     
-                    # Calculer le prochain timestamp
-                    block_duration_ms = int((block_size / self.sample_rate) * 1000)
-                    next_timestamp = max(
-                        self.last_timestamp_ms.get(source_id, 0) + block_duration_ms,
-                        int(time.time() * 1000)
-                    )
+                    # Calculer le timestamp à partir de l'horloge d'échantillons
+                    end_index = source['sample_index'] - len(buffer_array)
+                    start_index = end_index - block_size
+                    capture_ms = int((source['anchor_time'] + start_index / self.sample_rate) * 1000)
+                    next_timestamp = max(capture_ms, self.last_timestamp_ms.get(source_id, 0) + 1)
                     self.last_timestamp_ms[source_id] = next_timestamp
+                    with self.lock:
+                        self.pending_blocks[next_timestamp] = (source_id, end_index)
+                        while len(self.pending_blocks) > self.max_pending_blocks:
+                            self.pending_blocks.popitem(last=False)
                     
                     # Définir la source actuelle pour le callback
                     self.current_source_id = source_id
                     
-                    # Log avant la classification
-                    if block_max > 0.1:
-                        logging.debug(f"Envoi au classificateur - source: {source_id}, timestamp: {next_timestamp}")
-                    
+                    if debug and block_max > 0.1:
+                        hot_log.debug(
+                            (source_id, 'submit'), "Envoi au classificateur - source: %s, timestamp: %d",
+                            source_id, next_timestamp
+                        )
+
                     # Classifier le bloc
                     try:
                         self.classifier.classify_async(audio_data_container, next_timestamp)
@@ -226,8 +794,75 @@ class AudioDetector:
             import traceback
             logging.error(traceback.format_exc())
 
+    def _submit_windows(self, source_id, source):
+        """Envoie au pool chaque fenêtre complète, avec un pas de hop_size échantillons"""
+        # Si la source a pris trop de retard, on saute aux fenêtres encore présentes dans l'historique
+        oldest_end = source['sample_index'] - self.history_size + self.window_size
+        if source['next_window_end'] < oldest_end:
+            # Reprise sur la grille des trames pour conserver le cache du frontend
+            source['next_window_end'] = oldest_end + (self.window_size - oldest_end) % self.frame_hop
+
+        # Délestage : chaque niveau double le pas (recouvrement réduit) jusqu'à une fenêtre entière
+        level = self.rate_controller.level
+        max_hop = self.window_size - self.window_size % self.frame_hop
+        hop_size = min(max_hop, self.hop_size << level) if level else self.hop_size
+        skipped_per_window = hop_size // self.hop_size - 1
+
+        while source['next_window_end'] <= source['sample_index']:
+            end_index = source['next_window_end']
+            source['next_window_end'] += hop_size
+            source['windows_shed'] += skipped_per_window
+            _, window = self._read_history(source, end_index, self.window_size)
+            peak = np.abs(window).max()
+            if self.scheduler:
+                self._detect_onset(source_id, source, window, peak)
+            if level and peak < self.quiet_level:
+                # Fenêtre calme : inutile de la classifier quand la machine est saturée
+                source['windows_shed'] += 1
+                continue
+            source['windows_submitted'] += 1
+            if not self.pool.submit(source_id, window, self.sample_rate, end_index):
+                hot_log.count(source_id, 'fenêtres abandonnées')
+                hot_log.debug((source_id, 'dropped'), "Fenêtre abandonnée pour %s (backend saturé)", source_id)
+
+    def _detect_onset(self, source_id, source, window, peak):
+        """Donne la priorité à la source si la fenêtre contient une attaque nettement au-dessus du fond"""
+        rms = float(np.sqrt(np.dot(window, window) / len(window)))
+        floor = source['noise_floor']
+        if floor is None:
+            source['noise_floor'] = rms
+            return
+        if peak >= self.quiet_level and peak > self.onset_ratio * max(floor, 1e-4):
+            self.scheduler.boost(source_id)
+        # Le fond suit lentement le niveau RMS pour ne pas absorber les attaques
+        source['noise_floor'] = floor + 0.05 * (rms - floor)
+
+    def get_metrics(self):
+        """
+        Retourne les indicateurs de contrôle de débit de chaque source.
+
+        Returns:
+            dict: source_id -> {'lag', 'windows_submitted', 'windows_shed', 'shed_level'}
+        """
+        return {
+            source_id: {
+                'lag': source['lag'],
+                'windows_submitted': source['windows_submitted'],
+                'windows_shed': source['windows_shed'],
+                'shed_level': self.rate_controller.level
+            }
+            for source_id, source in list(self.sources.items())
+        }
+
     def start(self):
         """Démarre la détection"""
+        if self.windowed:
+            if not self.pool:
+                self.initialize()
+            self.start_time_ms = int(time.time() * 1000)
+            self.running = True
+            return True
+
         if not self.classifier:
             self.initialize()
         
@@ -241,7 +876,7 @@ class AudioDetector:
             try:
                 # Créer un conteneur audio vide pour démarrer le stream
                 empty_data = np.zeros(1600, dtype=np.float32)
-                audio_data = containers.AudioData.create_from_array(
+                audio_data = self.containers.AudioData.create_from_array(
                     empty_data,
                     self.sample_rate
                 )
@@ -259,6 +894,16 @@ class AudioDetector:
     def stop(self):
         """Arrête le classificateur"""
         self.running = False
+        for source in list(self.sources.values()):
+            if source['archive']:
+                source['archive'].close()
+                source['archive'] = None
+        if self.pool:
+            # Le pool est partagé entre détecteurs : on se contente de retirer nos sources
+            for source_id in list(self.sources):
+                self.pool.unregister(source_id)
+            self.pool = None
+            self.scheduler = None
         if self.classifier:
             try:
                 self.classifier.close()
@@ -0,0 +1,328 @@
+"""
+Outils de mesure de performance de ClapTrap.
+
+Usage :
+    python benchmark.py backends [--windows 100] [--threads 1 2 4] [--batch 1 8]
+    python benchmark.py frontend [--seconds 60] [--overlap 0.5 0.8]
+    python benchmark.py models yamnet.tflite yamnet_int8.tflite [--dataset claps/] [--threshold 0.5]
+    python benchmark.py ring [--blocks 20000] [--block-size 160 1600]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+WINDOW_SIZE = 15600  # 0.975 s à 16 kHz
+SAMPLE_RATE = 16000
+
+
+def _random_windows(n, seed=0):
+    """Génère n fenêtres de bruit blanc faible"""
+    rng = np.random.default_rng(seed)
+    return [(0.05 * rng.standard_normal(WINDOW_SIZE)).astype(np.float32) for _ in range(n)]
+
+
+def _report(name, latencies_ms, n_windows, elapsed):
+    """Affiche latence moyenne/p95 par fenêtre et débit"""
+    latencies_ms = np.asarray(latencies_ms)
+    print(
+        f"{name:<32} {latencies_ms.mean():8.2f} ms/fenêtre  "
+        f"p95 {np.percentile(latencies_ms, 95):8.2f} ms  "
+        f"{n_windows / elapsed:8.1f} fenêtres/s"
+    )
+
+
+def bench_mediapipe(model_path, windows):
+    """Mesure le chemin MediaPipe AudioClassifier (une fenêtre par appel)"""
+    from mediapipe.tasks import python
+    from mediapipe.tasks.python import audio
+    from mediapipe.tasks.python.components import containers
+
+    options = audio.AudioClassifierOptions(
+        base_options=python.BaseOptions(model_asset_path=model_path),
+        running_mode=audio.RunningMode.AUDIO_CLIPS,
+        max_results=5
+    )
+    classifier = audio.AudioClassifier.create_from_options(options)
+    try:
+        classifier.classify(containers.AudioData.create_from_array(windows[0], SAMPLE_RATE))  # Préchauffage
+        latencies = []
+        start = time.perf_counter()
+        for window in windows:
+            t0 = time.perf_counter()
+            classifier.classify(containers.AudioData.create_from_array(window, SAMPLE_RATE))
+            latencies.append((time.perf_counter() - t0) * 1000)
+        _report("mediapipe", latencies, len(windows), time.perf_counter() - start)
+    finally:
+        classifier.close()
+
+
+def bench_tflite(model_path, windows, num_threads, batch):
+    """Mesure l'interpréteur TFLite direct, par batch de fenêtres"""
+    from tflite_backend import TFLiteClassifier
+
+    classifier = TFLiteClassifier(model_path, num_threads=num_threads)
+    classifier.classify_batch([classifier.prepare(windows[0], SAMPLE_RATE)])  # Préchauffage
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(windows), batch):
+        chunk = windows[i:i + batch]
+        t0 = time.perf_counter()
+        classifier.classify_batch([classifier.prepare(window, SAMPLE_RATE) for window in chunk])
+        latencies.extend([(time.perf_counter() - t0) * 1000 / len(chunk)] * len(chunk))
+    _report(f"tflite threads={num_threads} batch={batch}", latencies, len(windows), time.perf_counter() - start)
+
+
+def bench_frontend(model_path, seconds, overlaps):
+    """Compare le frontend log-mel intégré au modèle et le frontend par source avec cache de trames"""
+    from tflite_backend import TFLiteClassifier
+
+    rng = np.random.default_rng(0)
+    stream = (0.05 * rng.standard_normal(int(seconds * SAMPLE_RATE))).astype(np.float32)
+    for streaming in (False, True):
+        classifier = TFLiteClassifier(model_path, num_threads=1, streaming_frontend=streaming)
+        name = "cache" if classifier.frontend_constants is not None else "modèle"
+        for overlap in overlaps:
+            hop = max(160, round(WINDOW_SIZE * (1 - overlap) / 160) * 160)
+            ends = range(WINDOW_SIZE, len(stream) + 1, hop)
+            classifier.forget('bench')
+            latencies = []
+            start = time.perf_counter()
+            for end in ends:
+                t0 = time.perf_counter()
+                window = classifier.prepare(stream[end - WINDOW_SIZE:end], SAMPLE_RATE, 'bench', end)
+                classifier.classify_batch([window])
+                latencies.append((time.perf_counter() - t0) * 1000)
+            _report(f"frontend {name} recouvrement={overlap}", latencies, len(ends), time.perf_counter() - start)
+
+
+def _load_dataset(path):
+    """
+    Charge un jeu de test étiqueté : les WAV du sous-dossier clap/ sont les positifs,
+    ceux des autres sous-dossiers les négatifs.
+
+    Returns:
+        list: (nom du fichier, audio mono, taux d'échantillonnage, est un clap)
+    """
+    from custom_sounds import load_wav
+
+    clips = []
+    for label in sorted(os.listdir(path)):
+        folder = os.path.join(path, label)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith('.wav'):
+                audio, sample_rate = load_wav(os.path.join(folder, name))
+                clips.append((f"{label}/{name}", audio, sample_rate, label == 'clap'))
+    return clips
+
+
+def _rss_mb():
+    """Mémoire résidente actuelle et maximale du processus (Mo)"""
+    with open('/proc/self/statm') as f:
+        resident = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    resident /= 2 ** 20
+    return resident, max(resident, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+
+def _bench_model(model_path, windows, num_threads, dataset, threshold, hop):
+    """Mesure un modèle dans un processus dédié : latence, mémoire et précision/rappel des claps"""
+    from audio_detector import clap_score
+    from tflite_backend import TFLiteClassifier
+
+    classifier = TFLiteClassifier(model_path, num_threads=num_threads, max_results=10, score_threshold=0.0)
+    classifier.classify_batch([classifier.prepare(windows[0], SAMPLE_RATE)])  # Préchauffage
+    latencies = []
+    for window in windows:
+        t0 = time.perf_counter()
+        classifier.classify_batch([classifier.prepare(window, SAMPLE_RATE)])
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    counts = None
+    if dataset:
+        counts = {'tp': 0, 'fp': 0, 'fn': 0, 'tn': 0}
+        for _, audio, sample_rate, positive in _load_dataset(dataset):
+            size = int(WINDOW_SIZE * sample_rate / SAMPLE_RATE)
+            step = max(1, int(hop * sample_rate))
+            ends = range(size, len(audio) + 1, step) if len(audio) > size else [len(audio)]
+            # Un clip est détecté si l'une de ses fenêtres atteint le seuil
+            best = max(
+                clap_score(classifier.classify_batch([classifier.prepare(audio[max(0, end - size):end], sample_rate)])[0])
+                for end in ends
+            )
+            detected = best >= threshold
+            counts[('t' if detected == positive else 'f') + ('p' if detected else 'n')] += 1
+    rss, peak = _rss_mb()
+    return np.asarray(latencies), rss, peak, counts
+
+
+def bench_models(model_paths, n_windows, num_threads, dataset=None, threshold=0.5, hop=0.25):
+    """Compare des variantes du modèle (float, quantifié en plage dynamique ou int8), chacune dans son processus"""
+    windows = _random_windows(n_windows)
+    print(f"{'modèle':<32} {'ms/fenêtre':>10} {'p95':>8} {'RSS Mo':>8} {'pic Mo':>8} {'précision':>10} {'rappel':>8}")
+    spawn = multiprocessing.get_context('spawn')
+    for model_path in model_paths:
+        # Un processus neuf par modèle pour que la mémoire mesurée ne dépende que de lui
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            try:
+                latencies, rss, peak, counts = executor.submit(
+                    _bench_model, model_path, windows, num_threads, dataset, threshold, hop
+                ).result()
+            except Exception as e:
+                print(f"{os.path.basename(model_path):<32} erreur: {e}")
+                continue
+        precision = recall = '-'
+        if counts:
+            detected = counts['tp'] + counts['fp']
+            positives = counts['tp'] + counts['fn']
+            precision = f"{counts['tp'] / detected:.3f}" if detected else 'n/a'
+            recall = f"{counts['tp'] / positives:.3f}" if positives else 'n/a'
+        print(
+            f"{os.path.basename(model_path):<32} {latencies.mean():10.2f} {np.percentile(latencies, 95):8.2f} "
+            f"{rss:8.1f} {peak:8.1f} {precision:>10} {recall:>8}"
+        )
+
+
+def bench_ring(n_blocks, block_size):
+    """Compare l'écriture/lecture d'un bloc entre CircularAudioBuffer et SPSCAudioRing"""
+    from circular_buffer import CircularAudioBuffer, SPSCAudioRing
+
+    block = (0.05 * np.random.default_rng(0).standard_normal(block_size)).astype(np.float32)
+    capacity = 16 * block_size
+
+    locked = CircularAudioBuffer(capacity)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(n_blocks):
+        t0 = time.perf_counter()
+        locked.write(block)
+        locked.read(block_size)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    _report_ring(f"CircularAudioBuffer bloc={block_size}", latencies, n_blocks, time.perf_counter() - start)
+
+    ring = SPSCAudioRing(capacity)
+    out = np.empty(block_size, dtype=np.float32)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(n_blocks):
+        t0 = time.perf_counter()
+        ring.write(block)
+        ring.read_into(out)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    _report_ring(f"SPSCAudioRing bloc={block_size}", latencies, n_blocks, time.perf_counter() - start)
+
+    # Producteur et consommateur dans deux threads, comme avec le callback sounddevice
+    ring = SPSCAudioRing(capacity)
+    received = [0]
+
+    def consume():
+        while received[0] < n_blocks:
+            if ring.available() >= block_size:
+                ring.read_into(out)
+                received[0] += 1
+            else:
+                time.sleep(0)
+
+    consumer = threading.Thread(target=consume)
+    start = time.perf_counter()
+    consumer.start()
+    written = 0
+    while written < n_blocks:
+        if ring.free() >= block_size:
+            ring.write(block)
+            written += 1
+        else:
+            time.sleep(0)
+    consumer.join()
+    elapsed = time.perf_counter() - start
+    print(f"{'SPSCAudioRing 2 threads':<32} {n_blocks * block_size / elapsed / 1e6:8.2f} M échantillons/s  "
+          f"(overruns: {ring.overruns}, underruns: {ring.underruns})")
+
+
+def _report_ring(name, latencies_us, n_blocks, elapsed):
+    """Affiche la latence moyenne/p99 d'une écriture + lecture"""
+    latencies_us = np.asarray(latencies_us)
+    print(
+        f"{name:<32} {latencies_us.mean():8.2f} µs/bloc  "
+        f"p99 {np.percentile(latencies_us, 99):8.2f} µs  "
+        f"{n_blocks / elapsed:10.0f} blocs/s"
+    )
+
+
+def cmd_ring(args):
+    for block_size in args.block_size:
+        bench_ring(args.blocks, block_size)
+
+
+def cmd_frontend(args):
+    try:
+        bench_frontend(args.model, args.seconds, args.overlap)
+    except RuntimeError as e:
+        print(f"tflite: {e}")
+
+
+def cmd_models(args):
+    bench_models(args.models, args.windows, args.threads, args.dataset, args.threshold, args.hop)
+
+
+def cmd_backends(args):
+    windows = _random_windows(args.windows)
+    print(f"{args.windows} fenêtres de {WINDOW_SIZE} échantillons, modèle {args.model}")
+    try:
+        bench_mediapipe(args.model, windows)
+    except ImportError:
+        print("mediapipe non disponible")
+    for num_threads in args.threads:
+        for batch in args.batch:
+            try:
+                bench_tflite(args.model, windows, num_threads, batch)
+            except RuntimeError as e:
+                print(f"tflite: {e}")
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks ClapTrap")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backends = subparsers.add_parser('backends', help="Compare MediaPipe et l'interpréteur TFLite direct")
+    backends.add_argument('--model', default='yamnet.tflite')
+    backends.add_argument('--windows', type=int, default=100)
+    backends.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4])
+    backends.add_argument('--batch', type=int, nargs='+', default=[1, 8])
+    backends.set_defaults(func=cmd_backends)
+
+    frontend = subparsers.add_parser('frontend', help="Compare le frontend log-mel du modèle et le cache de trames")
+    frontend.add_argument('--model', default='yamnet.tflite')
+    frontend.add_argument('--seconds', type=float, default=60.0)
+    frontend.add_argument('--overlap', type=float, nargs='+', default=[0.5, 0.8])
+    frontend.set_defaults(func=cmd_frontend)
+
+    models = subparsers.add_parser(
+        'models', help="Compare des variantes du modèle : latence, mémoire et précision/rappel des claps"
+    )
+    models.add_argument('models', nargs='+', help="Fichiers .tflite à comparer")
+    models.add_argument('--dataset', help="Dossier de WAV étiquetés : clap/ pour les positifs, autres sous-dossiers négatifs")
+    models.add_argument('--threshold', type=float, default=0.5, help="Score de clap minimal d'une détection")
+    models.add_argument('--hop', type=float, default=0.25, help="Pas (s) entre deux fenêtres d'un clip")
+    models.add_argument('--windows', type=int, default=100)
+    models.add_argument('--threads', type=int, default=1)
+    models.set_defaults(func=cmd_models)
+
+    ring = subparsers.add_parser('ring', help="Compare CircularAudioBuffer et le buffer SPSC sans verrou")
+    ring.add_argument('--blocks', type=int, default=20000)
+    ring.add_argument('--block-size', type=int, nargs='+', default=[160, 1600])
+    ring.set_defaults(func=cmd_ring)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
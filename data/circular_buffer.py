@@ -1,3 +1,4 @@
+import logging
 import numpy as np
 import threading
 
@@ -91,13 +92,13 @@ class CircularAudioBuffer:
                 n_samples = self.buffer_size
                 
             if self.filled == 0:
-                return np.zeros((n_samples, self.channels))
+                return np.zeros((n_samples, self.channels), dtype=np.float32)
                 
             # On ne peut pas lire plus que ce qu'on a écrit
             n_samples = min(n_samples, self.filled)
             
             # Création du buffer de sortie
-            result = np.zeros((n_samples, self.channels))
+            result = np.empty((n_samples, self.channels), dtype=np.float32)
             
             # Calcul de la position de début de lecture
             start_pos = (self.write_pos - n_samples) % self.buffer_size
@@ -129,3 +130,110 @@ class CircularAudioBuffer:
         """
         with self.lock:
             return self.filled / self.buffer_size
+
+
+class SPSCAudioRing:
+    """
+    Buffer circulaire sans verrou pour un seul producteur et un seul consommateur
+    (par exemple le callback temps réel de sounddevice et le thread de détection).
+
+    Les indices d'écriture et de lecture sont des compteurs monotones : chacun n'est
+    modifié que par un seul thread, et seulement après la copie des données, ce qui
+    suffit à publier les échantillons sans verrou. La capacité est arrondie à une
+    puissance de deux pour remplacer le modulo par un masque.
+    """
+
+    def __init__(self, capacity, channels=1):
+        """
+        Initialise le buffer.
+
+        Args:
+            capacity (int): Capacité minimale en nombre d'échantillons (arrondie à une puissance de deux)
+            channels (int): Nombre de canaux audio
+        """
+        self.capacity = 1 << max(0, int(capacity) - 1).bit_length()
+        self.mask = self.capacity - 1
+        self.channels = channels
+        shape = (self.capacity,) if channels == 1 else (self.capacity, channels)
+        self.buffer = np.zeros(shape, dtype=np.float32)
+        self.write_index = 0  # Modifié uniquement par le producteur
+        self.read_index = 0  # Modifié uniquement par le consommateur
+        self.overruns = 0  # Échantillons perdus faute de place (côté producteur)
+        self.underruns = 0  # Lectures servies partiellement faute de données (côté consommateur)
+
+    def available(self):
+        """Nombre d'échantillons prêts à être lus"""
+        return self.write_index - self.read_index
+
+    def free(self):
+        """Nombre d'échantillons pouvant être écrits sans perte"""
+        return self.capacity - (self.write_index - self.read_index)
+
+    def write(self, data):
+        """
+        Copie un bloc dans le buffer (producteur uniquement, sans allocation).
+
+        Si la place manque, la fin du bloc est abandonnée et comptée dans overruns.
+
+        Args:
+            data (numpy.ndarray): Bloc [n] ou [n, channels]
+
+        Returns:
+            int: Nombre d'échantillons écrits
+        """
+        if self.channels == 1 and data.ndim == 2:
+            data = data[:, 0]
+        write_index = self.write_index
+        n = min(len(data), self.capacity - (write_index - self.read_index))
+        if n < len(data):
+            self.overruns += len(data) - n
+        if n <= 0:
+            return 0
+
+        pos = write_index & self.mask
+        first = min(n, self.capacity - pos)
+        self.buffer[pos:pos + first] = data[:first]
+        if first < n:
+            self.buffer[:n - first] = data[first:n]
+        # Publication après la copie : le consommateur ne voit que des échantillons complets
+        self.write_index = write_index + n
+        return n
+
+    def read_into(self, out):
+        """
+        Remplit un tableau float32 fourni par l'appelant (consommateur uniquement, sans allocation).
+
+        Args:
+            out (numpy.ndarray): Tableau de destination [n] ou [n, channels]
+
+        Returns:
+            int: Nombre d'échantillons copiés ; inférieur à len(out) en cas d'underrun
+        """
+        read_index = self.read_index
+        n = min(len(out), self.write_index - read_index)
+        if n < len(out):
+            self.underruns += 1
+        if n <= 0:
+            return 0
+
+        pos = read_index & self.mask
+        first = min(n, self.capacity - pos)
+        out[:first] = self.buffer[pos:pos + first]
+        if first < n:
+            out[first:n] = self.buffer[:n - first]
+        # Libération de la place après la copie : le producteur ne peut pas l'écraser avant
+        self.read_index = read_index + n
+        return n
+
+    def clear(self):
+        """Abandonne les échantillons non lus (consommateur uniquement)"""
+        self.read_index = self.write_index
+
+    def get_buffer_level(self):
+        """
+        Retourne le niveau de remplissage du buffer.
+
+        Returns:
+            float: Pourcentage de remplissage (0.0 à 1.0)
+        """
+        return self.available() / self.capacity
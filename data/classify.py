@@ -1,18 +1,33 @@
 import subprocess
 import time
-import ffmpeg
 import logging
 import numpy as np
-import sounddevice as sd
 import json
 import os
 import sys
 import threading
+import functools
 
 from mqtt_client import MQTTClient
 from vban_manager import get_vban_detector  # Import the get_vban_detector function
 import warnings
 from audio_detector import AudioDetector
+from event_fusion import EventFusion
+from inference_pool import shutdown_inference_pool
+from tflite_backend import resolve_inference_backend, shutdown_tflite_backend
+from scheduler import shutdown_inference_scheduler
+from adaptive_threshold import ADAPTIVE_THRESHOLDS_PATH, shutdown_adaptive_thresholds
+from sound_sensors import get_sound_sensors, shutdown_sound_sensors
+from metrics import registry
+from hot_log import hot_log
+from mic_capture import MicrophoneCapture, parse_latency
+from custom_sounds import CUSTOM_SOUNDS_PATH
+from model_cache import log_phase
+from supervisor import SourceSupervisor
+from ffmpeg_monitor import get_ffmpeg_monitor, shutdown_ffmpeg_monitor
+from async_ingest import AsyncIngestCore
+
+# ffmpeg et sounddevice ne sont importés que si une source RTSP ou micro est active
 
 # Configuration du logging en DEBUG
 logging.basicConfig(
@@ -34,6 +49,10 @@ record = None
 model = "yamnet.tflite"
 output_file = "recorded_audio.wav"
 current_audio_source = None
+supervisor = None  # SourceSupervisor des sources en cours de détection
+detection_config = {}  # Modèle et recouvrement utilisés pour les sources ajoutées à chaud
+active_detectors = set()  # Détecteurs en cours d'exécution, mis à jour lors d'un rechargement
+_detectors_lock = threading.Lock()
 _socketio = None  # Renamed to _socketio to avoid conflict with parameter
 
 def load_settings():
@@ -69,6 +88,8 @@ try:
     DELAY = float(global_settings.get('delay', 2))
     CHUNK_DURATION = float(global_settings.get('chunk_duration', 0.5))
     BUFFER_DURATION = float(global_settings.get('buffer_duration', 1.0))
+    # Traitement des sources multi-canal : mono, per_channel, beamform ou max_energy
+    CHANNEL_MODE = global_settings.get('channel_mode') or 'mono'
     
 except FileNotFoundError:
     logging.warning("Le fichier settings.json n'existe pas, utilisation des valeurs par défaut")
@@ -77,6 +98,7 @@ except FileNotFoundError:
     DELAY = 2.0
     CHUNK_DURATION = 0.5
     BUFFER_DURATION = 1.0
+    CHANNEL_MODE = 'mono'
 except json.JSONDecodeError:
     logging.error("Le fichier settings.json est mal formaté")
     raise
@@ -98,15 +120,130 @@ except Exception as e:
     logging.error(f"Erreur lors du chargement des flux RTSP: {str(e)}")
     fluxes = {}
 
-def log_ffmpeg_output(process):
-    def forward_stderr():
-        for line in iter(process.stderr.readline, b''):
-            sys.stdout.buffer.write(line)
-            sys.stdout.flush()
-    threading.Thread(target=forward_stderr, daemon=True).start()
+# Paramètres d'inférence (backend, workers multi-processus, threads TFLite)
+inference_settings = (SETTINGS or {}).get('inference') or {}
+# Backend effectif : 'tflite' repasse sur 'mediapipe' sans interpréteur TFLite installé (armhf, armv7)
+INFERENCE_BACKEND = resolve_inference_backend(inference_settings.get('backend', 'mediapipe'))
+
+# Mode d'ingestion : un thread par source ('threads') ou boucle asyncio unique ('async')
+ingest_settings = (SETTINGS or {}).get('ingest') or {}
+ingest_core = None  # AsyncIngestCore des sources RTSP et VBAN en mode 'async'
+
+# Archive audio glissante et extraits WAV autour de chaque détection
+archive_settings = (SETTINGS or {}).get('archive') or {}
+
+# Ordonnancement des fenêtres entre sources (poids, bonus des sources actives)
+scheduler_settings = (SETTINGS or {}).get('scheduler') or {}
+
+def get_scheduler_options():
+    """Retourne les paramètres de l'ordonnanceur d'inférence, ou None s'il est désactivé"""
+    if not scheduler_settings.get('enabled', False):
+        return None
+    return {
+        'weights': {
+            entry['source']: float(entry.get('weight', 1.0))
+            for entry in scheduler_settings.get('weights') or []
+            if entry.get('source')
+        },
+        'boost': float(scheduler_settings.get('boost', 4.0)),
+        'boost_duration': float(scheduler_settings.get('boost_duration', 5.0)),
+        'max_queue': int(scheduler_settings.get('max_queue', 4))
+    }
+
+# Sons personnalisés reconnus par leurs embeddings YAMNet (backend tflite)
+custom_sounds_settings = (SETTINGS or {}).get('custom_sounds') or {}
+
+def get_custom_sounds_options():
+    """Retourne les paramètres de l'index des sons personnalisés, ou None s'ils sont désactivés"""
+    if not custom_sounds_settings.get('enabled', False):
+        return None
+    return {
+        'path': custom_sounds_settings.get('index') or CUSTOM_SOUNDS_PATH,
+        'threshold': float(custom_sounds_settings.get('threshold', 0.8))
+    }
+
+# Seuils de détection propres à chaque source, déduits de leur bruit de fond
+adaptive_settings = (SETTINGS or {}).get('adaptive_threshold') or {}
+
+def get_adaptive_threshold_options():
+    """Retourne les paramètres des seuils adaptatifs, ou None s'ils sont désactivés"""
+    if not adaptive_settings.get('enabled', False):
+        return None
+    return {
+        'path': adaptive_settings.get('path') or ADAPTIVE_THRESHOLDS_PATH,
+        'quantile': float(adaptive_settings.get('quantile', 0.99)),
+        'margin': float(adaptive_settings.get('margin', 0.15)),
+        'min_threshold': float(adaptive_settings.get('min_threshold', 0.2)),
+        'max_threshold': float(adaptive_settings.get('max_threshold', 0.95)),
+        'energy_ratio': float(adaptive_settings.get('energy_ratio', 1.5)),
+        'warmup': int(adaptive_settings.get('warmup', 300))
+    }
+
+# Capteurs MQTT de niveau sonore et de son principal de chaque source
+sensor_settings = (SETTINGS or {}).get('sensors') or {}
+
+def get_source_sensors():
+    """Retourne les capteurs de niveau et de son principal, ou None s'ils sont désactivés"""
+    if not sensor_settings.get('enabled', False):
+        return None
+    mqtt_client = MQTTClient()
+    return get_sound_sensors(
+        mqtt_client.publish_sound_level,
+        mqtt_client.publish_top_sound,
+        level_interval=float(sensor_settings.get('level_interval', 1.0)),
+        level_change=float(sensor_settings.get('level_change', 3.0)),
+        label_interval=float(sensor_settings.get('label_interval', 2.0)),
+        max_interval=float(sensor_settings.get('max_interval', 60.0))
+    )
+
+# Fusion des détections d'un même clap captées par plusieurs sources
+fusion_settings = (SETTINGS or {}).get('fusion') or {}
+event_fusion = None
+_fusion_lock = threading.Lock()
+
+def publish_clap_event(event):
+    """Publie un événement clap (éventuellement fusionné) via MQTT"""
+    sources = [s['source_id'] for s in event.get('sources', [])] or [event['source_id']]
+    logging.info(
+        f"CLAP émis pour {event['source_id']} avec score {event['score']} "
+        f"at {event['timestamp']:.3f} (sources: {', '.join(sources)})"
+    )
+    mqtt_client = MQTTClient()
+    mqtt_client.publish_discovery(event['source_id'])
+    mqtt_client.publish_event(event)
+    mqtt_client.publish(f"{mqtt_client.base_topic}/Clapper/state", "ON")
+    time.sleep(0.5)
+    mqtt_client.publish(f"{mqtt_client.base_topic}/Clapper/state", "OFF")
+
+def get_event_fusion():
+    """Retourne l'étage de fusion partagé par toutes les sources, ou None s'il est désactivé"""
+    global event_fusion
+    if not fusion_settings.get('enabled', True):
+        return None
+    with _fusion_lock:
+        if event_fusion is None:
+            event_fusion = EventFusion(
+                publish_clap_event,
+                window=float(fusion_settings.get('window', 0.3)),
+                hold=float(fusion_settings.get('hold', 0.5)),
+                strategy=fusion_settings.get('strategy', 'strongest')
+            )
+            logging.info(
+                f"Fusion des détections activée (fenêtre: {event_fusion.window}s, "
+                f"stratégie: {event_fusion.strategy})"
+            )
+        return event_fusion
+
+def read_audio_from_rtsp(rtsp_url, buffer_size, sampling_rate, source_id=None, channels=1):
+    """
+    Lit un flux RTSP audio en continu sans buffer fichier.
 
-def read_audio_from_rtsp(rtsp_url, buffer_size, sampling_rate):
-    """Lit un flux RTSP audio en continu sans buffer fichier"""
+    Les blocs sont renvoyés sous la forme [n_échantillons, channels] ; avec channels=1
+    ffmpeg mixe les canaux du flux en mono.
+    """
+    import ffmpeg
+
+    process = None
     try:
         # Configuration du processus ffmpeg pour lire le flux RTSP
         process = (
@@ -115,17 +252,18 @@ def read_audio_from_rtsp(rtsp_url, buffer_size, sampling_rate):
             .output('pipe:',
                    format='f32le',  # Format PCM 32-bit float
                    acodec='pcm_f32le',
-                   ac=1,  # Mono
+                   ac=channels,
                    ar=sampling_rate,
                    buffer_size=buffer_size
             )
             .run_async(pipe_stdout=True, pipe_stderr=True)
         )
-        log_ffmpeg_output(process)
+        # La sortie d'erreur est analysée par le moniteur partagé (compteurs, résumés, reconnexions)
+        get_ffmpeg_monitor().watch(source_id or f"rtsp_{rtsp_url}", process)
 
         while True:
             # Lecture des données audio par blocs
-            in_bytes = process.stdout.read(buffer_size * 4)  # 4 bytes par sample float32
+            in_bytes = process.stdout.read(buffer_size * channels * 4)  # 4 bytes par sample float32
             if not in_bytes:
                 break
                 
@@ -133,7 +271,7 @@ def read_audio_from_rtsp(rtsp_url, buffer_size, sampling_rate):
             audio_chunk = np.frombuffer(in_bytes, np.float32)
             
             if len(audio_chunk) > 0:
-                yield audio_chunk.reshape(-1, 1)
+                yield audio_chunk[:len(audio_chunk) // channels * channels].reshape(-1, channels)
             
     except Exception as e:
         logging.error(f"Erreur lors de la lecture RTSP: {e}")
@@ -142,58 +280,247 @@ def read_audio_from_rtsp(rtsp_url, buffer_size, sampling_rate):
         if process:
             process.kill()
 
+def create_detection_callback(source_name):
+    def handle_detection(detection_data):
+        try:
+            logging.info(
+                f"CLAP détecté sur {source_name} avec score {detection_data['score']} "
+                f"at {detection_data['timestamp']:.3f} (détecté à {detection_data.get('detected_at', detection_data['timestamp']):.3f})"
+            )
+
+            # Regrouper avec les détections des autres sources avant l'envoi MQTT
+            fusion = get_event_fusion()
+            if fusion:
+                fusion.add(detection_data)
+            else:
+                publish_clap_event(detection_data)
+        except Exception as e:
+            logging.error(f"Erreur lors de l'envoi de l'événement clap pour {source_name}: {str(e)}")
+    return handle_detection
+
+def publish_custom_sound(event):
+    """Publie via MQTT la détection d'un son personnalisé"""
+    logging.info(
+        f"Son personnalisé '{event['sound']}' détecté sur {event['source_id']} "
+        f"(similarité {event['score']:.2f})"
+    )
+    try:
+        MQTTClient().publish_custom_sound(event)
+    except Exception as e:
+        logging.error(f"Erreur lors de l'envoi du son personnalisé {event['sound']}: {str(e)}")
+
+def create_labels_callback(source_name):
+    sensors = get_source_sensors()
+    def handle_labels(labels):
+        hot_log.debug((source_name, 'labels'), "Labels détectés sur %s: %s", source_name, labels)
+        if sensors:
+            sensors.update_labels(source_name, labels)
+    return handle_labels
+
+def create_level_callback(source_name, sample_rate):
+    """Callback alimentant le capteur de niveau sonore de la source, ou None s'il est désactivé"""
+    sensors = get_source_sensors()
+    if not sensors:
+        return None
+    def handle_block(block):
+        sensors.add_block(source_name, block, sample_rate)
+    return handle_block
+
+def collect_metrics():
+    """État des sources et contrôle de débit des détecteurs (collecteur du registre de métriques)"""
+    states = {}
+    for runner in (supervisor, ingest_core):
+        if runner:
+            states.update(runner.get_states())
+    yield (
+        'claptrap_source_up', 'gauge', "Source en cours d'exécution (1) ou en attente de reconnexion (0)",
+        [({'source': source_id}, 1 if state == 'running' else 0) for source_id, state in states.items()]
+    )
+
+    with _detectors_lock:
+        detectors = list(active_detectors)
+    sources = {}
+    for detector in detectors:
+        sources.update(detector.get_metrics())
+    yield (
+        'claptrap_result_lag_seconds', 'gauge', "Retard lissé des résultats de classification",
+        [({'source': source_id}, m['lag']) for source_id, m in sources.items()]
+    )
+    yield (
+        'claptrap_windows_submitted_total', 'counter', "Fenêtres envoyées à l'inférence",
+        [({'source': source_id}, m['windows_submitted']) for source_id, m in sources.items()]
+    )
+    yield (
+        'claptrap_windows_shed_total', 'counter', "Fenêtres non classifiées par délestage",
+        [({'source': source_id}, m['windows_shed']) for source_id, m in sources.items()]
+    )
+    yield (
+        'claptrap_shed_level', 'gauge', "Niveau de délestage de l'inférence",
+        [({}, max((m['shed_level'] for m in sources.values()), default=0))]
+    )
+
+registry.register_collector(collect_metrics)
+
+def create_detector(model, sample_rate, source_id, overlapping_factor=0.5):
+    """
+    Crée, initialise et démarre le détecteur d'une source.
+
+    Returns:
+        AudioDetector: Détecteur enregistré dans active_detectors
+    """
+    detector = AudioDetector(
+        model,
+        sample_rate=sample_rate,
+        buffer_duration=1.0,
+        overlapping_factor=overlapping_factor,
+        inference_workers=int(inference_settings.get('workers', 0)),
+        inference_backend=INFERENCE_BACKEND,
+        inference_threads=inference_settings.get('threads'),
+        streaming_frontend=bool(inference_settings.get('streaming_frontend', True)),
+        score_threshold=THRESHOLD,
+        detection_delay=DELAY,
+        archive_duration=float(archive_settings.get('duration', 60)) if archive_settings.get('enabled', False) else 0.0,
+        clip_before=float(archive_settings.get('clip_before', 2.0)),
+        clip_after=float(archive_settings.get('clip_after', 2.0)),
+        max_clips=int(archive_settings.get('max_clips', 100)),
+        scheduler_settings=get_scheduler_options(),
+        custom_sounds=get_custom_sounds_options(),
+        custom_sound_callback=publish_custom_sound,
+        adaptive_threshold=get_adaptive_threshold_options()
+    )
+    detector.initialize()
+    detector.add_source(
+        source_id=source_id,
+        detection_callback=create_detection_callback(source_id),
+        labels_callback=create_labels_callback(source_id),
+        channel_mode=CHANNEL_MODE,
+        level_callback=create_level_callback(source_id, sample_rate)
+    )
+    with _detectors_lock:
+        active_detectors.add(detector)
+    detector.start()
+    return detector
+
+def release_detector(detector):
+    """Arrête un détecteur créé par create_detector"""
+    with _detectors_lock:
+        active_detectors.discard(detector)
+    detector.stop()
+    sensors = get_source_sensors()
+    if sensors:
+        # La source redémarrée repart d'un niveau et d'un son principal vierges
+        for source_id in list(detector.sources):
+            sensors.forget(source_id)
+    # Ne plus exposer les séries d'une source retirée ou renommée
+    for source_id in list(detector.sources):
+        registry.forget_source(source_id)
+
+def get_enabled_sources(settings):
+    """
+    Liste les sources audio activées dans les paramètres.
+
+    Returns:
+        list: Dictionnaires {'source_id', 'audio_source', 'rtsp_url'}
+    """
+    sources = []
+    if not settings:
+        return sources
+
+    microphone_settings = settings.get('microphone', {})
+    if isinstance(microphone_settings, dict) and microphone_settings.get('enabled', False):
+        device_index = int(microphone_settings.get('device_index', 0))
+        sources.append({
+            'source_id': f"mic_{device_index}",
+            'audio_source': microphone_settings.get('audio_source') or 'default',
+            'rtsp_url': None
+        })
+
+    for source in settings.get('rtsp', []) or []:
+        if isinstance(source, dict) and source.get('enabled', False) and source.get('url'):
+            sources.append({
+                'source_id': f"rtsp_{source['url']}",
+                'audio_source': f"rtsp://{source['url']}",
+                'rtsp_url': source['url']
+            })
+
+    for source in settings.get('saved_vban_sources', []) or []:
+        if source.get('enabled', True) and source.get('ip'):
+            sources.append({
+                'source_id': f"vban_{source['ip']}",
+                'audio_source': f"vban://{source['ip']}",
+                'rtsp_url': None
+            })
+
+    return sources
+
 def start_detection(
     model,
     score_threshold: float,
     overlapping_factor,
-    audio_source: str,
+    audio_source: str = None,
     rtsp_url: str = None,
+    sources: list = None,
 ):
-    global detection_running, classifier, record, current_audio_source, _socketio
+    """
+    Démarre la détection sur une ou plusieurs sources et bloque jusqu'à stop_detection.
+
+    Args:
+        model (str): Chemin du modèle
+        score_threshold (float): Seuil de détection
+        overlapping_factor (float): Recouvrement des fenêtres d'analyse
+        audio_source (str, optional): Source unique (si sources n'est pas fourni)
+        rtsp_url (str, optional): URL RTSP de la source unique
+        sources (list, optional): Sources issues de get_enabled_sources
+    """
+    global detection_running, current_audio_source, supervisor, ingest_core
     
     try:
         if detection_running:
             return False
 
-        # Recharger les paramètres pour avoir les dernières modifications
-        settings = SETTINGS
-        if settings:
-            microphone_settings = settings.get('microphone', {})
-            if isinstance(microphone_settings, dict) and microphone_settings.get('enabled', False):
-                # Utiliser les paramètres du microphone les plus récents
-                audio_source = microphone_settings.get('audio_source')
-                logging.info(f"Utilisation du microphone: {audio_source}")
-
-        detection_running = True
-        current_audio_source = audio_source
-
         if (overlapping_factor <= 0) or (overlapping_factor >= 1.0):
             raise ValueError("Overlapping factor must be between 0 and 1.")
 
         if (score_threshold < 0) or (score_threshold > 1.0):
             raise ValueError("Score threshold must be between (inclusive) 0 et 1.")
 
-        # Démarrer la détection dans un thread séparé
-        detection_thread = threading.Thread(target=run_detection, args=(
-            model,
-            audio_source,
-            rtsp_url
-        ))
-        detection_thread.daemon = True
-        detection_thread.start()
-
-        while detection_thread.is_alive():
-            time.sleep(0.1)
-            if not detection_running:
-                logging.info("Starting Again Detection Thread")
-                detection_thread = threading.Thread(target=run_detection, args=(
-                    model,
-                    audio_source,
-                    rtsp_url
-                ))
-                detection_thread.daemon = True
-                detection_thread.start()
+        if sources is None:
+            sources = []
+            if audio_source:
+                source_id = f"rtsp_{rtsp_url}" if audio_source.startswith("rtsp") else audio_source
+                sources.append({'source_id': source_id, 'audio_source': audio_source, 'rtsp_url': rtsp_url})
+
+        if not sources:
+            # Des sources pourront être activées à chaud via options.json
+            logging.warning("Aucune source audio n'est configurée ou active")
 
+        detection_running = True
+        current_audio_source = sources[0]['audio_source'] if sources else None
+        detection_config.update(model=model, overlapping_factor=overlapping_factor)
+
+        # Chaque source tourne dans son propre thread, redémarré par le superviseur en cas d'échec
+        supervisor = SourceSupervisor()
+        if ingest_settings.get('mode', 'threads') == 'async':
+            # RTSP, VBAN et MQTT partagent une seule boucle asyncio ; le micro reste
+            # sur le superviseur (son callback tourne dans le thread de PortAudio)
+            ingest_core = AsyncIngestCore(
+                executor_workers=int(ingest_settings.get('executor_workers', 2)),
+                keep_channels=CHANNEL_MODE != 'mono'
+            )
+            ingest_core.start()
+            mqtt_client = MQTTClient()
+            mqtt_client.attach_publisher(ingest_core.start_mqtt(
+                mqtt_client.broker_url,
+                mqtt_client.broker_port,
+                mqtt_client.username,
+                mqtt_client.password,
+                mqtt_client.client_id
+            ))
+        for source in sources:
+            add_detection_source(source, model, overlapping_factor)
+
+        # Attendre l'arrêt de la détection (stop_detection)
+        supervisor.wait()
         return True
         
     except Exception as e:
@@ -201,169 +528,319 @@ def start_detection(
         detection_running = False
         return False
 
+def add_detection_source(source, model, overlapping_factor=0.5):
+    """Ajoute une source au superviseur sans redémarrer les autres"""
+    if supervisor is None:
+        return False
+    logging.info(f"Démarrage de la source {source['source_id']} ({source['audio_source']})")
+    if ingest_core and not source['source_id'].startswith("mic_"):
+        return ingest_core.add_source(
+            source,
+            functools.partial(create_detector, model, source_id=source['source_id'],
+                              overlapping_factor=overlapping_factor),
+            release_detector
+        )
+    return supervisor.add_source(
+        source['source_id'],
+        run_detection,
+        model,
+        source['audio_source'],
+        source['rtsp_url'],
+        overlapping_factor
+    )
+
+def remove_detection_source(source_id):
+    """Arrête une source sans toucher aux autres"""
+    if supervisor is None:
+        return False
+    if ingest_core and ingest_core.remove_source(source_id):
+        removed = True
+    else:
+        removed = supervisor.remove_source(source_id)
+    if source_id.startswith("rtsp_"):
+        get_ffmpeg_monitor().forget(source_id)
+    if get_source_sensors():
+        MQTTClient().remove_source_sensors(source_id)
+    return removed
+
+# Sections des composants partagés (backend, ordonnanceur, archive…), lues au démarrage seulement
+RESTART_SECTIONS = (
+    ('inference', "Paramètres d'inférence (inference)"),
+    ('ingest', "Mode d'ingestion (ingest)"),
+    ('archive', "Archive audio (archive)"),
+    ('scheduler', "Priorités entre sources (scheduler)"),
+    ('custom_sounds', "Sons personnalisés (custom_sounds)"),
+    ('adaptive_threshold', "Seuils adaptatifs (adaptive_threshold)"),
+    ('sensors', "Capteurs de niveau sonore (sensors)"),
+)
+
+def get_source_settings(settings, source_id):
+    """Entrée de configuration d'une source (section microphone, flux RTSP ou source VBAN)"""
+    settings = settings or {}
+    if source_id.startswith("mic_"):
+        return settings.get('microphone') or {}
+    if source_id.startswith("rtsp_"):
+        entries, key, value = settings.get('rtsp'), 'url', source_id[len("rtsp_"):]
+    elif source_id.startswith("vban_"):
+        entries, key, value = settings.get('saved_vban_sources'), 'ip', source_id[len("vban_"):]
+    else:
+        return {}
+    return next((entry for entry in entries or [] if isinstance(entry, dict) and entry.get(key) == value), {})
+
+def apply_settings(previous, settings):
+    """
+    Applique à chaud une nouvelle configuration (appelé par le ConfigWatcher).
+
+    Le seuil, le délai et la fusion sont modifiés en place ; seules les sources
+    ajoutées, retirées ou dont les paramètres ont changé sont démarrées,
+    arrêtées ou redémarrées, les autres gardent leur classificateur et leur
+    flux ouverts. Les sections qui configurent des composants partagés ne sont
+    appliquées qu'au redémarrage de l'add-on, ce qui est signalé.
+    """
+    global SETTINGS, THRESHOLD, DELAY
+
+    SETTINGS = settings
+    previous = previous or {}
+
+    # Seuil et délai de détection
+    global_settings = settings.get('global') or {}
+    threshold = float(global_settings.get('threshold', THRESHOLD))
+    delay = float(global_settings.get('delay', DELAY))
+    if (threshold, delay) != (THRESHOLD, DELAY):
+        THRESHOLD, DELAY = threshold, delay
+        with _detectors_lock:
+            for detector in active_detectors:
+                detector.update_settings(score_threshold=THRESHOLD, detection_delay=DELAY)
+
+    # Fusion multi-sources
+    new_fusion_settings = settings.get('fusion') or {}
+    if new_fusion_settings != fusion_settings:
+        fusion_settings.clear()
+        fusion_settings.update(new_fusion_settings)
+        if event_fusion:
+            event_fusion.window = float(fusion_settings.get('window', event_fusion.window))
+            event_fusion.hold = float(fusion_settings.get('hold', event_fusion.hold))
+            event_fusion.strategy = fusion_settings.get('strategy', event_fusion.strategy)
+        logging.info(f"Paramètres de fusion mis à jour: {fusion_settings}")
+
+    # Connexion MQTT
+    MQTTClient().reconfigure(settings)
+
+    for section, name in RESTART_SECTIONS:
+        if (settings.get(section) or {}) != (previous.get(section) or {}):
+            logging.warning(f"{name} : redémarrage nécessaire, modification appliquée au redémarrage de l'add-on")
+    previous_mode = (previous.get('global') or {}).get('channel_mode') or 'mono'
+    if (global_settings.get('channel_mode') or 'mono') != previous_mode:
+        logging.warning("Mode multi-canal (global.channel_mode) : redémarrage nécessaire, "
+                        "modification appliquée au redémarrage de l'add-on")
+
+    # Sources : démarrer les nouvelles, arrêter celles qui ont disparu
+    if supervisor is None:
+        return
+    wanted = {source['source_id']: source for source in get_enabled_sources(settings)}
+    running = set(supervisor.get_states())
+    if ingest_core:
+        running |= set(ingest_core.get_states())
+    for source_id in running - set(wanted):
+        logging.info(f"Source désactivée: {source_id}")
+        remove_detection_source(source_id)
+    # Sources conservées dont les paramètres ont changé (latence du micro, canaux…) : redémarrées
+    for source_id in running & set(wanted):
+        if get_source_settings(previous, source_id) != get_source_settings(settings, source_id):
+            logging.info(f"Paramètres modifiés, redémarrage de la source: {source_id}")
+            remove_detection_source(source_id)
+            running.discard(source_id)
+    for source_id in set(wanted) - running:
+        logging.info(f"Source activée: {source_id}")
+        add_detection_source(
+            wanted[source_id],
+            detection_config.get('model', model),
+            detection_config.get('overlapping_factor', 0.5)
+        )
+
 def get_sample_rate(audio_source, rtsp_url):
+    return get_stream_format(audio_source, rtsp_url)[0]
+
+def get_stream_format(audio_source, rtsp_url):
+    """
+    Détermine le taux d'échantillonnage et le nombre de canaux à capturer.
+
+    Returns:
+        tuple: (sample_rate, channels) ; channels vaut 1 en mode mono
+    """
     if audio_source.startswith("rtsp"):
-        """Use ffprobe to get sample rate from RTSP stream."""
-        cmd = [
-            'ffprobe',
-            '-v', 'quiet',
-            '-show_entries', 'stream=sample_rate',
-            '-select_streams', 'a:0',
-            '-of', 'json',
-            rtsp_url
-        ]
+        start = time.monotonic()
         try:
-            result = subprocess.run(cmd, capture_output=True, timeout=10)
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                print(data)
-                for stream in data.get('streams', []):
-                    rate = stream.get('sample_rate')
-                    if rate and rate != 'N/A':
-                        logging.info(f"Sample rate detected from RTSP: {rate}")
-                    return int(rate)
-            logging.warning("Could not determine sample rate from RTSP stream, using fallback 16000 Hz")
-            return 16000
-        except (subprocess.TimeoutExpired, json.JSONDecodeError, KeyError, FileNotFoundError):
-            logging.warning("ffprobe not available or failed, using fallback sample rate 16000 Hz")
-            return 16000
+            sample_rate, channels = probe_rtsp_stream(rtsp_url)
+        finally:
+            log_phase(f"détection du format audio ({rtsp_url})", start)
+    elif audio_source.startswith("vban://"):
+        # Le nombre de canaux VBAN est lu dans l'en-tête de chaque paquet
+        logging.info("Using default sample rate 16000 Hz for non-RTSP source")
+        return 16000, 1
     else:
         logging.info("Using default sample rate 16000 Hz for non-RTSP source")
-        return 16000
+        microphone_settings = (SETTINGS or {}).get('microphone') or {}
+        sample_rate, channels = 16000, int(microphone_settings.get('channels', 1))
+    return sample_rate, (channels if CHANNEL_MODE != 'mono' else 1)
 
-def run_detection(model, audio_source, rtsp_url):
-    """Fonction qui exécute la détection dans un thread séparé"""
+def probe_rtsp_sample_rate(rtsp_url):
+    """Use ffprobe to get sample rate from RTSP stream."""
+    return probe_rtsp_stream(rtsp_url)[0]
+
+def probe_rtsp_stream(rtsp_url):
+    """
+    Use ffprobe to get sample rate and channel count from RTSP stream.
+
+    Returns:
+        tuple: (sample_rate, channels), (16000, 1) si le flux ne peut pas être analysé
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'quiet',
+        '-show_entries', 'stream=sample_rate,channels',
+        '-select_streams', 'a:0',
+        '-of', 'json',
+        rtsp_url
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=10)
+        if result.returncode == 0:
+            data = json.loads(result.stdout)
+            for stream in data.get('streams', []):
+                rate = stream.get('sample_rate')
+                if rate and rate != 'N/A':
+                    channels = int(stream.get('channels') or 1)
+                    logging.info(f"Sample rate detected from RTSP: {rate} ({channels} canaux)")
+                    return int(rate), channels
+        logging.warning("Could not determine sample rate from RTSP stream, using fallback 16000 Hz")
+        return 16000, 1
+    except (subprocess.TimeoutExpired, json.JSONDecodeError, KeyError, ValueError, FileNotFoundError):
+        logging.warning("ffprobe not available or failed, using fallback sample rate 16000 Hz")
+        return 16000, 1
+
+def run_detection(stop_event, model, audio_source, rtsp_url, overlapping_factor=0.5):
+    """
+    Exécute la détection d'une source jusqu'à ce que stop_event soit positionné.
+
+    Returns:
+        bool: True si la source s'est arrêtée sur demande, False en cas d'échec
+    """
+    detector = None
     try:
         # Initialiser le détecteur audio
-        sample_rate = get_sample_rate(audio_source, rtsp_url)
-        detector = AudioDetector(model, sample_rate=sample_rate, buffer_duration=1.0)
-        detector.initialize()
-        
-        def create_detection_callback(source_name):
-            def handle_detection(detection_data):
-                try:
-                    logging.info(f"CLAP détecté sur {source_name} avec score {detection_data['score']} at {detection_data['timestamp']}")
-
-                    # Envoyer l'événement via MQTT
-                    mqtt_client = MQTTClient()
-                    mqtt_client.publish_discovery(source_name)
-                    mqtt_client.publish(f"{mqtt_client.base_topic}/Clapper/state", "ON")
-                    time.sleep(0.5)
-                    mqtt_client.publish(f"{mqtt_client.base_topic}/Clapper/state", "OFF")
-                except Exception as e:
-                    logging.error(f"Erreur lors de l'envoi de l'événement clap pour {source_name}: {str(e)}")
-            return handle_detection
-        
-        def create_labels_callback(source_name):
-            def handle_labels(labels):
-                logging.debug(f"Labels détectés sur {source_name}: {labels}")
-            return handle_labels
-        
-        # Vérifier si une source audio est configurée
-        if not audio_source:
-            logging.error("Aucune source audio n'est configurée ou active")
-            return False
-            
-        # Initialiser la source audio en fonction du paramètre audio_source
+        sample_rate, channels = get_stream_format(audio_source, rtsp_url)
         if audio_source.startswith("rtsp"):
             if not rtsp_url:
                 raise ValueError("RTSP URL must be provided for RTSP audio source.")
-                
             source_id = f"rtsp_{rtsp_url}"
-
-            detector.add_source(
-                source_id=source_id,
-                detection_callback=create_detection_callback(source_id),
-                labels_callback=create_labels_callback(source_id)
-            )
-            
-            # Démarrer la détection
-            detector.start()
-            logging.info(f"Détection démarrée pour la source RTSP {source_id}")
-            
-            rtsp_reader = read_audio_from_rtsp(rtsp_url, int(sample_rate * 0.1), sample_rate)  # Buffer de 100ms
-            while detection_running:
-                audio_data = next(rtsp_reader)
-                detector.process_audio(audio_data, source_id)
-            logging.info("Détection RTSP terminée")
-                
         elif audio_source.startswith("vban://"):
             vban_ip = audio_source.replace("vban://", "")
             source_id = f"vban_{vban_ip}"
+        else:
+            # Récupérer l'index du périphérique depuis les paramètres
+            device_index = int(SETTINGS.get('microphone', {}).get('device_index', 0))
+            source_id = f"mic_{device_index}"
+        detector = create_detector(model, sample_rate, source_id, overlapping_factor)
 
-            detector.add_source(
-                source_id=source_id,
-                detection_callback=create_detection_callback(source_id),
-                labels_callback=create_labels_callback(source_id)
-            )
+        # Initialiser la source audio en fonction du paramètre audio_source
+        if audio_source.startswith("rtsp"):
+            logging.info(f"Détection démarrée pour la source RTSP {source_id}")
             
-            # Démarrer la détection
-            detector.start()
-
+            while not stop_event.is_set():
+                rtsp_reader = read_audio_from_rtsp(rtsp_url, int(sample_rate * 0.1), sample_rate, source_id, channels)  # Buffer de 100ms
+                try:
+                    for audio_data in rtsp_reader:
+                        if stop_event.is_set():
+                            break
+                        if audio_data is None:
+                            return False
+                        detector.process_audio(audio_data, source_id)
+                finally:
+                    rtsp_reader.close()
+                logging.info("Détection RTSP terminée")
+                if stop_event.is_set():
+                    break
+                if not get_ffmpeg_monitor().restart_requested(source_id):
+                    # Fin du flux ou erreur fatale : le superviseur relancera la source avec backoff
+                    return False
+                # Flux coupé par le moniteur (rafale d'erreurs de décodage) : reconnexion immédiate
+                
+        elif audio_source.startswith("vban://"):
             vban_detector = get_vban_detector()
+            vban_detector.keep_channels = CHANNEL_MODE != 'mono'
             
             def audio_callback(audio_data, timestamp):
-                if not detection_running:
-                    return
-                    
-                active_sources = vban_detector.get_active_sources()
-                if vban_ip not in active_sources:
+                if stop_event.is_set():
                     return
-                    
-                detector.process_audio(audio_data, source_id)
-            
-            vban_detector.set_audio_callback(audio_callback)
+
+                # Le timestamp VBAN correspond à la fin du bloc reçu
+                capture_time = timestamp - len(audio_data) / sample_rate
+                detector.process_audio(audio_data, source_id, capture_time=capture_time)
             
-            # Maintenir le thread en vie tant que la détection est active
-            while detection_running:
-                time.sleep(0.1)  # Éviter de surcharger le CPU
-                
-                # Vérifier périodiquement si la source est toujours active
-                active_sources = vban_detector.get_active_sources()
-                if vban_ip not in active_sources:
-                    logging.warning(f"Source VBAN {vban_ip} non trouvée")
-                    time.sleep(1)  # Attendre un peu plus longtemps avant la prochaine vérification
-                    
+            # Route propre à cet émetteur : chaque source VBAN garde son buffer et son callback
+            vban_detector.add_route(vban_ip, audio_callback)
+            try:
+                # Vérifier périodiquement si la source est toujours active, jusqu'à l'arrêt
+                while not stop_event.wait(1.0):
+                    active_sources = vban_detector.get_active_sources()
+                    if vban_ip not in active_sources:
+                        logging.warning(f"Source VBAN {vban_ip} non trouvée")
+            finally:
+                # Ne retirer que sa propre route, les autres sources VBAN restent alimentées
+                vban_detector.remove_route(vban_ip, audio_callback)
+
         else:  # Microphone
-            # Récupérer l'index du périphérique depuis les paramètres
-            settings = SETTINGS
-            device_index = int(settings.get('microphone', {}).get('device_index', 0))
-            source_id = f"mic_{device_index}"
+            import sounddevice as sd
 
-            detector.add_source(
-                source_id=source_id,
-                detection_callback=create_detection_callback(source_id),
-                labels_callback=create_labels_callback(source_id)
-            )
-            
-            # Démarrer la détection
-            detector.start()
             logging.info(f"Détection démarrée pour la source microphone {source_id}")
-            
-            with sd.InputStream(
-                device=device_index,
-                channels=1,
-                samplerate=sample_rate,
-                blocksize=int(sample_rate * 0.1),  # Buffer de 100ms
-                callback=lambda indata, frames, time, status: detector.process_audio(indata[:, 0], source_id)
-            ):
-                logging.info("Stream audio démarré pour le microphone")
-                while detection_running:
-                    time.sleep(0.1)
-                    
-        detector.stop()
+
+            microphone = SETTINGS.get('microphone') or {}
+            capture = MicrophoneCapture(detector, source_id, sample_rate, channels)
+            stream_options = {}
+            latency = parse_latency(microphone.get('latency'))
+            if latency is not None:
+                stream_options['latency'] = latency
+            capture.start()
+            try:
+                with sd.InputStream(
+                    device=device_index,
+                    channels=channels,
+                    samplerate=sample_rate,
+                    # 0 : taille de bloc variable choisie par PortAudio
+                    blocksize=int(microphone.get('blocksize', int(sample_rate * 0.1))),
+                    callback=capture.callback,
+                    **stream_options
+                ) as stream:
+                    logging.info(f"Stream audio démarré pour le microphone (latence: {stream.latency * 1000:.1f} ms)")
+                    stop_event.wait()
+            finally:
+                capture.stop()
+
         return True
         
     except Exception as e:
         logging.error(f"Erreur dans run_detection: {str(e)}")
         return False
+    finally:
+        if detector:
+            release_detector(detector)
 
 def stop_detection():
     """Arrête la détection"""
-    global detection_running, classifier, record, current_audio_source
+    global detection_running, classifier, record, current_audio_source, supervisor, ingest_core
     
     try:
         detection_running = False
+
+        if ingest_core:
+            MQTTClient().attach_publisher(None)
+            ingest_core.stop()
+            ingest_core = None
+
+        if supervisor:
+            supervisor.stop()
+            supervisor = None
         
         if record:
             record.stop()
@@ -374,6 +851,13 @@ def stop_detection():
             classifier.close()
             classifier = None
 
+        shutdown_inference_scheduler()
+        shutdown_adaptive_thresholds()
+        shutdown_sound_sensors()
+        shutdown_inference_pool()
+        shutdown_tflite_backend()
+        shutdown_ffmpeg_monitor()
+
         current_audio_source = None  # Réinitialisation de la source audio
         
         return True  # Retourner True si tout s'est bien passé
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import threading
+
+
+class ConfigWatcher:
+    """
+    Surveille un fichier de configuration JSON et appelle un callback avec
+    l'ancienne et la nouvelle configuration à chaque modification.
+
+    La détection se fait par comparaison de la date de modification et de la
+    taille du fichier (bibliothèque standard uniquement). Un fichier en cours
+    d'écriture (JSON invalide) est ignoré jusqu'au passage suivant.
+    """
+
+    def __init__(self, path, callback, interval=2.0, initial=None):
+        """
+        Initialise le watcher.
+
+        Args:
+            path (str): Chemin du fichier à surveiller
+            callback (callable): Fonction callback(ancienne, nouvelle configuration)
+            interval (float): Intervalle de vérification en secondes
+            initial (dict, optional): Configuration actuellement appliquée
+        """
+        self.path = path
+        self.callback = callback
+        self.interval = interval
+        self.current = initial
+        self._signature = self._stat()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def start(self):
+        """Démarre la surveillance dans un thread"""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._watch_loop, daemon=True)
+        self._thread.start()
+        logging.info(f"Surveillance de {self.path} activée (toutes les {self.interval}s)")
+
+    def check(self):
+        """
+        Vérifie le fichier une fois et applique la nouvelle configuration si elle a changé.
+
+        Returns:
+            bool: True si une nouvelle configuration a été appliquée
+        """
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+
+        try:
+            with open(self.path, 'r') as f:
+                settings = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Configuration {self.path} illisible, nouvel essai au prochain passage: {e}")
+            return False
+
+        self._signature = signature
+        if settings == self.current:
+            return False
+
+        previous, self.current = self.current, settings
+        logging.info(f"Modification de {self.path} détectée, application à chaud")
+        try:
+            self.callback(previous, settings)
+        except Exception as e:
+            logging.error(f"Erreur lors de l'application de la configuration: {str(e)}")
+        return True
+
+    def _watch_loop(self):
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def stop(self):
+        """Arrête la surveillance"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1.0)
+            self._thread = None
@@ -0,0 +1,349 @@
+"""
+Sons personnalisés : reconnaissance par plus proche voisin sur les embeddings YAMNet.
+
+Usage :
+    python custom_sounds.py enroll <nom> exemple1.wav [exemple2.wav ...]
+    python custom_sounds.py list
+    python custom_sounds.py remove <nom>
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+import wave
+
+import numpy as np
+
+from inference_pool import Category
+
+CUSTOM_SOUNDS_PATH = "/data/custom_sounds.npz"
+EMBEDDING_SIZE = 1024
+# Les sons personnalisés sont renvoyés parmi les catégories YAMNet, avec ce préfixe
+CUSTOM_PREFIX = "custom:"
+
+
+def find_embedding_tensor(interpreter):
+    """
+    Retrouve le tenseur d'embedding de YAMNet (moyenne globale [1, 1, 1, 1024] avant la couche dense).
+
+    Returns:
+        int: Index du tenseur, ou None si le modèle n'en a pas
+    """
+    candidates = [
+        detail['index'] for detail in interpreter.get_tensor_details()
+        if len(detail['shape']) and detail['shape'][-1] == EMBEDDING_SIZE
+        and int(np.prod(detail['shape'])) == EMBEDDING_SIZE and 'reduce_mean' in detail['name']
+    ]
+    return candidates[-1] if candidates else None
+
+
+def normalize_rows(matrix):
+    """Normalise chaque ligne en norme L2 (float32)"""
+    matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, EMBEDDING_SIZE)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class EmbeddingIndex:
+    """
+    Index des modèles de sons enregistrés : matrice float32 [n_modèles, 1024] de
+    lignes normalisées, triées par nom de son, stockée dans un fichier npz.
+
+    Les embeddings YAMNet (sortie de ReLU6 moyennée) sont tous positifs et ont
+    une forte composante commune : leur similarité cosinus brute dépasse 0.99
+    entre des sons sans rapport. Les vecteurs sont donc centrés sur l'embedding
+    moyen du fond sonore avant la comparaison. Ce centre est initialisé avec les
+    fenêtres calmes des enregistrements d'exemple, puis suit lentement les
+    fenêtres qui ne correspondent à aucun son.
+
+    La comparaison d'un lot de fenêtres à tous les modèles est un seul produit
+    matriciel, suivi d'un maximum par son (reduceat sur les lignes contiguës
+    d'un même son). Le fichier est relu s'il est modifié, si bien qu'un son
+    enregistré pendant l'exécution est pris en compte sans redémarrage.
+    """
+
+    def __init__(self, path=CUSTOM_SOUNDS_PATH, threshold=0.8, check_interval=5.0, center_smoothing=0.005,
+                 recenter_interval=10.0, warmup=30):
+        """
+        Initialise l'index.
+
+        Args:
+            path (str): Fichier npz de l'index
+            threshold (float): Similarité cosinus (centrée) minimale d'une correspondance
+            check_interval (float): Intervalle (s) entre deux vérifications de modification du fichier
+            center_smoothing (float): Poids de chaque fenêtre dans la moyenne glissante du fond sonore
+            recenter_interval (float): Intervalle (s) entre deux recentrages de la matrice des modèles
+            warmup (int): Fenêtres observées avant la première comparaison si l'index n'a pas de centre
+        """
+        self.path = path
+        self.threshold = threshold
+        self.check_interval = check_interval
+        self.center_smoothing = center_smoothing
+        self.recenter_interval = recenter_interval
+        self.warmup = warmup
+        self.matrix = np.zeros((0, EMBEDDING_SIZE), dtype=np.float32)
+        self.labels = np.zeros(0, dtype=str)
+        self.names = []  # Noms des sons, dans l'ordre des groupes de lignes
+        self.starts = np.zeros(0, dtype=np.intp)  # Première ligne de chaque son
+        self.center = None  # Embedding moyen normalisé du fond sonore
+        self.center_count = 0  # Fenêtres de fond ayant servi au centre enregistré
+        self.observed = 0  # Fenêtres observées à l'exécution
+        self._centered = self.matrix  # Modèles centrés puis normalisés
+        self._next_recenter = 0.0
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Charge l'index depuis le disque (index vide si le fichier n'existe pas)"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._set(np.zeros((0, EMBEDDING_SIZE), dtype=np.float32), np.zeros(0, dtype=str))
+            self._mtime = None
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self._set(data['embeddings'], data['labels'])
+                if 'center' in data and int(data['center_count']) > 0:
+                    self.center = np.asarray(data['center'], dtype=np.float32)
+                    self.center_count = int(data['center_count'])
+            self._recenter()
+            self._mtime = mtime
+            logging.info(f"Sons personnalisés chargés: {', '.join(self.names) or 'aucun'} ({len(self.matrix)} modèles)")
+        except (OSError, KeyError, ValueError) as e:
+            logging.error(f"Impossible de charger les sons personnalisés {self.path}: {e}")
+
+    def _set(self, embeddings, labels):
+        labels = np.asarray(labels, dtype=str)
+        order = np.argsort(labels, kind='stable')
+        matrix = normalize_rows(embeddings)[order] if len(labels) else np.zeros((0, EMBEDDING_SIZE), np.float32)
+        labels = labels[order]
+        names, starts = np.unique(labels, return_index=True) if len(labels) else ([], np.zeros(0, np.intp))
+        with self._lock:
+            self.matrix = np.ascontiguousarray(matrix)
+            self.labels = labels
+            self.names = [str(name) for name in names]
+            self.starts = np.asarray(starts, dtype=np.intp)
+        self._recenter()
+
+    def _recenter(self):
+        """Recalcule la matrice des modèles centrés sur le fond sonore actuel"""
+        with self._lock:
+            center = self.center if self.center is not None else 0.0
+            self._centered = np.ascontiguousarray(normalize_rows(self.matrix - center))
+            self._next_recenter = time.monotonic() + self.recenter_interval
+
+    def refresh(self):
+        """Relit le fichier s'il a changé depuis le dernier chargement"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            self.load()
+
+    def save(self):
+        """Écrit l'index de manière atomique (fichier temporaire puis renommage)"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.npz"
+        with self._lock:
+            center = self.center if self.center is not None else np.zeros(EMBEDDING_SIZE, np.float32)
+            np.savez(tmp_path, embeddings=self.matrix, labels=self.labels, center=center,
+                     center_count=np.int64(self.center_count))
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    def add(self, name, embeddings, background=None):
+        """
+        Ajoute des modèles au son name.
+
+        Args:
+            name (str): Nom du son
+            embeddings (numpy.ndarray): Embeddings [n, 1024] du son
+            background (numpy.ndarray, optional): Embeddings [m, 1024] des passages calmes, pour le centre
+        """
+        if background is not None and len(background):
+            background = normalize_rows(background)
+            total = self.center_count + len(background)
+            previous = self.center if self.center is not None else 0.0
+            self.center = (previous * self.center_count + background.sum(axis=0)) / total
+            self.center_count = total
+        embeddings = normalize_rows(embeddings)
+        self._set(
+            np.concatenate([self.matrix, embeddings]),
+            np.concatenate([self.labels, np.full(len(embeddings), name)])
+        )
+
+    def remove(self, name):
+        """
+        Retire tous les modèles d'un son.
+
+        Returns:
+            int: Nombre de modèles retirés
+        """
+        keep = self.labels != name
+        removed = int(len(keep) - keep.sum())
+        self._set(self.matrix[keep], self.labels[keep])
+        return removed
+
+    def counts(self):
+        """Retourne le nombre de modèles par son"""
+        ends = list(self.starts[1:]) + [len(self.labels)]
+        return {name: int(end - start) for name, start, end in zip(self.names, self.starts, ends)}
+
+    def _track_background(self, embeddings):
+        """Fait suivre au centre les fenêtres qui ne correspondent à aucun son"""
+        if not len(embeddings):
+            return
+        mean = embeddings.mean(axis=0)
+        if self.center is None:
+            self.center = mean
+        else:
+            weight = min(1.0, self.center_smoothing * len(embeddings))
+            self.center = self.center + weight * (mean - self.center)
+        self.observed += len(embeddings)
+        if time.monotonic() >= self._next_recenter:
+            self._recenter()
+
+    def match(self, embeddings):
+        """
+        Compare des embeddings à tous les modèles.
+
+        Args:
+            embeddings (numpy.ndarray): Embeddings [n_fenêtres, 1024]
+
+        Returns:
+            list: Pour chaque fenêtre, les catégories "custom:<nom>" dont la similarité dépasse le seuil
+        """
+        self.refresh()
+        no_match = [[] for _ in range(len(embeddings))]
+        with self._lock:
+            centered, names, starts = self._centered, self.names, self.starts
+        if not names:
+            return no_match
+        embeddings = normalize_rows(embeddings)
+        if self.center_count == 0 and self.observed < self.warmup:
+            # Pas encore de fond sonore connu : les similarités ne seraient pas significatives
+            self._track_background(embeddings)
+            return no_match
+        similarities = normalize_rows(embeddings - self.center) @ centered.T  # [n_fenêtres, n_modèles]
+        best = np.maximum.reduceat(similarities, starts, axis=1)  # [n_fenêtres, n_sons]
+        matched = best >= self.threshold
+        self._track_background(embeddings[~matched.any(axis=1)])
+        return [
+            [Category(CUSTOM_PREFIX + names[j], float(row[j])) for j in np.flatnonzero(hits)]
+            for row, hits in zip(best, matched)
+        ]
+
+
+def load_wav(path):
+    """
+    Lit un fichier WAV PCM 16 bits.
+
+    Returns:
+        tuple: (échantillons mono float32, taux d'échantillonnage)
+    """
+    with wave.open(path, 'rb') as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: seuls les WAV PCM 16 bits sont pris en charge")
+        channels = wav.getnchannels()
+        sample_rate = wav.getframerate()
+        data = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2').astype(np.float32) / 32768.0
+    if channels > 1:
+        data = data.reshape(-1, channels).mean(axis=1)
+    return data, sample_rate
+
+
+def extract_embeddings(classifier, audio_data, sample_rate, hop=0.1, energy_ratio=0.5):
+    """
+    Extrait les embeddings des passages sonores d'un enregistrement.
+
+    L'enregistrement est découpé en fenêtres YAMNet avec un pas de hop secondes ;
+    seules les fenêtres dont l'énergie atteint energy_ratio fois celle de la
+    fenêtre la plus forte sont retenues, pour ne pas enregistrer le silence
+    qui entoure le son.
+
+    Args:
+        classifier (TFLiteClassifier): Classificateur créé avec embeddings=True
+        audio_data (numpy.ndarray): Enregistrement mono
+        sample_rate (int): Taux d'échantillonnage de l'enregistrement
+        hop (float): Pas (s) entre deux fenêtres
+        energy_ratio (float): Énergie relative minimale d'une fenêtre retenue
+
+    Returns:
+        tuple: (embeddings [n, 1024] des passages retenus, embeddings [m, 1024] des passages calmes)
+    """
+    window_size = int(0.975 * sample_rate)
+    step = max(1, int(hop * sample_rate))
+    starts = range(0, max(1, len(audio_data) - window_size + 1), step)
+    windows = [classifier.prepare(audio_data[start:start + window_size], sample_rate) for start in starts]
+    energies = np.array([np.mean(np.square(window)) for window in windows])
+    _, embeddings = classifier.infer(windows)
+    keep = energies >= energy_ratio * energies.max()
+    # Passages calmes : nettement sous le son, ils servent d'estimation du fond sonore
+    quiet = energies < 0.1 * energies.max()
+    return embeddings[keep], embeddings[quiet]
+
+
+def cmd_enroll(args):
+    from tflite_backend import TFLiteClassifier
+    classifier = TFLiteClassifier(args.model, embeddings=True)
+    index = EmbeddingIndex(args.index)
+    total = 0
+    for path in args.files:
+        audio_data, sample_rate = load_wav(path)
+        embeddings, background = extract_embeddings(classifier, audio_data, sample_rate)
+        index.add(args.name, embeddings, background)
+        total += len(embeddings)
+        print(f"{path}: {len(embeddings)} modèles")
+    index.save()
+    print(f"Son '{args.name}' enregistré ({total} modèles ajoutés, {len(index.matrix)} au total)")
+    if index.center_count == 0:
+        print("Aucun passage calme dans les exemples : le fond sonore sera estimé au démarrage de la détection")
+
+
+def cmd_list(args):
+    index = EmbeddingIndex(args.index)
+    for name, count in index.counts().items():
+        print(f"{name:<32} {count} modèles")
+
+
+def cmd_remove(args):
+    index = EmbeddingIndex(args.index)
+    removed = index.remove(args.name)
+    index.save()
+    print(f"Son '{args.name}' retiré ({removed} modèles)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sons personnalisés ClapTrap")
+    parser.add_argument('--index', default=CUSTOM_SOUNDS_PATH)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    enroll = subparsers.add_parser('enroll', help="Enregistre un son à partir d'exemples WAV")
+    enroll.add_argument('name')
+    enroll.add_argument('files', nargs='+')
+    enroll.add_argument('--model', default='yamnet.tflite')
+    enroll.set_defaults(func=cmd_enroll)
+
+    subparsers.add_parser('list', help="Liste les sons enregistrés").set_defaults(func=cmd_list)
+
+    remove = subparsers.add_parser('remove', help="Retire un son")
+    remove.add_argument('name')
+    remove.set_defaults(func=cmd_remove)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+
+
+class EventFusion:
+    """
+    Regroupe les détections d'un même clap captées par plusieurs sources.
+
+    Les détections dont les timestamps d'onset sont à moins de `window` secondes
+    l'une de l'autre forment un groupe. Un groupe est émis une seule fois, `hold`
+    secondes après l'arrivée de sa première détection, afin de laisser aux sources
+    plus lentes (latence réseau, buffering) le temps de contribuer.
+
+    Les groupes ouverts sont indexés par tranche de temps (bucket de `window`
+    secondes) : l'ajout d'une détection ne consulte que les trois buckets voisins,
+    quel que soit le nombre de sources.
+    """
+
+    STRATEGIES = ('strongest', 'earliest')
+
+    def __init__(self, emit_callback, window=0.3, hold=0.5, strategy='strongest'):
+        """
+        Initialise l'étage de fusion.
+
+        Args:
+            emit_callback (callable): Fonction appelée avec l'événement fusionné
+            window (float): Écart maximal (s) entre deux onsets d'un même groupe
+            hold (float): Attente (s) après la première détection avant l'émission
+            strategy (str): 'strongest' (meilleur score) ou 'earliest' (premier onset)
+        """
+        if window <= 0:
+            raise ValueError("La fenêtre de fusion doit être strictement positive")
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Stratégie de fusion inconnue: {strategy}")
+
+        self.emit_callback = emit_callback
+        self.window = window
+        self.hold = hold
+        self.strategy = strategy
+
+        self.buckets = {}  # index de bucket -> liste des groupes ouverts
+        self.deadlines = []  # tas de (échéance, id du groupe, groupe)
+        self._ids = itertools.count()
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def _bucket(self, timestamp):
+        return math.floor(timestamp / self.window)
+
+    def add(self, detection):
+        """
+        Ajoute une détection à l'étage de fusion.
+
+        Args:
+            detection (dict): Données de détection ('source_id', 'timestamp', 'score', ...)
+        """
+        timestamp = detection['timestamp']
+        bucket = self._bucket(timestamp)
+
+        with self._condition:
+            for b in (bucket - 1, bucket, bucket + 1):
+                for group in self.buckets.get(b, ()):
+                    if (abs(group['timestamp'] - timestamp) <= self.window
+                            and detection['source_id'] not in group['source_ids']):
+                        group['detections'].append(detection)
+                        group['source_ids'].add(detection['source_id'])
+                        return
+
+            group = {
+                'timestamp': timestamp,
+                'bucket': bucket,
+                'detections': [detection],
+                'source_ids': {detection['source_id']}
+            }
+            self.buckets.setdefault(bucket, []).append(group)
+            heapq.heappush(self.deadlines, (time.monotonic() + self.hold, next(self._ids), group))
+            self._condition.notify()
+
+    def _flush_loop(self):
+        """Émet les groupes dont l'échéance est atteinte"""
+        while True:
+            with self._condition:
+                while self._running and (
+                        not self.deadlines or self.deadlines[0][0] > time.monotonic()):
+                    timeout = self.deadlines[0][0] - time.monotonic() if self.deadlines else None
+                    self._condition.wait(timeout)
+                if not self._running:
+                    return
+                _, _, group = heapq.heappop(self.deadlines)
+                groups = self.buckets.get(group['bucket'], [])
+                groups.remove(group)
+                if not groups:
+                    self.buckets.pop(group['bucket'], None)
+
+            try:
+                self.emit_callback(self.fuse(group['detections']))
+            except Exception as e:
+                logging.error(f"Erreur lors de l'émission de l'événement fusionné: {str(e)}")
+
+    def fuse(self, detections):
+        """
+        Construit l'événement fusionné à partir des détections d'un groupe.
+
+        Args:
+            detections (list): Détections du groupe
+
+        Returns:
+            dict: Événement avec la source retenue et la liste des sources contributrices
+        """
+        if self.strategy == 'earliest':
+            chosen = min(detections, key=lambda d: d['timestamp'])
+        else:
+            chosen = max(detections, key=lambda d: d['score'])
+
+        event = dict(chosen)
+        event['sources'] = [
+            {
+                'source_id': d['source_id'],
+                'score': d['score'],
+                'timestamp': d['timestamp']
+            }
+            for d in sorted(detections, key=lambda d: d['timestamp'])
+        ]
+        return event
+
+    def stop(self):
+        """Arrête l'étage de fusion (les groupes en attente ne sont pas émis)"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join(timeout=1.0)
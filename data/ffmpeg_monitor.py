@@ -0,0 +1,327 @@
+import logging
+import os
+import re
+import selectors
+import threading
+import time
+
+from metrics import registry
+
+# Ligne de progression : "size=  1024kB time=00:00:10.00 bitrate= 838.9kbits/s speed=1.01x"
+PROGRESS_FIELDS = re.compile(r'(bitrate|speed|drop)=\s*([\d.]+)')
+
+# Erreurs qui interrompent le flux : ffmpeg va se terminer, inutile d'insister rapidement
+FATAL_PATTERNS = re.compile(
+    r'Connection refused|Connection timed out|No route to host|Network is unreachable'
+    r'|401 Unauthorized|403 Forbidden|404 Not Found|Server returned|Immediate exit requested',
+    re.IGNORECASE
+)
+# Erreurs de décodage ou pertes de paquets : le flux continue mais l'audio est dégradé
+# (motifs précis : de nombreux avertissements RTSP/RTP sans gravité contiennent le mot « error »)
+DECODE_PATTERNS = re.compile(
+    r'error while decoding|Error decoding|Invalid data found|corrupt|decode_slice|non-monotonous|concealing'
+    r'|non-existing PPS|Header missing|channel element \d+\.\d+ is not allocated'
+    r'|RTP: missed|max delay reached',
+    re.IGNORECASE
+)
+
+
+class FFmpegStats:
+    """Compteurs d'un flux ffmpeg"""
+
+    def __init__(self):
+        self.bitrate = None  # kbit/s
+        self.speed = None
+        self.dropped_frames = 0
+        self.decode_errors = 0
+        self.fatal_errors = 0
+        self.reconnects = 0
+        self.restarts_requested = 0
+        self.restart_pending = False  # Reconnexion demandée par le moniteur (et non fin du flux)
+        self.suppressed = 0  # Lignes d'erreur non journalisées (limitation de débit)
+        self.last_error = None
+        self.recent_errors = []  # Horodatages des erreurs de décodage récentes
+
+    def as_dict(self):
+        return {
+            'bitrate': self.bitrate,
+            'speed': self.speed,
+            'dropped_frames': self.dropped_frames,
+            'decode_errors': self.decode_errors,
+            'fatal_errors': self.fatal_errors,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error
+        }
+
+
+class FFmpegMonitor:
+    """
+    Traite la sortie d'erreur de tous les processus ffmpeg dans un seul thread.
+
+    Les lignes de progression et d'erreur sont converties en compteurs (débit,
+    trames perdues, erreurs de décodage, reconnexions). Les erreurs sont
+    journalisées avec une limite par source et par intervalle, et un résumé
+    par source est journalisé périodiquement. Une rafale d'erreurs de décodage
+    déclenche le callback de redémarrage de la source.
+    """
+
+    def __init__(self, summary_interval=60.0, max_logged_errors=5, error_burst=20, burst_window=10.0):
+        """
+        Initialise le moniteur.
+
+        Args:
+            summary_interval (float): Intervalle (s) entre deux résumés et fenêtre de limitation des logs
+            max_logged_errors (int): Nombre maximal de lignes d'erreur journalisées par source et par intervalle
+            error_burst (int): Nombre d'erreurs de décodage déclenchant un redémarrage du flux
+            burst_window (float): Fenêtre (s) de comptage des erreurs de décodage
+        """
+        self.summary_interval = summary_interval
+        self.max_logged_errors = max_logged_errors
+        self.error_burst = error_burst
+        self.burst_window = burst_window
+        self.stats = {}  # source_id -> FFmpegStats
+        self._partial = {}  # source_id -> fin de ligne incomplète
+        self._restart_callbacks = {}  # source_id -> callable
+        self._logged = {}  # source_id -> lignes journalisées dans l'intervalle courant
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._next_summary = time.monotonic() + summary_interval
+        self._thread = None
+        self.running = False
+
+    def start(self):
+        """Démarre le thread de lecture partagé"""
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._select_loop, name="ffmpeg-monitor", daemon=True)
+        self._thread.start()
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b'\0')
+        except OSError:
+            pass
+
+    def attach(self, source_id, on_restart=None):
+        """
+        Prépare les compteurs d'un nouveau processus ffmpeg de la source.
+
+        Args:
+            source_id (str): Identifiant de la source
+            on_restart (callable, optional): Appelé pour forcer la reconnexion du flux
+        """
+        with self._lock:
+            stats = self.stats.get(source_id)
+            if stats is None:
+                self.stats[source_id] = FFmpegStats()
+            else:
+                stats.reconnects += 1
+                stats.recent_errors.clear()
+                stats.restart_pending = False
+            self._partial[source_id] = b''
+            self._restart_callbacks[source_id] = on_restart
+
+    def watch(self, source_id, process):
+        """
+        Surveille la sortie d'erreur d'un processus ffmpeg (subprocess.Popen).
+
+        Le processus est tué si une rafale d'erreurs de décodage est détectée.
+        """
+        self.attach(source_id, on_restart=process.kill)
+        os.set_blocking(process.stderr.fileno(), False)
+        with self._lock:
+            self._selector.register(process.stderr, selectors.EVENT_READ, source_id)
+        self._wake()
+
+    def _unwatch(self, stream):
+        with self._lock:
+            try:
+                self._selector.unregister(stream)
+            except (KeyError, ValueError):
+                pass
+        try:
+            stream.close()
+        except OSError:
+            pass
+
+    def feed(self, source_id, data):
+        """
+        Traite un morceau de sortie d'erreur (les lignes de progression se terminent par \\r).
+
+        Peut être appelé directement (cœur d'ingestion asyncio) après attach().
+        """
+        data = self._partial.get(source_id, b'') + data
+        lines = re.split(rb'[\r\n]', data)
+        self._partial[source_id] = lines.pop()[-4096:]
+        for line in lines:
+            if line:
+                self._parse_line(source_id, line.decode('utf-8', errors='replace').strip())
+
+    def _parse_line(self, source_id, line):
+        stats = self.stats.get(source_id)
+        if stats is None:
+            return
+
+        if line.startswith('size=') or 'bitrate=' in line:
+            for field, value in PROGRESS_FIELDS.findall(line):
+                if field == 'bitrate':
+                    stats.bitrate = float(value)
+                elif field == 'speed':
+                    stats.speed = float(value)
+                else:
+                    stats.dropped_frames = int(float(value))
+            return
+
+        if FATAL_PATTERNS.search(line):
+            stats.fatal_errors += 1
+            stats.last_error = line
+            self._log_error(source_id, stats, logging.ERROR, line)
+        elif DECODE_PATTERNS.search(line):
+            now = time.monotonic()
+            stats.decode_errors += 1
+            stats.last_error = line
+            stats.recent_errors.append(now)
+            while stats.recent_errors and now - stats.recent_errors[0] > self.burst_window:
+                stats.recent_errors.pop(0)
+            self._log_error(source_id, stats, logging.WARNING, line)
+            if len(stats.recent_errors) >= self.error_burst:
+                self._request_restart(source_id, stats)
+
+    def _log_error(self, source_id, stats, level, line):
+        """Journalise une ligne d'erreur dans la limite de max_logged_errors par intervalle"""
+        logged = self._logged.get(source_id, 0)
+        if logged < self.max_logged_errors:
+            self._logged[source_id] = logged + 1
+            logging.log(level, f"ffmpeg {source_id}: {line}")
+        else:
+            stats.suppressed += 1
+
+    def _request_restart(self, source_id, stats):
+        """Force la reconnexion d'un flux dont le décodage est durablement dégradé"""
+        stats.recent_errors.clear()
+        stats.restarts_requested += 1
+        stats.restart_pending = True
+        callback = self._restart_callbacks.get(source_id)
+        logging.warning(
+            f"ffmpeg {source_id}: {self.error_burst} erreurs de décodage en moins de "
+            f"{self.burst_window:.0f}s, reconnexion du flux"
+        )
+        if callback:
+            try:
+                callback()
+            except (OSError, ProcessLookupError) as e:
+                logging.debug(f"Impossible d'arrêter ffmpeg pour {source_id}: {e}")
+
+    def forget(self, source_id):
+        """Supprime les compteurs d'une source retirée"""
+        with self._lock:
+            self.stats.pop(source_id, None)
+            self._partial.pop(source_id, None)
+            self._restart_callbacks.pop(source_id, None)
+            self._logged.pop(source_id, None)
+
+    def restart_requested(self, source_id):
+        """
+        Indique si le dernier arrêt de ffmpeg a été provoqué par le moniteur : le flux
+        peut alors être rouvert immédiatement, sans backoff.
+        """
+        stats = self.stats.get(source_id)
+        return bool(stats and stats.restart_pending)
+
+    def get_stats(self, source_id=None):
+        """Retourne les compteurs d'une source, ou de toutes les sources"""
+        if source_id is not None:
+            stats = self.stats.get(source_id)
+            return stats.as_dict() if stats else None
+        return {sid: stats.as_dict() for sid, stats in list(self.stats.items())}
+
+    def log_summary(self):
+        """Journalise un résumé par source et réinitialise la limitation des logs"""
+        for source_id, stats in list(self.stats.items()):
+            bitrate = f"{stats.bitrate:.1f} kbit/s" if stats.bitrate is not None else "débit inconnu"
+            speed = f"x{stats.speed:.2f}" if stats.speed is not None else "-"
+            message = (
+                f"ffmpeg {source_id}: {bitrate}, vitesse {speed}, "
+                f"{stats.dropped_frames} trames perdues, {stats.decode_errors} erreurs de décodage, "
+                f"{stats.fatal_errors} erreurs fatales, {stats.reconnects} reconnexions"
+            )
+            if stats.suppressed:
+                message += f" ({stats.suppressed} lignes d'erreur non journalisées)"
+                stats.suppressed = 0
+            logging.info(message)
+        self._logged.clear()
+
+    def maybe_log_summary(self):
+        """Journalise le résumé si l'intervalle est écoulé"""
+        now = time.monotonic()
+        if now >= self._next_summary:
+            self._next_summary = now + self.summary_interval
+            self.log_summary()
+
+    def _select_loop(self):
+        while self.running:
+            timeout = max(0.0, self._next_summary - time.monotonic())
+            for key, _ in self._selector.select(timeout):
+                if key.data is None:
+                    os.read(self._wake_r, 512)
+                    continue
+                try:
+                    data = os.read(key.fileobj.fileno(), 65536)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b''
+                if not data:
+                    self._unwatch(key.fileobj)
+                    continue
+                self.feed(key.data, data)
+            self.maybe_log_summary()
+
+    def stop(self):
+        """Arrête le thread de lecture"""
+        self.running = False
+        self._wake()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        for key in list(self._selector.get_map().values()):
+            if key.data is not None:
+                self._unwatch(key.fileobj)
+
+
+# Instance globale partagée par tous les flux ffmpeg
+ffmpeg_monitor = None
+_monitor_lock = threading.Lock()
+
+def get_ffmpeg_monitor():
+    """Retourne le moniteur ffmpeg global, créé et démarré au premier appel"""
+    global ffmpeg_monitor
+    with _monitor_lock:
+        if ffmpeg_monitor is None:
+            ffmpeg_monitor = FFmpegMonitor()
+            ffmpeg_monitor.start()
+        return ffmpeg_monitor
+
+def collect_metrics():
+    """Compteurs ffmpeg de chaque source RTSP (collecteur du registre de métriques)"""
+    stats = ffmpeg_monitor.get_stats() if ffmpeg_monitor else {}
+    for name, kind, documentation, field in (
+        ('claptrap_ffmpeg_bitrate_kbps', 'gauge', "Débit du flux audio (kbit/s)", 'bitrate'),
+        ('claptrap_ffmpeg_dropped_frames', 'gauge', "Trames perdues par ffmpeg depuis son lancement", 'dropped_frames'),
+        ('claptrap_ffmpeg_decode_errors_total', 'counter', "Erreurs de décodage ffmpeg", 'decode_errors'),
+        ('claptrap_ffmpeg_reconnects_total', 'counter', "Reconnexions du flux", 'reconnects'),
+    ):
+        yield name, kind, documentation, [({'source': sid}, s[field]) for sid, s in stats.items()]
+
+registry.register_collector(collect_metrics)
+
+def shutdown_ffmpeg_monitor():
+    """Arrête le moniteur ffmpeg global"""
+    global ffmpeg_monitor
+    with _monitor_lock:
+        if ffmpeg_monitor:
+            ffmpeg_monitor.stop()
+            ffmpeg_monitor = None
@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+
+
+class HotPathLogger:
+    """
+    Journalisation pour les chemins appelés à chaque bloc ou paquet audio.
+
+    Le niveau est vérifié avant tout travail : sous le niveau actif, un appel ne
+    coûte qu'un test de niveau, sans formatage ni calcul des arguments (le
+    message est formaté par logging avec des arguments %, seulement s'il est
+    émis). Les messages d'une même clé (source, type de message) sont limités à
+    burst messages par intervalle ; le nombre de messages supprimés est ajouté
+    au message suivant. Les compteurs incrémentés avec count() sont journalisés
+    en une ligne de résumé par clé toutes les summary_interval secondes, à la
+    place des messages par paquet.
+    """
+
+    def __init__(self, name=None, interval=1.0, burst=5, summary_interval=60.0):
+        """
+        Initialise le journal.
+
+        Args:
+            name (str, optional): Nom du logger (logger racine par défaut)
+            interval (float): Période (s) de la limite de débit par clé
+            burst (int): Nombre maximal de messages par clé et par période
+            summary_interval (float): Intervalle (s) entre deux lignes de résumé
+        """
+        self.logger = logging.getLogger(name)
+        self.interval = interval
+        self.burst = burst
+        self.summary_interval = summary_interval
+        self._windows = {}  # clé -> [début de période, messages émis, messages supprimés]
+        self._counters = {}  # clé -> {compteur: valeur}
+        self._last_summary = time.monotonic()
+        self._lock = threading.Lock()
+
+    def enabled(self, level=DEBUG):
+        """Indique si un message de ce niveau serait émis (à tester avant un calcul coûteux)"""
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, key, msg, *args):
+        """
+        Émet un message limité en débit par clé.
+
+        Args:
+            level (int): Niveau du message
+            key: Clé de limitation (par exemple (source, type de message))
+            msg (str): Message au format %
+            *args: Arguments du message, formatés seulement s'il est émis
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                window = self._windows[key] = [now, 0, 0]
+            else:
+                suppressed = 0
+            if window[1] >= self.burst:
+                window[2] += 1
+                return
+            window[1] += 1
+        if suppressed:
+            msg += " (%d messages similaires supprimés)"
+            args += (suppressed,)
+        self.logger.log(level, msg, *args)
+
+    def debug(self, key, msg, *args):
+        if self.logger.isEnabledFor(DEBUG):
+            self.log(DEBUG, key, msg, *args)
+
+    def info(self, key, msg, *args):
+        if self.logger.isEnabledFor(INFO):
+            self.log(INFO, key, msg, *args)
+
+    def count(self, key, name, amount=1):
+        """
+        Incrémente un compteur du résumé périodique.
+
+        Args:
+            key (str): Clé du résumé (une ligne par clé, par exemple la source)
+            name (str): Nom du compteur
+            amount (int): Incrément
+        """
+        counters = self._counters.get(key)
+        if counters is None:
+            with self._lock:
+                counters = self._counters.setdefault(key, {})
+        counters[name] = counters.get(name, 0) + amount
+        if time.monotonic() - self._last_summary >= self.summary_interval:
+            self.summarize()
+
+    def summarize(self):
+        """Journalise puis remet à zéro les compteurs du résumé"""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._last_summary
+            self._last_summary = now
+            counters, self._counters = self._counters, {}
+            # Les clés inactives depuis une période sont oubliées
+            self._windows = {key: w for key, w in self._windows.items() if now - w[0] < self.interval}
+        if not self.logger.isEnabledFor(INFO):
+            return
+        for key, values in counters.items():
+            details = ', '.join(f"{name}: {value}" for name, value in values.items())
+            self.logger.info("Résumé %s sur %.0fs: %s", key, elapsed, details)
+
+
+# Journal partagé des chemins critiques (blocs audio, paquets VBAN, résultats)
+hot_log = HotPathLogger()
@@ -0,0 +1,248 @@
+import collections
+import logging
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from metrics import DROPPED
+
+# Catégorie allégée renvoyée par les workers (mêmes attributs que celles de MediaPipe)
+Category = collections.namedtuple('Category', ['category_name', 'score'])
+
+
+class SharedAudioRing:
+    """
+    Ensemble de slots audio float32 de taille fixe dans un segment de mémoire partagée.
+    Le processus principal écrit une fenêtre dans un slot libre, le worker la lit
+    sans copie via une vue numpy sur le même segment.
+    """
+
+    def __init__(self, slots, slot_size, name=None):
+        """
+        Crée ou ouvre le segment de mémoire partagée.
+
+        Args:
+            slots (int): Nombre de slots
+            slot_size (int): Nombre d'échantillons par slot
+            name (str, optional): Nom d'un segment existant à ouvrir
+        """
+        self.slots = slots
+        self.slot_size = slot_size
+        nbytes = slots * slot_size * np.dtype(np.float32).itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.array = np.ndarray((slots, slot_size), dtype=np.float32, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        """Libère la vue et le segment (supprimé si on en est le créateur)"""
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(shm_name, slots, slot_size, model_path, max_results, score_threshold,
+                 task_queue, result_queue):
+    """Boucle d'un worker d'inférence : lit les fenêtres en mémoire partagée et renvoie les catégories"""
+    from mediapipe.tasks import python
+    from mediapipe.tasks.python import audio
+    from mediapipe.tasks.python.components import containers
+
+    # Le segment appartient au processus principal, qui le supprime à l'arrêt du pool
+    ring = SharedAudioRing(slots, slot_size, name=shm_name)
+
+    options = audio.AudioClassifierOptions(
+        base_options=python.BaseOptions(model_asset_path=model_path),
+        running_mode=audio.RunningMode.AUDIO_CLIPS,
+        max_results=max_results,
+        score_threshold=score_threshold
+    )
+    classifier = audio.AudioClassifier.create_from_options(options)
+
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            slot, n_samples, sample_rate, source_id, tag = task
+            categories = []
+            try:
+                audio_data = containers.AudioData.create_from_array(ring.array[slot, :n_samples], sample_rate)
+                results = classifier.classify(audio_data)
+                if results and results[0].classifications:
+                    categories = [
+                        (category.category_name, category.score)
+                        for category in results[0].classifications[0].categories
+                    ]
+            except Exception as e:
+                logging.error(f"Erreur dans le worker d'inférence: {str(e)}")
+            result_queue.put((slot, source_id, tag, categories))
+    finally:
+        classifier.close()
+        ring.close()
+
+
+class InferencePool:
+    """
+    Pool de processus de classification partagé par toutes les sources.
+
+    Les fenêtres audio sont échangées via un SharedAudioRing, seules les métadonnées
+    (slot, source, tag) transitent par les queues. Les résultats sont redistribués
+    au callback enregistré pour chaque source depuis un thread dédié.
+    """
+
+    def __init__(self, model_path, workers=2, slot_size=int(0.975 * 48000), slots=None,
+                 max_results=5, score_threshold=0.3):
+        """
+        Initialise le pool.
+
+        Args:
+            model_path (str): Chemin du modèle TFLite
+            workers (int): Nombre de processus de classification
+            slot_size (int): Taille maximale d'une fenêtre en échantillons
+            slots (int, optional): Nombre de slots partagés (par défaut 2 par worker)
+            max_results (int): Nombre maximal de catégories par résultat
+            score_threshold (float): Score minimal des catégories renvoyées
+        """
+        self.model_path = model_path
+        self.workers = workers
+        self.slot_size = slot_size
+        self.slots = slots or 2 * workers
+        self.max_results = max_results
+        self.score_threshold = score_threshold
+        self.callbacks = {}  # source_id -> callback(source_id, tag, categories)
+        self.dropped = 0  # Fenêtres abandonnées faute de slot libre
+        self._free_slots = collections.deque(range(self.slots))
+        self._lock = threading.Lock()
+        self._processes = []
+        self._ring = None
+        self._result_thread = None
+        self.running = False
+
+    def start(self):
+        """Démarre les workers et le thread de réception des résultats"""
+        if self.running:
+            return
+        # 'spawn' évite de dupliquer les threads internes de MediaPipe dans les workers
+        ctx = multiprocessing.get_context('spawn')
+        self._ring = SharedAudioRing(self.slots, self.slot_size)
+        self._task_queue = ctx.SimpleQueue()
+        self._result_queue = ctx.SimpleQueue()
+        for _ in range(self.workers):
+            process = ctx.Process(
+                target=_worker_main,
+                args=(self._ring.name, self.slots, self.slot_size, self.model_path,
+                      self.max_results, self.score_threshold, self._task_queue, self._result_queue),
+                daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+        self.running = True
+        self._result_thread = threading.Thread(target=self._result_loop, daemon=True)
+        self._result_thread.start()
+        logging.info(f"Pool d'inférence démarré ({self.workers} workers, {self.slots} slots partagés)")
+
+    def register(self, source_id, callback):
+        """Enregistre le callback de résultats d'une source"""
+        with self._lock:
+            self.callbacks[source_id] = callback
+
+    def unregister(self, source_id):
+        """Retire le callback d'une source"""
+        with self._lock:
+            self.callbacks.pop(source_id, None)
+
+    def submit(self, source_id, window, sample_rate, tag):
+        """
+        Envoie une fenêtre audio aux workers.
+
+        Args:
+            source_id (str): Identifiant de la source
+            window (numpy.ndarray): Fenêtre audio float32 mono
+            sample_rate (int): Taux d'échantillonnage de la fenêtre
+            tag: Valeur renvoyée telle quelle avec le résultat
+
+        Returns:
+            bool: False si la fenêtre a été abandonnée (aucun slot libre)
+        """
+        if not self.running:
+            return False
+        with self._lock:
+            if not self._free_slots:
+                self.dropped += 1
+                DROPPED.labels(source_id, 'backend').inc()
+                return False
+            slot = self._free_slots.popleft()
+        n_samples = min(len(window), self.slot_size)
+        self._ring.array[slot, :n_samples] = window[-n_samples:]
+        self._task_queue.put((slot, n_samples, sample_rate, source_id, tag))
+        return True
+
+    def _result_loop(self):
+        """Libère les slots et transmet les résultats aux sources"""
+        while self.running:
+            item = self._result_queue.get()
+            if item is None:
+                break
+            slot, source_id, tag, categories = item
+            with self._lock:
+                self._free_slots.append(slot)
+                callback = self.callbacks.get(source_id)
+            if callback:
+                try:
+                    callback(source_id, tag, [Category(name, score) for name, score in categories])
+                except Exception as e:
+                    logging.error(f"Erreur dans le callback de résultats pour {source_id}: {str(e)}")
+
+    def stop(self):
+        """Arrête les workers et libère la mémoire partagée"""
+        if not self.running:
+            return
+        self.running = False
+        for _ in self._processes:
+            self._task_queue.put(None)
+        for process in self._processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._result_queue.put(None)
+        self._result_thread.join(timeout=1.0)
+        self._ring.close()
+        self._ring = None
+        logging.info("Pool d'inférence arrêté")
+
+
+# Instance globale partagée par les détecteurs
+inference_pool = None
+_pool_lock = threading.Lock()
+
+def get_inference_pool(model_path, workers, **kwargs):
+    """Retourne le pool d'inférence global, créé et démarré au premier appel"""
+    global inference_pool
+    with _pool_lock:
+        if inference_pool is None:
+            inference_pool = InferencePool(model_path, workers=workers, **kwargs)
+            inference_pool.start()
+        return inference_pool
+
+def shutdown_inference_pool():
+    """Arrête le pool d'inférence global"""
+    global inference_pool
+    with _pool_lock:
+        if inference_pool:
+            try:
+                inference_pool.stop()
+            except Exception as e:
+                logging.error(f"Erreur lors de l'arrêt du pool d'inférence: {e}")
+            inference_pool = None
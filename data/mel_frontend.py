@@ -0,0 +1,193 @@
+import logging
+import struct
+
+import numpy as np
+
+# Nom du tenseur de log-mel [1, 96, 64] à l'entrée du réseau dans yamnet.tflite
+FEATURE_TENSOR = 'feature_patch'
+# Champs des tables du schéma TFLite utilisés ici
+_MODEL_SUBGRAPHS = 2
+_SUBGRAPH_INPUTS = 1
+_SUBGRAPH_OPERATORS = 3
+_OPERATOR_INPUTS = 1
+_OPERATOR_OUTPUTS = 2
+
+
+def _uoffset(buf, pos):
+    return struct.unpack_from('<I', buf, pos)[0]
+
+
+def _field(buf, table, field):
+    """Position absolue d'un champ d'une table flatbuffers, ou None s'il est absent"""
+    vtable = table - struct.unpack_from('<i', buf, table)[0]
+    vtable_size = struct.unpack_from('<H', buf, vtable)[0]
+    if 4 + 2 * field >= vtable_size:
+        return None
+    offset = struct.unpack_from('<H', buf, vtable + 4 + 2 * field)[0]
+    return table + offset if offset else None
+
+
+def _vector(buf, field_pos):
+    """Retourne (position du premier élément, longueur) d'un vecteur référencé par un champ"""
+    if field_pos is None:
+        return None, 0
+    vector = field_pos + _uoffset(buf, field_pos)
+    return vector + 4, _uoffset(buf, vector)
+
+
+def _int_vector(buf, table, field):
+    start, length = _vector(buf, _field(buf, table, field))
+    return list(struct.unpack_from(f'<{length}i', buf, start)) if length else []
+
+
+def split_frontend(model_content, feature_index):
+    """
+    Retire le frontend (forme d'onde -> log-mel) d'un modèle TFLite.
+
+    Le flatbuffer est modifié sur place, sans changer sa taille : l'entrée du
+    sous-graphe devient le tenseur de log-mel et le début du vecteur des
+    opérateurs est décalé après l'opérateur qui le produit. Les opérateurs
+    conservés gardent leurs adresses, leurs offsets relatifs restent valides.
+
+    Args:
+        model_content (bytes): Modèle TFLite
+        feature_index (int): Index du tenseur de log-mel
+
+    Returns:
+        bytes: Modèle prenant le log-mel en entrée, ou None si le graphe ne s'y prête pas
+    """
+    buf = bytearray(model_content)
+    model = _uoffset(buf, 0)
+    subgraphs, count = _vector(buf, _field(buf, model, _MODEL_SUBGRAPHS))
+    if count != 1:
+        return None
+    subgraph = subgraphs + _uoffset(buf, subgraphs)
+
+    inputs_start, inputs_count = _vector(buf, _field(buf, subgraph, _SUBGRAPH_INPUTS))
+    operators_field = _field(buf, subgraph, _SUBGRAPH_OPERATORS)
+    operators, n_operators = _vector(buf, operators_field)
+    if inputs_count != 1 or not n_operators:
+        return None
+
+    ops = []
+    for i in range(n_operators):
+        op = operators + 4 * i + _uoffset(buf, operators + 4 * i)
+        ops.append((_int_vector(buf, op, _OPERATOR_INPUTS), _int_vector(buf, op, _OPERATOR_OUTPUTS)))
+    producer = next((i for i, (_, outputs) in enumerate(ops) if feature_index in outputs), None)
+    if producer is None:
+        return None
+    # Les opérateurs retirés ne doivent alimenter le reste du graphe que par le tenseur de log-mel
+    dropped = {t for _, outputs in ops[:producer + 1] for t in outputs} - {feature_index}
+    if any(t in dropped for inputs, _ in ops[producer + 1:] for t in inputs):
+        return None
+
+    struct.pack_into('<i', buf, inputs_start, feature_index)
+    kept = n_operators - producer - 1
+    new_vector = operators + 4 * (producer + 1) - 4
+    struct.pack_into('<I', buf, new_vector, kept)
+    struct.pack_into('<I', buf, operators_field, new_vector - operators_field)
+    return bytes(buf)
+
+
+def find_frontend_constants(interpreter):
+    """
+    Lit dans le modèle les constantes du frontend de YAMNet.
+
+    Returns:
+        dict: 'window' (fenêtre de Hann [400]), 'mel' (matrice [64, 257]), 'offset' (décalage du log [64]),
+        'feature_index' (tenseur de log-mel) et 'patch_frames' (trames par fenêtre), ou None
+    """
+    details = {detail['name']: detail for detail in interpreter.get_tensor_details()}
+    try:
+        window = next(d for name, d in details.items() if 'hann_window' in name and len(d['shape']) == 1)
+        mel = details['mel_spectrogram']
+        offset = details['add']
+        feature = details[FEATURE_TENSOR]
+        return {
+            'window': interpreter.get_tensor(window['index']).astype(np.float32),
+            'mel': np.ascontiguousarray(interpreter.get_tensor(mel['index']).T, dtype=np.float32),
+            'offset': interpreter.get_tensor(offset['index']).astype(np.float32),
+            'feature_index': feature['index'],
+            'patch_frames': int(feature['shape'][-2])
+        }
+    except (StopIteration, KeyError, ValueError) as e:
+        logging.debug(f"Constantes du frontend introuvables: {e}")
+        return None
+
+
+class LogMelFrontend:
+    """
+    Frontend log-mel d'une source, calculé trame par trame et mis en cache.
+
+    Reproduit le frontend de YAMNet (trames de 25 ms tous les 10 ms, fenêtre de
+    Hann, module de la FFT sur 512 points, 64 bandes mel, log décalé) avec les
+    constantes lues dans le modèle. Les trames sont indexées par leur position
+    absolue dans le flux de la source et conservées dans un anneau : avec des
+    fenêtres qui se recouvrent, seules les trames nouvelles depuis la fenêtre
+    précédente sont calculées.
+    """
+
+    def __init__(self, constants, window_size=15600, cache_frames=256):
+        """
+        Initialise le frontend.
+
+        Args:
+            constants (dict): Constantes lues par find_frontend_constants
+            window_size (int): Taille des fenêtres en échantillons (16 kHz)
+            cache_frames (int): Nombre de trames conservées
+        """
+        self.window = constants['window']
+        self.mel = constants['mel']
+        self.offset = constants['offset']
+        self.patch_frames = constants['patch_frames']
+        self.frame_length = len(self.window)
+        self.fft_length = 2 * (self.mel.shape[0] - 1)
+        self.frame_hop = (window_size - self.frame_length) // (self.patch_frames - 1)
+        self.cache_frames = max(cache_frames, 2 * self.patch_frames)
+        self.frames = np.zeros((self.cache_frames, self.mel.shape[1]), dtype=np.float32)
+        self.frame_ids = np.full(self.cache_frames, -1, dtype=np.int64)  # Index absolu de la trame de chaque case
+        self.computed = 0  # Trames calculées
+        self.reused = 0  # Trames servies par le cache
+
+    def compute(self, frames):
+        """Log-mel d'un tableau de trames [n, 400]"""
+        spectrum = np.abs(np.fft.rfft(frames * self.window, n=self.fft_length))
+        return np.log(spectrum.astype(np.float32) @ self.mel + self.offset)
+
+    def patch(self, window, end_index=None, edge=0):
+        """
+        Calcule le patch log-mel [96, 64] d'une fenêtre à 16 kHz.
+
+        Args:
+            window (numpy.ndarray): Fenêtre de window_size échantillons
+            end_index (int, optional): Index absolu de l'échantillon suivant la fenêtre dans
+                le flux de la source ; sans lui, ou hors de la grille des trames, rien n'est mis en cache
+            edge (int): Nombre d'échantillons de fin de fenêtre faussés par le rééchantillonnage ;
+                les trames qui les recouvrent sont calculées sans être mises en cache
+
+        Returns:
+            numpy.ndarray: Patch [96, 64] float32
+        """
+        framed = np.lib.stride_tricks.sliding_window_view(window, self.frame_length)[::self.frame_hop]
+        framed = framed[:self.patch_frames]
+        start = None if end_index is None else end_index - len(window)
+        if start is None or start < 0 or start % self.frame_hop:
+            self.computed += self.patch_frames
+            return self.compute(framed)
+
+        ids = start // self.frame_hop + np.arange(self.patch_frames)
+        slots = ids % self.cache_frames
+        missing = np.flatnonzero(self.frame_ids[slots] != ids)
+        stable = self.patch_frames
+        if edge:
+            stable = max(0, (len(window) - edge - self.frame_length) // self.frame_hop + 1)
+        patch = self.frames[slots]
+        if len(missing):
+            computed = self.compute(framed[missing])
+            patch[missing] = computed
+            kept = missing < stable
+            self.frames[slots[missing[kept]]] = computed[kept]
+            self.frame_ids[slots[missing[kept]]] = ids[missing[kept]]
+        self.computed += len(missing)
+        self.reused += self.patch_frames - len(missing)
+        return patch
@@ -0,0 +1,295 @@
+import bisect
+import logging
+import os
+import resource
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = 9464
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latence des résultats (s), de la capture de la fin de fenêtre au résultat de classification
+LATENCY_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    def set(self, value):
+        self.value = float(value)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Dernière case : au-delà du plus grand seuil
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Metric:
+    """
+    Métrique nommée, déclinée par valeurs de labels.
+
+    Les déclinaisons sont créées au premier appel de labels() puis réutilisées :
+    sur le chemin critique, une incrémentation ne coûte qu'une recherche dans un
+    dictionnaire et un verrou non contendu.
+    """
+
+    def __init__(self, name, kind, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.kind = kind  # 'counter', 'gauge' ou 'histogram'
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Retourne la déclinaison de la métrique pour ces valeurs de labels"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: labels attendus {self.labelnames}, reçus {values}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    if self.kind == 'histogram':
+                        child = _HistogramChild(self.buckets)
+                    elif self.kind == 'gauge':
+                        child = _GaugeChild()
+                    else:
+                        child = _CounterChild()
+                    self._children[values] = child
+        return child
+
+    def __len__(self):
+        return len(self._children)
+
+    def __contains__(self, values):
+        return values in self._children
+
+    def remove(self, *values):
+        """Supprime une déclinaison (source retirée)"""
+        with self._lock:
+            self._children.pop(values, None)
+
+    def remove_matching(self, name, value):
+        """Supprime toutes les déclinaisons dont le label name vaut value"""
+        if name not in self.labelnames:
+            return
+        i = self.labelnames.index(name)
+        with self._lock:
+            for values in [values for values in self._children if values[i] == value]:
+                del self._children[values]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            labels = list(zip(self.labelnames, values))
+            if self.kind != 'histogram':
+                lines.append(f"{self.name}{_format_labels(labels)} {child.value}")
+                continue
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Registre des métriques du processus, exposées au format texte de Prometheus.
+
+    Les métriques incrémentées sur le chemin audio sont déclarées ici. Les
+    compteurs déjà tenus par les composants (contrôle de débit, ffmpeg, MQTT…)
+    sont lus au moment de l'exposition par des collecteurs : des fonctions
+    renvoyant des tuples (nom, type, description, [(labels, valeur)]).
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, name, kind, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = Metric(name, kind, documentation, labelnames, **kwargs)
+                self.metrics[name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(name, 'counter', documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(name, 'gauge', documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(name, 'histogram', documentation, labelnames, buckets=buckets)
+
+    def forget_source(self, source_id):
+        """Supprime les séries d'une source retirée ou renommée de toutes les métriques déclarées"""
+        for metric in list(self.metrics.values()):
+            metric.remove_matching('source', source_id)
+
+    def register_collector(self, collector):
+        """Ajoute une fonction appelée à chaque exposition"""
+        with self._lock:
+            if collector not in self.collectors:
+                self.collectors.append(collector)
+
+    def render(self):
+        """Retourne toutes les métriques au format d'exposition texte"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        for collector in list(self.collectors):
+            try:
+                families = list(collector())
+            except Exception as e:
+                logging.error(f"Erreur dans le collecteur de métriques {getattr(collector, '__name__', collector)}: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f"{name}{_format_labels(sorted(labels.items()))} {float(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+# Métriques du chemin audio
+SAMPLES = registry.counter('claptrap_samples_total', "Échantillons audio reçus par source", ['source'])
+DROPPED = registry.counter(
+    'claptrap_dropped_total', "Paquets ou fenêtres abandonnés par source et par étage", ['source', 'stage']
+)
+INFERENCE_LATENCY = registry.histogram(
+    'claptrap_inference_latency_seconds', "Retard des résultats de classification sur la capture", ['source']
+)
+DETECTIONS = registry.counter('claptrap_detections_total', "Claps détectés par source", ['source'])
+LABELS = registry.counter(
+    'claptrap_labels_total', "Classes YAMNet reconnues (score > 0.5) par source", ['source', 'label']
+)
+
+# Buffers audio dont le niveau de remplissage est exposé (objets avec get_buffer_level)
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+def register_buffer(name, buffer):
+    """Expose le niveau de remplissage d'un buffer (CircularAudioBuffer, SPSCAudioRing)"""
+    with _buffers_lock:
+        _buffers[name] = buffer
+
+def unregister_buffer(name):
+    with _buffers_lock:
+        _buffers.pop(name, None)
+
+def collect_buffers():
+    with _buffers_lock:
+        buffers = list(_buffers.items())
+    yield (
+        'claptrap_buffer_level', 'gauge', "Niveau de remplissage des buffers audio (0 à 1)",
+        [({'buffer': name}, buffer.get_buffer_level()) for name, buffer in buffers]
+    )
+
+
+_page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_start_time = time.time()
+
+def collect_process():
+    """Mémoire résidente, temps CPU et threads du processus"""
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * _page_size
+    except (OSError, ValueError, IndexError):
+        # Hors Linux : pic de mémoire résidente (ko)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    times = os.times()
+    yield ('process_resident_memory_bytes', 'gauge', "Mémoire résidente (octets)", [({}, rss)])
+    yield ('process_cpu_seconds_total', 'counter', "Temps CPU utilisateur et système (s)",
+           [({}, times.user + times.system)])
+    yield ('process_threads', 'gauge', "Threads Python actifs", [({}, threading.active_count())])
+    yield ('process_start_time_seconds', 'gauge', "Heure de démarrage du processus", [({}, _start_time)])
+
+registry.register_collector(collect_buffers)
+registry.register_collector(collect_process)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Pas de ligne de log à chaque collecte
+        pass
+
+
+# Serveur HTTP global
+metrics_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=METRICS_PORT, host='0.0.0.0'):
+    """Démarre le serveur d'exposition des métriques (/metrics) dans un thread dédié"""
+    global metrics_server
+    with _server_lock:
+        if metrics_server is None:
+            try:
+                metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                logging.error(f"Impossible de démarrer le serveur de métriques sur le port {port}: {e}")
+                return None
+            metrics_server.daemon_threads = True
+            threading.Thread(target=metrics_server.serve_forever, name="metrics-http", daemon=True).start()
+            logging.info(f"Métriques exposées sur http://{host}:{port}/metrics")
+        return metrics_server
+
+def shutdown_metrics_server():
+    """Arrête le serveur d'exposition des métriques"""
+    global metrics_server
+    with _server_lock:
+        if metrics_server:
+            metrics_server.shutdown()
+            metrics_server.server_close()
+            metrics_server = None
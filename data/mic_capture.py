@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+from circular_buffer import SPSCAudioRing
+from metrics import register_buffer, registry, unregister_buffer
+
+# Captures microphone actives (collecteur de métriques)
+_captures = {}
+_captures_lock = threading.Lock()
+
+
+def parse_latency(value):
+    """
+    Convertit le paramètre microphone.latency pour sounddevice.
+
+    Returns:
+        'low', 'high' ou une latence en secondes (float) ; None pour la valeur par défaut du périphérique
+    """
+    if value in (None, ''):
+        return None
+    if isinstance(value, str) and value.lower() in ('low', 'high'):
+        return value.lower()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        logging.warning(f"Latence microphone invalide: {value!r}, valeur par défaut utilisée")
+        return None
+
+
+class MicrophoneCapture:
+    """
+    Capture d'un microphone découplée de la détection.
+
+    Le callback temps réel de PortAudio se contente de copier le bloc reçu dans
+    un SPSCAudioRing préalloué et de compter les indicateurs de débordement :
+    ni allocation, ni verrou, ni log. Un thread consommateur reconstitue des
+    blocs de block_duration secondes et les passe au détecteur, si bien qu'un
+    ralentissement de la classification remplit l'anneau au lieu de provoquer
+    des débordements d'entrée.
+    """
+
+    def __init__(self, detector, source_id, sample_rate, channels=1, block_duration=0.1,
+                 ring_duration=2.0, report_interval=60.0):
+        """
+        Initialise la capture.
+
+        Args:
+            detector (AudioDetector): Détecteur recevant les blocs
+            source_id (str): Identifiant de la source
+            sample_rate (int): Taux d'échantillonnage
+            channels (int): Nombre de canaux capturés
+            block_duration (float): Durée (s) des blocs passés au détecteur
+            ring_duration (float): Durée (s) d'audio que l'anneau peut absorber
+            report_interval (float): Intervalle minimal (s) entre deux avertissements de débordement
+        """
+        self.detector = detector
+        self.source_id = source_id
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_size = max(1, int(sample_rate * block_duration))
+        self.ring = SPSCAudioRing(int(sample_rate * ring_duration), channels)
+        self.report_interval = report_interval
+        # Dernier repère temporel du callback : (index d'écriture, heure murale du premier échantillon)
+        self._anchor = None
+        self.input_overflows = 0  # Blocs signalés en débordement d'entrée par PortAudio
+        self.status_errors = 0  # Autres indicateurs d'état du callback
+        self.blocks = 0
+        self._reported = (0, 0)
+        self._last_report = time.monotonic()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def callback(self, indata, frames, time_info, status):
+        """Callback temps réel de sd.InputStream : copie dans l'anneau uniquement"""
+        if status:
+            if status.input_overflow:
+                self.input_overflows += 1
+            else:
+                self.status_errors += 1
+        capture_time = None
+        if time_info.inputBufferAdcTime > 0:
+            # Convertir l'horodatage ADC de PortAudio en heure murale
+            capture_time = time.time() - (time_info.currentTime - time_info.inputBufferAdcTime)
+        write_index = self.ring.write_index
+        self.ring.write(indata)
+        if capture_time is not None:
+            self._anchor = (write_index, capture_time)
+
+    def start(self):
+        """Démarre le thread consommateur"""
+        register_buffer(self.source_id, self.ring)
+        with _captures_lock:
+            _captures[self.source_id] = self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._consume_loop, name=f"mic-{self.source_id}", daemon=True)
+        self._thread.start()
+
+    def _consume_loop(self):
+        shape = (self.block_size,) if self.channels == 1 else (self.block_size, self.channels)
+        wait = self.block_size / self.sample_rate / 4
+        while not self._stop_event.is_set():
+            if self.ring.available() < self.block_size:
+                # Attente par sondage : le callback temps réel ne signale rien pour rester sans verrou
+                self._stop_event.wait(wait)
+                continue
+            start_index = self.ring.read_index
+            block = np.empty(shape, dtype=np.float32)
+            self.ring.read_into(block)
+            anchor = self._anchor
+            capture_time = None
+            if anchor is not None:
+                capture_time = anchor[1] + (start_index - anchor[0]) / self.sample_rate
+            try:
+                self.detector.process_audio(block, self.source_id, capture_time=capture_time)
+            except Exception as e:
+                logging.error(f"Erreur lors du traitement du microphone {self.source_id}: {e}")
+            self.blocks += 1
+            self._maybe_report()
+
+    def _maybe_report(self):
+        """Journalise les débordements survenus depuis le dernier rapport"""
+        now = time.monotonic()
+        if now - self._last_report < self.report_interval:
+            return
+        self._last_report = now
+        counts = (self.input_overflows, self.ring.overruns)
+        if counts != self._reported:
+            logging.warning(
+                f"Microphone {self.source_id}: {counts[0] - self._reported[0]} débordements d'entrée, "
+                f"{counts[1] - self._reported[1]} échantillons perdus (anneau plein) depuis {self.report_interval:.0f}s"
+            )
+            self._reported = counts
+
+    def stop(self):
+        """Arrête le thread consommateur (le flux sounddevice doit déjà être fermé)"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        unregister_buffer(self.source_id)
+        with _captures_lock:
+            _captures.pop(self.source_id, None)
+
+
+def collect_metrics():
+    """Débordements des captures microphone (collecteur du registre de métriques)"""
+    with _captures_lock:
+        captures = list(_captures.values())
+    yield (
+        'claptrap_mic_input_overflows_total', 'counter', "Débordements d'entrée signalés par PortAudio",
+        [({'source': c.source_id}, c.input_overflows) for c in captures]
+    )
+    yield (
+        'claptrap_mic_status_errors_total', 'counter', "Autres indicateurs d'état du callback microphone",
+        [({'source': c.source_id}, c.status_errors) for c in captures]
+    )
+    yield (
+        'claptrap_mic_ring_overruns_total', 'counter', "Échantillons perdus faute de place dans l'anneau",
+        [({'source': c.source_id}, c.ring.overruns) for c in captures]
+    )
+
+registry.register_collector(collect_metrics)
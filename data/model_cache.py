@@ -0,0 +1,107 @@
+import logging
+import os
+import threading
+import time
+
+# Moment du lancement du processus, référence des mesures de démarrage
+PROCESS_START = time.monotonic()
+# Modèle livré avec l'add-on, utilisé si aucun autre n'est configuré
+DEFAULT_MODEL = "yamnet.tflite"
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_model_buffers = {}  # chemin du modèle -> contenu du fichier
+_lock = threading.Lock()
+_logged_milestones = set()
+
+
+def log_phase(name, start):
+    """Journalise la durée d'une phase de démarrage commencée à `start` (time.monotonic())"""
+    now = time.monotonic()
+    logging.info(f"Démarrage - {name}: {(now - start) * 1000:.0f} ms (t+{now - PROCESS_START:.2f}s)")
+
+
+def log_milestone(name):
+    """Journalise une seule fois le temps écoulé depuis le lancement jusqu'à un jalon"""
+    if name in _logged_milestones:
+        return
+    _logged_milestones.add(name)
+    logging.info(f"Démarrage - {name}: t+{time.monotonic() - PROCESS_START:.2f}s")
+
+
+def resolve_model_path(path=None):
+    """
+    Résout le modèle configuré (inference.model).
+
+    Args:
+        path (str, optional): Chemin absolu (par exemple sous /share) ou relatif au dossier de l'add-on
+
+    Returns:
+        str: Chemin du modèle, ou le modèle par défaut si le fichier est introuvable
+    """
+    if not path:
+        return DEFAULT_MODEL
+    candidate = path if os.path.isabs(path) else os.path.join(MODEL_DIR, path)
+    if not os.path.isfile(candidate):
+        logging.error(f"Modèle {path} introuvable, utilisation de {DEFAULT_MODEL}")
+        return DEFAULT_MODEL
+    return candidate
+
+
+def get_model_buffer(model_path):
+    """Retourne le contenu du modèle, lu une seule fois puis gardé en mémoire"""
+    with _lock:
+        buffer = _model_buffers.get(model_path)
+        if buffer is None:
+            with open(model_path, 'rb') as f:
+                buffer = f.read()
+            _model_buffers[model_path] = buffer
+        return buffer
+
+
+def warm_up(model_path, backend='mediapipe', workers=0, threads=None, custom_sounds=None, streaming_frontend=True):
+    """
+    Prépare le modèle avant l'arrivée du premier bloc audio : lecture du fichier,
+    import du runtime d'inférence et démarrage des backends partagés.
+
+    Le backend TFLite partagé est créé avec les mêmes options que celles des
+    détecteurs (AudioDetector.initialize), qui récupèrent cette instance.
+
+    Args:
+        model_path (str): Chemin du modèle TFLite
+        backend (str): 'mediapipe' ou 'tflite'
+        workers (int): Nombre de workers d'inférence multi-processus
+        threads (int, optional): Nombre de threads de l'interpréteur TFLite
+        custom_sounds (dict, optional): Paramètres de l'index des sons personnalisés ({'path', 'threshold'})
+        streaming_frontend (bool): Calculer le log-mel par source avec un cache de trames
+    """
+    start = time.monotonic()
+    try:
+        get_model_buffer(model_path)
+        if backend == 'tflite':
+            from tflite_backend import get_tflite_backend
+            custom_index = None
+            if custom_sounds:
+                from custom_sounds import EmbeddingIndex
+                custom_index = EmbeddingIndex(**custom_sounds)
+            get_tflite_backend(
+                model_path,
+                num_threads=threads,
+                custom_index=custom_index,
+                streaming_frontend=streaming_frontend
+            )
+        elif workers > 0:
+            from inference_pool import get_inference_pool
+            get_inference_pool(model_path, workers)
+        else:
+            # L'import de MediaPipe représente l'essentiel du coût d'initialisation
+            from mediapipe.tasks.python import audio  # noqa: F401
+        log_phase(f"préchargement du modèle ({backend})", start)
+    except Exception as e:
+        logging.error(f"Erreur lors du préchargement du modèle: {str(e)}")
+
+
+def warm_up_async(model_path, **kwargs):
+    """Lance warm_up dans un thread, en parallèle de la détection des sources"""
+    thread = threading.Thread(target=warm_up, args=(model_path,), kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
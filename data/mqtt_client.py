@@ -1,12 +1,20 @@
 import json
 import logging
 import os
+import re
 import threading
 import paho.mqtt.client as mqtt
 
+from metrics import registry
+
 SETTINGS_FILE = "/data/options.json"
 
 
+def slugify(name, default='sound'):
+    """Identifiant utilisable dans un topic MQTT et un unique_id Home Assistant"""
+    return re.sub(r'[^A-Za-z0-9_]+', '_', name).strip('_').lower() or default
+
+
 def load_settings():
     if os.path.exists(SETTINGS_FILE):
         with open(SETTINGS_FILE, 'r') as f:
@@ -39,10 +47,50 @@ class MQTTClient:
             self.client_id = settings.get('mqtt_client_id', None)
             self.base_topic = settings.get('mqtt_topic', 'claptrap')
             self.connection = None
+            self.publisher = None  # AsyncMQTTPublisher en mode d'ingestion asyncio
+            self.published = 0  # Messages confiés à paho
+            self.sent = 0  # Messages écrits sur le socket (on_publish)
+            self.discovered_sounds = set()  # Sons personnalisés dont la config Discovery a été publiée
+            self.discovered_sensors = set()  # (source, capteur) dont la config Discovery a été publiée
+
+    def attach_publisher(self, publisher):
+        """
+        Délègue les publications à un publieur asynchrone (mode d'ingestion asyncio),
+        ou revient à la connexion paho classique si publisher vaut None.
+        """
+        self.publisher = publisher
+        if publisher:
+            self.disconnect()
+            self.connection = None
+
+    def reconfigure(self, settings):
+        """
+        Applique de nouveaux paramètres MQTT ; la connexion n'est rouverte que si
+        le broker ou les identifiants ont changé.
+        """
+        broker = (
+            settings.get('mqtt_host', 'localhost'),
+            settings.get('mqtt_port', 1883),
+            settings.get('mqtt_username', None),
+            settings.get('mqtt_password', None),
+            settings.get('mqtt_client_id', None)
+        )
+        self.base_topic = settings.get('mqtt_topic', 'claptrap')
+        if broker == (self.broker_url, self.broker_port, self.username, self.password, self.client_id):
+            return
+
+        self.broker_url, self.broker_port, self.username, self.password, self.client_id = broker
+        if self.publisher:
+            logging.warning("Les paramètres du broker MQTT ne sont appliqués qu'au redémarrage en mode asyncio")
+            return
+        logging.info(f"Paramètres MQTT modifiés, reconnexion à {self.broker_url}:{self.broker_port}")
+        self.disconnect()
+        self.connection = None
 
     def connect(self):
         if not self.connection:
             self.connection = mqtt.Client(client_id=self.client_id)
+            self.connection.on_publish = self._on_publish
 
             if self.username and self.password:
                 self.connection.username_pw_set(self.username, self.password)
@@ -50,8 +98,20 @@ class MQTTClient:
             self.connection.connect(self.broker_url, self.broker_port)
             self.connection.loop_start()
 
+    def _on_publish(self, client, userdata, mid):
+        self.sent += 1
+
+    def get_queue_depth(self):
+        """Retourne le nombre de messages en attente d'envoi au broker"""
+        if self.publisher:
+            return self.publisher.queue.qsize()
+        return max(0, self.published - self.sent)
+
     def publish(self, topic, message, retry=0, retain=False):
-        if self.connection:
+        if self.publisher:
+            self.publisher.publish(topic, message, retain=retain)
+        elif self.connection:
+            self.published += 1
             self.connection.publish(topic, message, retain=retain)
         elif retry > 3:
             logging.error("Failed to connect to MQTT broker after 3 retries.")
@@ -59,6 +119,19 @@ class MQTTClient:
             self.connect()
             self.publish(topic, message, retry + 1)
 
+    def publish_event(self, event):
+        """
+        Publie le détail d'un événement clap (horodatage, score, sources contributrices)
+        """
+        payload = {
+            "source": event.get('source_id'),
+            "timestamp": event.get('timestamp'),
+            "score": event.get('score'),
+            "sources": event.get('sources', []),
+            "clip": event.get('clip')
+        }
+        self.publish(f"{self.base_topic}/Clapper/event", json.dumps(payload))
+
     def publish_discovery(self, entity_id, device_name="Clapper", device_class="motion"):
         """
         Publie la config MQTT Discovery pour un binary_sensor
@@ -77,7 +150,87 @@ class MQTTClient:
         }
         self.publish(discovery_topic, json.dumps(payload), retain=True)
 
+    def publish_custom_sound(self, event):
+        """
+        Publie la détection d'un son personnalisé : binary_sensor dédié (ON puis OFF) et détail JSON
+        """
+        slug = slugify(event['sound'])
+        topic = f"{self.base_topic}/custom/{slug}"
+        if slug not in self.discovered_sounds:
+            payload = {
+                "name": event['sound'],
+                "device_class": "sound",
+                "state_topic": f"{topic}/state",
+                "unique_id": f"claptrap_custom_{slug}",
+                "device": {"identifiers": ["Clapper"], "name": "Clapper"}
+            }
+            self.publish(f"homeassistant/binary_sensor/claptrap_custom_{slug}/config", json.dumps(payload), retain=True)
+            self.discovered_sounds.add(slug)
+        self.publish(f"{topic}/event", json.dumps({
+            "sound": event['sound'],
+            "source": event.get('source_id'),
+            "timestamp": event.get('timestamp'),
+            "score": event.get('score')
+        }))
+        self.publish(f"{topic}/state", "ON")
+        # Retour à OFF sans bloquer le thread de classification appelant
+        threading.Timer(0.5, self.publish, args=(f"{topic}/state", "OFF")).start()
+
+    def _publish_sensor_discovery(self, source_id, sensor, name, state_topic, **extra):
+        """Publie une seule fois la config MQTT Discovery d'un capteur d'une source"""
+        slug = slugify(source_id, 'source')
+        if (slug, sensor) in self.discovered_sensors:
+            return
+        payload = {
+            "name": f"{name} {source_id}",
+            "state_topic": state_topic,
+            "unique_id": f"claptrap_{slug}_{sensor}",
+            "device": {"identifiers": ["Clapper"], "name": "Clapper"},
+            **extra
+        }
+        self.publish(f"homeassistant/sensor/claptrap_{slug}_{sensor}/config", json.dumps(payload), retain=True)
+        self.discovered_sensors.add((slug, sensor))
+
+    def publish_sound_level(self, source_id, level):
+        """Publie le niveau sonore (Leq en dBFS) d'une source"""
+        topic = f"{self.base_topic}/sources/{slugify(source_id, 'source')}/sound_level"
+        self._publish_sensor_discovery(
+            source_id, "sound_level", "Niveau sonore", topic,
+            unit_of_measurement="dBFS", state_class="measurement", icon="mdi:volume-high"
+        )
+        self.publish(topic, f"{level:.1f}")
+
+    def publish_top_sound(self, source_id, label, score):
+        """Publie le son principal reconnu sur une source, avec son score en attribut"""
+        topic = f"{self.base_topic}/sources/{slugify(source_id, 'source')}/top_sound"
+        self._publish_sensor_discovery(
+            source_id, "top_sound", "Son principal", topic,
+            json_attributes_topic=f"{topic}/attributes", icon="mdi:waveform"
+        )
+        self.publish(f"{topic}/attributes", json.dumps({"score": round(float(score), 3)}))
+        self.publish(topic, label)
+
+    def remove_source_sensors(self, source_id):
+        """Supprime de Home Assistant les capteurs d'une source retirée (config Discovery vide)"""
+        slug = slugify(source_id, 'source')
+        for sensor in ("sound_level", "top_sound"):
+            if (slug, sensor) in self.discovered_sensors:
+                self.publish(f"homeassistant/sensor/claptrap_{slug}_{sensor}/config", "", retain=True)
+                self.discovered_sensors.discard((slug, sensor))
+
     def disconnect(self):
         if self.connection:
             self.connection.loop_stop()
-            self.connection.disconnect()
\ No newline at end of file
+            self.connection.disconnect()
+
+
+def collect_metrics():
+    """File d'envoi MQTT (collecteur du registre de métriques)"""
+    client = MQTTClient._instance
+    if client is None or not hasattr(client, 'initialized'):
+        return
+    yield 'claptrap_mqtt_queue_depth', 'gauge', "Messages MQTT en attente d'envoi", [({}, client.get_queue_depth())]
+    if client.publisher:
+        yield 'claptrap_mqtt_dropped_total', 'counter', "Messages MQTT abandonnés (file pleine)", [({}, client.publisher.dropped)]
+
+registry.register_collector(collect_metrics)
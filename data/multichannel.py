@@ -0,0 +1,99 @@
+import numpy as np
+
+# mono : mixage immédiat (comportement historique)
+# per_channel : une détection par canal
+# beamform : somme des canaux réalignés (delay-and-sum)
+# max_energy : canal le plus énergétique du bloc
+CHANNEL_MODES = ('mono', 'per_channel', 'beamform', 'max_energy')
+
+
+class ChannelMixer:
+    """
+    Combine les canaux d'un bloc multi-canal [n_échantillons, n_canaux] en un seul signal.
+
+    Les calculs sont vectorisés sur l'ensemble des canaux : un bloc stéréo ou
+    4 canaux ne coûte guère plus qu'un bloc mono. En mode beamform, le retard de
+    chaque canal par rapport au premier est estimé par intercorrélation (FFT) sur
+    les blocs suffisamment énergétiques, puis les canaux sont réalignés à l'aide
+    de la fin du bloc précédent avant d'être moyennés, ce qui évite qu'un
+    transitoire en opposition de phase s'annule au mixage. Un canal câblé en
+    polarité inversée (pic d'intercorrélation négatif) est retourné avant la
+    moyenne.
+    """
+
+    def __init__(self, channels, mode='beamform', sample_rate=16000, max_delay=0.001, min_rms=0.01):
+        """
+        Initialise le mixeur.
+
+        Args:
+            channels (int): Nombre de canaux
+            mode (str): 'beamform' ou 'max_energy'
+            sample_rate (int): Taux d'échantillonnage
+            max_delay (float): Retard maximal (s) recherché entre deux canaux
+            min_rms (float): Niveau RMS minimal d'un bloc pour réestimer les retards
+        """
+        if mode not in ('beamform', 'max_energy'):
+            raise ValueError(f"Mode de mixage inconnu: {mode}")
+        self.channels = channels
+        self.mode = mode
+        self.max_lag = max(1, int(max_delay * sample_rate))
+        self.min_rms = min_rms
+        self.lags = np.zeros(channels, dtype=np.int64)  # Retard de chaque canal sur le canal 0
+        self.signs = np.ones(channels, dtype=np.float32)  # Polarité de chaque canal par rapport au canal 0
+        # Fin du bloc précédent, par canal : de quoi retarder un canal de 2 * max_lag échantillons
+        self.tail = np.zeros((channels, 2 * self.max_lag), dtype=np.float32)
+
+    def estimate_lags(self, x):
+        """
+        Estime le retard (en échantillons) et la polarité de chaque canal par rapport au canal 0.
+
+        Le retard est celui du pic d'intercorrélation en valeur absolue, la
+        polarité le signe de ce pic.
+
+        Args:
+            x (numpy.ndarray): Bloc [n_canaux, n_échantillons]
+
+        Returns:
+            tuple: (retards en échantillons, polarités ±1)
+        """
+        n = x.shape[1]
+        nfft = 1 << int(np.ceil(np.log2(n + self.max_lag)))
+        spectrum = np.fft.rfft(x, nfft, axis=1)
+        cc = np.fft.irfft(spectrum * np.conj(spectrum[0]), nfft, axis=1)
+        # Retards de -max_lag à +max_lag
+        candidates = np.concatenate([cc[:, -self.max_lag:], cc[:, :self.max_lag + 1]], axis=1)
+        peaks = np.argmax(np.abs(candidates), axis=1)
+        signs = np.where(candidates[np.arange(len(peaks)), peaks] < 0, -1.0, 1.0).astype(np.float32)
+        return peaks - self.max_lag, signs
+
+    def mix(self, frames):
+        """
+        Mixe un bloc multi-canal.
+
+        Args:
+            frames (numpy.ndarray): Bloc [n_échantillons, n_canaux]
+
+        Returns:
+            numpy.ndarray: Signal mono float32
+        """
+        x = split_channels(frames)
+        if self.mode == 'max_energy':
+            energy = np.einsum('ij,ij->i', x, x)
+            return x[int(np.argmax(energy))]
+
+        n = x.shape[1]
+        if np.sqrt(np.mean(x[0] ** 2)) >= self.min_rms:
+            self.lags, self.signs = self.estimate_lags(x)
+
+        # Retarder chaque canal pour l'aligner sur le canal le plus en retard
+        extended = np.concatenate([self.tail, x], axis=1)
+        shifts = self.lags.max() - self.lags
+        idx = self.tail.shape[1] + np.arange(n)[None, :] - shifts[:, None]
+        aligned = np.take_along_axis(extended, idx, axis=1)
+        self.tail = extended[:, -self.tail.shape[1]:].copy()
+        return (self.signs @ aligned / self.channels).astype(np.float32, copy=False)
+
+
+def split_channels(frames):
+    """Convertit un bloc entrelacé [n_échantillons, n_canaux] en tableau par canal [n_canaux, n_échantillons]"""
+    return np.ascontiguousarray(np.asarray(frames).T, dtype=np.float32)
@@ -0,0 +1,231 @@
+import collections
+import logging
+import threading
+import time
+
+from metrics import DROPPED, registry
+
+
+class InferenceScheduler:
+    """
+    Ordonnanceur à files équitables pondérées (WFQ) entre l'ingestion et un
+    backend d'inférence fenêtré (InferencePool ou TFLiteBackend).
+
+    Chaque source dispose d'une file bornée ; quand elle déborde, la fenêtre la
+    plus ancienne est abandonnée (une fenêtre périmée n'a plus d'intérêt). Le
+    nombre de fenêtres confiées au backend est limité à max_in_flight : l'ordre
+    de passage est donc décidé ici, selon l'étiquette de fin virtuelle de chaque
+    tête de file (poids de la source, multiplié par boost pendant boost_duration
+    secondes après une attaque ou une détection). L'étiquette est attribuée quand
+    une fenêtre arrive en tête : une fenêtre abandonnée ne pénalise pas sa
+    source. Même interface que le backend.
+    """
+
+    def __init__(self, backend, weights=None, boost=4.0, boost_duration=5.0, max_queue=4, max_in_flight=8):
+        """
+        Initialise l'ordonnanceur.
+
+        Args:
+            backend: Backend fenêtré (register/unregister/submit)
+            weights (dict, optional): Poids par identifiant de source (1.0 par défaut)
+            boost (float): Multiplicateur de poids d'une source active
+            boost_duration (float): Durée (s) du bonus après une attaque ou une détection
+            max_queue (int): Nombre maximal de fenêtres en attente par source
+            max_in_flight (int): Nombre maximal de fenêtres confiées au backend
+        """
+        self.backend = backend
+        self.weights = dict(weights or {})
+        self.boost_factor = boost
+        self.boost_duration = boost_duration
+        self.max_queue = max_queue
+        self.max_in_flight = max_in_flight
+        self.callbacks = {}
+        self.queues = {}  # source_id -> deque de (fenêtre, sample_rate, tag)
+        self.last_finish = {}  # source_id -> fin virtuelle de la dernière fenêtre envoyée
+        self.head_tags = {}  # source_id -> (début, fin) virtuels de la fenêtre en tête de file
+        self.boosted_until = {}  # source_id -> time.monotonic() de fin du bonus
+        self.virtual_time = 0.0
+        self.in_flight = 0
+        self.in_flight_by_source = collections.Counter()  # Fenêtres confiées au backend, par source
+        self.dropped = 0  # Fenêtres abandonnées (file de la source pleine)
+        self._condition = threading.Condition()
+        self._thread = None
+        self.running = False
+
+    def start(self):
+        """Démarre le thread de répartition"""
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._dispatch_loop, name="inference-scheduler", daemon=True)
+        self._thread.start()
+        logging.info(
+            f"Ordonnanceur d'inférence démarré (poids: {self.weights or 'uniformes'}, "
+            f"bonus: x{self.boost_factor} pendant {self.boost_duration}s)"
+        )
+
+    def get_weight(self, source_id):
+        """Poids effectif d'une source (les canaux '<source>_ch<k>' héritent du poids de leur source)"""
+        weight = self.weights.get(source_id)
+        if weight is None:
+            weight = self.weights.get(source_id.rsplit('_ch', 1)[0], 1.0)
+        if time.monotonic() < self.boosted_until.get(source_id, 0.0):
+            weight *= self.boost_factor
+        return max(weight, 1e-3)
+
+    def boost(self, source_id):
+        """Donne la priorité à une source (attaque ou détection récente)"""
+        with self._condition:
+            self.boosted_until[source_id] = time.monotonic() + self.boost_duration
+            head = self.head_tags.get(source_id)
+            if head:
+                # La fenêtre en attente profite aussi du bonus
+                start, finish = head
+                self.head_tags[source_id] = (start, min(finish, start + 1.0 / self.get_weight(source_id)))
+
+    def _tag_head(self, source_id):
+        """Attribue ses étiquettes virtuelles à la fenêtre en tête de file : une source de poids w avance de 1/w"""
+        start = max(self.virtual_time, self.last_finish.get(source_id, 0.0))
+        self.head_tags[source_id] = (start, start + 1.0 / self.get_weight(source_id))
+
+    def register(self, source_id, callback):
+        """Enregistre le callback de résultats d'une source"""
+        with self._condition:
+            self.callbacks[source_id] = callback
+            self.queues.setdefault(source_id, collections.deque())
+        self.backend.register(source_id, self._on_result)
+
+    def unregister(self, source_id):
+        """Retire une source et ses fenêtres en attente"""
+        with self._condition:
+            self.callbacks.pop(source_id, None)
+            self.queues.pop(source_id, None)
+            self.last_finish.pop(source_id, None)
+            self.head_tags.pop(source_id, None)
+            self.boosted_until.pop(source_id, None)
+            # Le backend ne rappellera plus la source : ses fenêtres en cours libèrent leur place
+            self.in_flight -= self.in_flight_by_source.pop(source_id, 0)
+            self._condition.notify()
+        self.backend.unregister(source_id)
+
+    def submit(self, source_id, window, sample_rate, tag):
+        """
+        Place une fenêtre dans la file de sa source.
+
+        Returns:
+            bool: False si une fenêtre a dû être abandonnée
+        """
+        if not self.running:
+            return False
+        with self._condition:
+            queue = self.queues.get(source_id)
+            if queue is None:
+                return False
+            accepted = True
+            if len(queue) >= self.max_queue:
+                queue.popleft()
+                self.dropped += 1
+                DROPPED.labels(source_id, 'scheduler').inc()
+                accepted = False
+            queue.append((window, sample_rate, tag))
+            if source_id not in self.head_tags:
+                self._tag_head(source_id)
+            self._condition.notify()
+        return accepted
+
+    def _next_window(self):
+        """Retire la fenêtre de plus petite fin virtuelle (appelé avec la condition acquise)"""
+        if not self.head_tags:
+            return None
+        source_id = min(self.head_tags, key=lambda sid: self.head_tags[sid][1])
+        start, finish = self.head_tags.pop(source_id)
+        queue = self.queues[source_id]
+        window, sample_rate, tag = queue.popleft()
+        self.last_finish[source_id] = finish
+        # Temps virtuel : début de la fenêtre en service
+        self.virtual_time = max(self.virtual_time, start)
+        if queue:
+            self._tag_head(source_id)
+        return source_id, window, sample_rate, tag
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                while self.running and (self.in_flight >= self.max_in_flight or not self.head_tags):
+                    self._condition.wait()
+                if not self.running:
+                    return
+                source_id, window, sample_rate, tag = self._next_window()
+                self.in_flight += 1
+                self.in_flight_by_source[source_id] += 1
+
+            if not self.backend.submit(source_id, window, sample_rate, tag):
+                with self._condition:
+                    self._release(source_id)
+
+    def _release(self, source_id):
+        """Libère la place d'une fenêtre de la source (appelé avec la condition acquise)"""
+        # Une source retirée a déjà libéré ses places : un résultat tardif ne libère rien
+        if self.in_flight_by_source[source_id] > 0:
+            self.in_flight_by_source[source_id] -= 1
+            self.in_flight -= 1
+        if not self.in_flight_by_source[source_id]:
+            del self.in_flight_by_source[source_id]
+        self._condition.notify()
+
+    def _on_result(self, source_id, tag, categories):
+        """Transmet un résultat du backend à la source et libère une place"""
+        with self._condition:
+            self._release(source_id)
+            callback = self.callbacks.get(source_id)
+        if callback:
+            callback(source_id, tag, categories)
+
+    def get_queue_depths(self):
+        """Retourne le nombre de fenêtres en attente par source"""
+        with self._condition:
+            return {source_id: len(queue) for source_id, queue in self.queues.items()}
+
+    def stop(self):
+        """Arrête le thread de répartition (le backend reste actif)"""
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        logging.info("Ordonnanceur d'inférence arrêté")
+
+
+# Instance globale placée devant le backend partagé
+inference_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_inference_scheduler(backend, **kwargs):
+    """Retourne l'ordonnanceur global, créé et démarré au premier appel"""
+    global inference_scheduler
+    with _scheduler_lock:
+        if inference_scheduler is None:
+            inference_scheduler = InferenceScheduler(backend, **kwargs)
+            inference_scheduler.start()
+        return inference_scheduler
+
+def collect_metrics():
+    """Fenêtres en attente par source (collecteur du registre de métriques)"""
+    depths = inference_scheduler.get_queue_depths() if inference_scheduler else {}
+    yield (
+        'claptrap_scheduler_queue_depth', 'gauge', "Fenêtres en attente d'inférence par source",
+        [({'source': source_id}, depth) for source_id, depth in depths.items()]
+    )
+
+registry.register_collector(collect_metrics)
+
+def shutdown_inference_scheduler():
+    """Arrête l'ordonnanceur global"""
+    global inference_scheduler
+    with _scheduler_lock:
+        if inference_scheduler:
+            try:
+                inference_scheduler.stop()
+            except Exception as e:
+                logging.error(f"Erreur lors de l'arrêt de l'ordonnanceur d'inférence: {e}")
+            inference_scheduler = None
@@ -0,0 +1,159 @@
+import math
+import threading
+import time
+
+import numpy as np
+
+# Niveau publié pour un signal nul (dBFS)
+MIN_LEVEL = -100.0
+
+
+class LevelMeter:
+    """
+    Niveau sonore équivalent (Leq, dBFS) sur des périodes fixes.
+
+    L'énergie des blocs est cumulée au fil de l'eau : chaque bloc ne coûte qu'un
+    produit scalaire, et un niveau est produit à chaque période complète. Pour
+    un bloc multi-canal, le niveau est la moyenne de l'énergie de tous les
+    canaux et la période se compte en trames (échantillons par canal).
+    """
+
+    def __init__(self, sample_rate, duration=1.0):
+        self.period = max(1, int(sample_rate * duration))
+        self.energy = 0.0
+        self.values = 0  # Échantillons cumulés, tous canaux confondus
+        self.samples = 0  # Trames cumulées
+
+    def add(self, block):
+        """
+        Ajoute un bloc (mono ou multi-canal).
+
+        Returns:
+            float: Leq (dBFS) de la période si elle vient de se terminer, sinon None
+        """
+        self.energy += float(np.vdot(block, block))
+        self.values += block.size
+        self.samples += block.shape[0]
+        if self.samples < self.period:
+            return None
+        mean_square = self.energy / self.values
+        self.energy = 0.0
+        self.values = 0
+        self.samples = 0
+        return max(MIN_LEVEL, 10 * math.log10(mean_square)) if mean_square > 0 else MIN_LEVEL
+
+
+class Throttle:
+    """
+    Limite les publications d'une valeur : au plus une par min_interval, et
+    seulement si elle a changé d'au moins change (ou de libellé), avec une
+    republication au moins toutes les max_interval secondes.
+    """
+
+    def __init__(self, min_interval=1.0, max_interval=60.0, change=0.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.change = change
+        self.last_value = None
+        self.last_time = None
+
+    def should_publish(self, value, now=None):
+        now = time.monotonic() if now is None else now
+        if self.last_time is not None:
+            elapsed = now - self.last_time
+            if elapsed < self.min_interval:
+                return False
+            if isinstance(value, str):
+                changed = value != self.last_value
+            else:
+                changed = abs(value - self.last_value) >= self.change
+            if not changed and elapsed < self.max_interval:
+                return False
+        self.last_value = value
+        self.last_time = now
+        return True
+
+
+class SoundSensors:
+    """
+    Capteurs de niveau sonore et de son principal de chaque source.
+
+    Le niveau (Leq sur level_duration secondes) est calculé à partir des blocs
+    audio reçus, le son principal à partir des résultats du classificateur ;
+    les deux sont transmis aux fonctions de publication après limitation de
+    débit, pour ne pas inonder le broker avec une valeur par bloc.
+    """
+
+    def __init__(self, publish_level, publish_label, level_duration=1.0, level_interval=1.0, level_change=3.0,
+                 label_interval=2.0, max_interval=60.0):
+        """
+        Initialise les capteurs.
+
+        Args:
+            publish_level (callable): Appelée avec (source_id, niveau en dBFS)
+            publish_label (callable): Appelée avec (source_id, libellé, score)
+            level_duration (float): Durée (s) d'intégration du Leq
+            level_interval (float): Intervalle minimal (s) entre deux publications du niveau
+            level_change (float): Variation minimale (dB) du niveau à publier
+            label_interval (float): Intervalle minimal (s) entre deux publications du son principal
+            max_interval (float): Intervalle (s) au-delà duquel une valeur inchangée est republiée
+        """
+        self.publish_level = publish_level
+        self.publish_label = publish_label
+        self.level_duration = level_duration
+        self.level_interval = level_interval
+        self.level_change = level_change
+        self.label_interval = label_interval
+        self.max_interval = max_interval
+        self.sources = {}  # source_id -> {'meter', 'level', 'label'}
+        self._lock = threading.Lock()
+
+    def _state(self, source_id, sample_rate=16000):
+        state = self.sources.get(source_id)
+        if state is None:
+            with self._lock:
+                state = self.sources.setdefault(source_id, {
+                    'meter': LevelMeter(sample_rate, self.level_duration),
+                    'level': Throttle(self.level_interval, self.max_interval, self.level_change),
+                    'label': Throttle(self.label_interval, self.max_interval)
+                })
+        return state
+
+    def add_block(self, source_id, block, sample_rate):
+        """Ajoute un bloc audio d'une source au calcul de son niveau"""
+        state = self._state(source_id, sample_rate)
+        level = state['meter'].add(block)
+        if level is not None and state['level'].should_publish(round(level, 1)):
+            self.publish_level(source_id, round(level, 1))
+
+    def update_labels(self, source_id, labels):
+        """Met à jour le son principal d'une source à partir de ses labels triés par score"""
+        if not labels:
+            return
+        top = labels[0]
+        if self._state(source_id)['label'].should_publish(top['label']):
+            self.publish_label(source_id, top['label'], top['score'])
+
+    def forget(self, source_id):
+        """Oublie le niveau en cours et les dernières valeurs publiées d'une source"""
+        with self._lock:
+            self.sources.pop(source_id, None)
+
+
+# Instance globale partagée par les sources
+sound_sensors = None
+_sensors_lock = threading.Lock()
+
+def get_sound_sensors(publish_level, publish_label, **kwargs):
+    """Retourne les capteurs globaux, créés au premier appel"""
+    global sound_sensors
+    with _sensors_lock:
+        if sound_sensors is None:
+            sound_sensors = SoundSensors(publish_level, publish_label, **kwargs)
+        return sound_sensors
+
+def shutdown_sound_sensors():
+    """Libère les capteurs globaux"""
+    global sound_sensors
+    with _sensors_lock:
+        sound_sensors = None
@@ -0,0 +1,192 @@
+import collections
+import heapq
+import threading
+import time
+
+
+class ExpiringRegistry:
+    """
+    Table de sources expirant max_age secondes après leur dernier paquet.
+
+    Chaque entrée n'a qu'une échéance dans un tas binaire. Rafraîchir une
+    entrée existante ne touche que son horodatage, sans verrou ni opération
+    sur le tas. L'expiration est paresseuse : à l'échéance, une entrée
+    rafraîchie entre-temps est simplement réarmée à sa nouvelle échéance. Le
+    coût est donc de O(log n) par source et par période max_age, quel que
+    soit le débit de paquets, et aucune table n'est reconstruite.
+    """
+
+    def __init__(self, max_age=5.0, on_expire=None):
+        """
+        Initialise le registre.
+
+        Args:
+            max_age (float): Durée (s) sans paquet au-delà de laquelle une source expire
+            on_expire (callable, optional): Appelé avec (clé, valeur) pour chaque source expirée
+        """
+        self.max_age = max_age
+        self.on_expire = on_expire
+        self.entries = {}  # clé -> [valeur, dernier paquet]
+        self._deadlines = []  # Tas de (échéance, clé), une échéance par entrée
+        self._lock = threading.Lock()
+
+    def touch(self, key, value, now=None):
+        """
+        Enregistre ou rafraîchit une source.
+
+        Args:
+            key: Clé de la source
+            value: Valeur associée (remplace la précédente)
+            now (float, optional): Heure du paquet (time.time() par défaut)
+        """
+        now = time.time() if now is None else now
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry[0] = value
+            entry[1] = now
+        else:
+            with self._lock:
+                self.entries[key] = [value, now]
+                heapq.heappush(self._deadlines, (now + self.max_age, key))
+        if self._deadlines and self._deadlines[0][0] <= now:
+            self.expire(now)
+
+    def expire(self, now=None):
+        """
+        Retire les sources dont l'échéance est dépassée.
+
+        Returns:
+            list: Couples (clé, valeur) des sources expirées
+        """
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, key = heapq.heappop(self._deadlines)
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                deadline = entry[1] + self.max_age
+                if deadline > now:
+                    # Rafraîchie depuis : réarmement à la nouvelle échéance
+                    heapq.heappush(self._deadlines, (deadline, key))
+                else:
+                    del self.entries[key]
+                    expired.append((key, entry[0]))
+        if self.on_expire:
+            for key, value in expired:
+                self.on_expire(key, value)
+        return expired
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def snapshot(self, now=None):
+        """
+        Retourne les valeurs des sources actives.
+
+        Returns:
+            list: Valeurs des sources vues depuis moins de max_age secondes
+        """
+        self.expire(now)
+        with self._lock:
+            return [entry[0] for entry in self.entries.values()]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+
+class BoundedSourceTable:
+    """
+    Table LRU de taille bornée, dont les entrées expirent max_age secondes après leur dernier accès.
+
+    L'ordre d'insertion suit le dernier accès : les entrées les plus anciennes
+    sont en tête, ce qui rend l'expiration et l'éviction en O(1). Un émetteur
+    inconnu arrivant sur une table pleine évince l'entrée la moins récente, si
+    bien qu'un flot d'adresses usurpées ne peut pas faire croître la mémoire.
+    """
+
+    def __init__(self, max_entries=32, max_age=5.0, on_expire=None):
+        """
+        Initialise la table.
+
+        Args:
+            max_entries (int): Nombre maximal d'entrées
+            max_age (float): Durée (s) sans accès au-delà de laquelle une entrée expire
+            on_expire (callable, optional): Appelé avec (clé, valeur) pour chaque entrée expirée ou évincée
+        """
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.on_expire = on_expire
+        self.entries = collections.OrderedDict()  # clé -> [valeur, dernier accès]
+        self.evicted = 0  # Entrées évincées par manque de place
+        self._lock = threading.Lock()
+
+    def touch(self, key, value=None, now=None):
+        """
+        Enregistre ou rafraîchit une entrée.
+
+        Args:
+            key: Clé de l'entrée
+            value: Nouvelle valeur (None conserve la valeur existante)
+            now (float, optional): Heure de l'accès (time.time() par défaut)
+
+        Returns:
+            La valeur de l'entrée
+        """
+        now = time.time() if now is None else now
+        removed = []
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                if value is not None:
+                    entry[0] = value
+                entry[1] = now
+            else:
+                self._expire_locked(now, removed)
+                if len(self.entries) >= self.max_entries:
+                    removed.append(self.entries.popitem(last=False))
+                    self.evicted += 1
+                entry = self.entries[key] = [value, now]
+        self._notify(removed)
+        return entry[0]
+
+    def _expire_locked(self, now, removed):
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if now - entry[1] <= self.max_age:
+                break
+            removed.append(self.entries.popitem(last=False))
+
+    def _notify(self, removed):
+        if self.on_expire:
+            for key, entry in removed:
+                self.on_expire(key, entry[0])
+
+    def expire(self, now=None):
+        """Retire les entrées expirées"""
+        removed = []
+        with self._lock:
+            self._expire_locked(time.time() if now is None else now, removed)
+        self._notify(removed)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def items(self, now=None):
+        """Retourne les couples (clé, valeur) des entrées actives"""
+        self.expire(now)
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self.entries.items()]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
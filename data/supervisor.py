@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+
+
+class SourceWorker:
+    """État d'une source supervisée"""
+
+    def __init__(self, source_id, target, args):
+        self.source_id = source_id
+        self.target = target  # target(stop_event, *args) -> bool
+        self.args = args
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.started_at = None
+        self.restart_at = None  # Échéance du prochain redémarrage (time.monotonic())
+        self.backoff = None
+        self.restarts = 0
+
+
+class SourceSupervisor:
+    """
+    Gère le cycle de vie des sources audio : démarrage, arrêt et redémarrage
+    avec backoff exponentiel en cas d'échec.
+
+    Chaque source tourne dans son propre thread et reçoit un threading.Event
+    d'arrêt. Le thread de supervision dort sur une condition et ne se réveille
+    que lorsqu'une source s'arrête, qu'une source est ajoutée ou retirée, ou
+    qu'une échéance de redémarrage est atteinte.
+    """
+
+    def __init__(self, backoff_initial=1.0, backoff_max=60.0, stable_after=60.0):
+        """
+        Initialise le superviseur.
+
+        Args:
+            backoff_initial (float): Délai (s) avant le premier redémarrage
+            backoff_max (float): Délai maximal (s) entre deux redémarrages
+            stable_after (float): Durée (s) de fonctionnement après laquelle le backoff est réinitialisé
+        """
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.workers = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self.stopped = threading.Event()
+        self._thread = threading.Thread(target=self._supervise, daemon=True)
+        self._thread.start()
+
+    def add_source(self, source_id, target, *args):
+        """
+        Démarre une source sans toucher aux autres.
+
+        Args:
+            source_id (str): Identifiant unique de la source
+            target (callable): Fonction target(stop_event, *args) exécutant la source ;
+                elle retourne quand stop_event est positionné ou en cas d'échec
+            *args: Arguments supplémentaires passés à target
+
+        Returns:
+            bool: False si la source est déjà supervisée
+        """
+        with self._condition:
+            if self._stopping or source_id in self.workers:
+                return False
+            worker = SourceWorker(source_id, target, args)
+            self.workers[source_id] = worker
+            self._start_worker(worker)
+            logging.info(f"Source supervisée ajoutée: {source_id}")
+            return True
+
+    def remove_source(self, source_id, timeout=5.0):
+        """Arrête une source et la retire de la supervision"""
+        with self._condition:
+            worker = self.workers.pop(source_id, None)
+            if worker is None:
+                return False
+            worker.stop_event.set()
+            thread = worker.thread
+            self._condition.notify()
+        if thread:
+            thread.join(timeout)
+        logging.info(f"Source supervisée retirée: {source_id}")
+        return True
+
+    def restart_source(self, source_id):
+        """Redémarre une source (par exemple après un changement de configuration)"""
+        with self._condition:
+            worker = self.workers.get(source_id)
+            if worker is None:
+                return False
+            target, args = worker.target, worker.args
+        self.remove_source(source_id)
+        return self.add_source(source_id, target, *args)
+
+    def get_states(self):
+        """Retourne l'état de chaque source : 'running' ou 'backoff'"""
+        with self._condition:
+            return {
+                source_id: 'running' if worker.thread else 'backoff'
+                for source_id, worker in self.workers.items()
+            }
+
+    def _start_worker(self, worker):
+        """Lance le thread d'une source (appelé avec la condition acquise)"""
+        worker.restart_at = None
+        worker.started_at = time.monotonic()
+        worker.thread = threading.Thread(
+            target=self._run_worker,
+            args=(worker,),
+            name=f"source-{worker.source_id}",
+            daemon=True
+        )
+        worker.thread.start()
+
+    def _run_worker(self, worker):
+        """Exécute la source puis signale sa fin au superviseur"""
+        result = False
+        try:
+            result = worker.target(worker.stop_event, *worker.args)
+        except Exception as e:
+            logging.error(f"Erreur dans la source {worker.source_id}: {str(e)}")
+
+        with self._condition:
+            worker.thread = None
+            if worker.stop_event.is_set() or self.workers.get(worker.source_id) is not worker:
+                return
+
+            # Arrêt non demandé : redémarrage avec backoff exponentiel
+            ran_for = time.monotonic() - worker.started_at
+            if worker.backoff is None or ran_for >= self.stable_after:
+                worker.backoff = self.backoff_initial
+            else:
+                worker.backoff = min(worker.backoff * 2, self.backoff_max)
+            worker.restart_at = time.monotonic() + worker.backoff
+            worker.restarts += 1
+            logging.warning(
+                f"Source {worker.source_id} arrêtée ({'fin' if result else 'échec'}), "
+                f"redémarrage dans {worker.backoff:.1f}s"
+            )
+            self._condition.notify()
+
+    def _supervise(self):
+        """Redémarre les sources dont l'échéance de backoff est atteinte"""
+        with self._condition:
+            while not self._stopping:
+                now = time.monotonic()
+                next_deadline = None
+                for worker in self.workers.values():
+                    if worker.thread is not None or worker.restart_at is None:
+                        continue
+                    if worker.restart_at <= now:
+                        logging.info(f"Redémarrage de la source {worker.source_id}")
+                        self._start_worker(worker)
+                    elif next_deadline is None or worker.restart_at < next_deadline:
+                        next_deadline = worker.restart_at
+                self._condition.wait(None if next_deadline is None else next_deadline - now)
+
+    def wait(self, timeout=None):
+        """Bloque jusqu'à l'arrêt du superviseur"""
+        return self.stopped.wait(timeout)
+
+    def stop(self, timeout=5.0):
+        """Arrête toutes les sources et le superviseur"""
+        with self._condition:
+            self._stopping = True
+            workers = list(self.workers.values())
+            self.workers.clear()
+            for worker in workers:
+                worker.stop_event.set()
+            self._condition.notify_all()
+        for worker in workers:
+            thread = worker.thread
+            if thread:
+                thread.join(timeout)
+        self._thread.join(timeout)
+        self.stopped.set()
+        logging.info("Superviseur des sources arrêté")
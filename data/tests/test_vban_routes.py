@@ -0,0 +1,68 @@
+import numpy as np
+
+from vban_detector_new import VBANDetector
+from vban_dispatcher import VBAN_HEADER_SIZE, VBANFrame
+
+
+def make_frame(ip, value, samples=256, received_at=0.0):
+    """Paquet VBAN mono 16 kHz dont tous les échantillons valent value"""
+    data = bytes(VBAN_HEADER_SIZE) + np.full(samples, value, dtype='<i2').tobytes()
+    return VBANFrame(ip, 6980, 'Stream1', 16000, 1, samples, 0, received_at, data)
+
+
+def make_detector():
+    detector = VBANDetector()
+    detector.running = True
+    detector._load_settings = lambda: {}
+    return detector
+
+
+def feed(detector, ip, value, seconds=1):
+    for _ in range(seconds * 16000 // 256 + 1):
+        detector._on_frame(make_frame(ip, value))
+
+
+def test_each_sender_feeds_only_its_route():
+    detector = make_detector()
+    received = {'a': [], 'b': []}
+    detector.add_route('10.0.0.1', lambda audio, timestamp: received['a'].append(audio))
+    detector.add_route('10.0.0.2', lambda audio, timestamp: received['b'].append(audio))
+
+    for _ in range(70):
+        detector._on_frame(make_frame('10.0.0.1', 1000))
+        detector._on_frame(make_frame('10.0.0.2', -2000))
+
+    assert len(received['a']) == 1 and len(received['b']) == 1
+    assert len(received['a'][0]) == 16000
+    np.testing.assert_allclose(received['a'][0], 1000 / 32768.0)
+    np.testing.assert_allclose(received['b'][0], -2000 / 32768.0)
+
+
+def test_removing_a_route_keeps_other_senders_fed():
+    detector = make_detector()
+    received = {'a': [], 'b': []}
+    callback_a = lambda audio, timestamp: received['a'].append(audio)
+    detector.add_route('10.0.0.1', callback_a)
+    detector.add_route('10.0.0.2', lambda audio, timestamp: received['b'].append(audio))
+
+    detector.remove_route('10.0.0.1', callback_a)
+    feed(detector, '10.0.0.1', 1000)
+    feed(detector, '10.0.0.2', -2000)
+
+    assert received['a'] == []
+    assert len(received['b']) == 1
+    np.testing.assert_allclose(received['b'][0], -2000 / 32768.0)
+
+
+def test_remove_route_ignores_a_replaced_callback():
+    detector = make_detector()
+    received = []
+    old_callback = lambda audio, timestamp: None
+    detector.add_route('10.0.0.1', old_callback)
+    detector.add_route('10.0.0.1', lambda audio, timestamp: received.append(audio))
+
+    # La source redémarrée a déjà remplacé la route : l'ancien worker ne doit pas la retirer
+    detector.remove_route('10.0.0.1', old_callback)
+    feed(detector, '10.0.0.1', 1000)
+
+    assert len(received) == 1
@@ -0,0 +1,492 @@
+import csv
+import logging
+import math
+import platform
+import threading
+import time
+
+import numpy as np
+
+from inference_pool import Category
+from metrics import DROPPED
+from model_cache import get_model_buffer
+
+YAMNET_SAMPLE_RATE = 16000
+
+
+def load_interpreter_class():
+    """
+    Importe l'interpréteur TFLite (dépendance optionnelle, plusieurs distributions possibles).
+
+    Returns:
+        type: Classe Interpreter, ou None si aucun runtime n'est installé
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tensorflow.lite import Interpreter
+            except ImportError:
+                return None
+    return Interpreter
+
+
+def resolve_inference_backend(backend):
+    """
+    Vérifie que le backend d'inférence demandé est utilisable.
+
+    Aucun interpréteur TFLite n'est publié pour certaines architectures (armhf,
+    armv7) : le backend 'tflite' repasse alors sur 'mediapipe', avec un message
+    explicite plutôt qu'une erreur à la création du premier détecteur.
+
+    Returns:
+        str: 'tflite' ou 'mediapipe'
+    """
+    if backend != 'tflite' or load_interpreter_class() is not None:
+        return backend
+    logging.error(
+        f"Backend d'inférence tflite indisponible sur {platform.machine()} (aucun interpréteur TFLite installé : "
+        "tflite-runtime, ai-edge-litert ou tensorflow) ; utilisation de mediapipe. Les sons personnalisés et "
+        "les modèles sans métadonnées MediaPipe (variantes quantifiées) ne sont pas utilisables."
+    )
+    return 'mediapipe'
+
+
+def load_class_names(class_map_path="yamnet_class_map.csv"):
+    """Charge les noms des classes YAMNet (colonne display_name)"""
+    with open(class_map_path, newline='') as f:
+        return [row['display_name'] for row in csv.DictReader(f)]
+
+
+class TFLiteClassifier:
+    """
+    Exécute yamnet.tflite directement via l'interpréteur TFLite.
+
+    Si le modèle possède une dimension de batch, plusieurs fenêtres sont empilées
+    dans une seule invocation. Le yamnet.tflite fourni a une entrée 1-D fixe
+    [15600] : les fenêtres sont alors enchaînées sur le même interpréteur, sans
+    repasser par la file de MediaPipe.
+
+    Avec embeddings=True, l'embedding YAMNet (1024 valeurs) de chaque fenêtre est
+    lu dans le même passage ; les fenêtres sont alors comparées aux sons
+    personnalisés de custom_index.
+
+    Avec streaming_frontend=True, le frontend log-mel est retiré du modèle et
+    calculé en numpy par source (LogMelFrontend) : les trames communes à deux
+    fenêtres qui se recouvrent ne sont calculées qu'une fois. Si le modèle ne se
+    prête pas à la découpe, le frontend intégré est conservé.
+    """
+
+    def __init__(self, model_path, num_threads=None, class_map_path="yamnet_class_map.csv",
+                 max_results=5, score_threshold=0.3, embeddings=False, custom_index=None, streaming_frontend=False):
+        """
+        Initialise l'interpréteur.
+
+        Args:
+            model_path (str): Chemin du modèle TFLite
+            num_threads (int, optional): Nombre de threads de l'interpréteur
+            class_map_path (str): Fichier CSV des noms de classes
+            max_results (int): Nombre maximal de catégories par résultat
+            score_threshold (float): Score minimal des catégories renvoyées
+            embeddings (bool): Conserver les tenseurs intermédiaires pour lire l'embedding
+            custom_index (EmbeddingIndex, optional): Sons personnalisés comparés à chaque fenêtre
+            streaming_frontend (bool): Calculer le log-mel hors du modèle, avec cache de trames par source
+        """
+        Interpreter = load_interpreter_class()
+        if Interpreter is None:
+            raise RuntimeError("Aucun interpréteur TFLite disponible (installer tflite-runtime)")
+
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.max_results = max_results
+        self.score_threshold = score_threshold
+        self.class_names = load_class_names(class_map_path)
+        self.lock = threading.Lock()
+
+        self.custom_index = custom_index
+        self.embedding_index = None
+        self.embedding_quantization = (0.0, 0)
+        embeddings = embeddings or custom_index is not None
+        options = {}
+        if embeddings:
+            # Sans cette option, le tenseur d'embedding est écrasé par les couches suivantes
+            options['experimental_preserve_all_tensors'] = True
+        model_content = get_model_buffer(model_path)
+        try:
+            self.interpreter = Interpreter(model_content=model_content, num_threads=num_threads, **options)
+        except TypeError:
+            logging.warning("Cet interpréteur TFLite ne permet pas de lire les embeddings : sons personnalisés désactivés")
+            options = {}
+            self.interpreter = Interpreter(model_content=model_content, num_threads=num_threads)
+            embeddings = False
+        self.interpreter.allocate_tensors()
+        self._read_io_details()
+
+        self.frontend_constants = None  # Constantes du frontend log-mel une fois le modèle découpé
+        self.frontends = {}  # source_id -> LogMelFrontend
+        if streaming_frontend and not self.batched:
+            self._split_frontend(Interpreter, model_content, options)
+
+        if embeddings:
+            from custom_sounds import find_embedding_tensor
+            self.embedding_index = find_embedding_tensor(self.interpreter)
+            self.embedding_quantization = next(
+                (d['quantization'] for d in self.interpreter.get_tensor_details() if d['index'] == self.embedding_index),
+                self.embedding_quantization
+            )
+            if self.embedding_index is None:
+                logging.warning(f"Aucun tenseur d'embedding trouvé dans {model_path} : sons personnalisés désactivés")
+
+    def _read_io_details(self):
+        input_details = self.interpreter.get_input_details()[0]
+        output_details = self.interpreter.get_output_details()[0]
+        self.input_index = input_details['index']
+        self.input_shape = tuple(int(d) for d in input_details['shape'])
+        # Modèles quantifiés en entier : entrée et sortie converties avec leurs paramètres de quantification
+        self.input_dtype = input_details['dtype']
+        self.input_quantization = input_details['quantization']
+        self.output_index = output_details['index']
+        self.output_quantization = output_details['quantization']
+        self.window_size = int(self.input_shape[-1])
+        self.batched = len(self.input_shape) == 2
+        self.batch_size = self.input_shape[0] if self.batched else 1
+
+    def _split_frontend(self, Interpreter, model_content, options):
+        """Remplace l'interpréteur par le modèle sans frontend, après vérification de ses scores"""
+        from mel_frontend import LogMelFrontend, find_frontend_constants, split_frontend
+
+        constants = find_frontend_constants(self.interpreter)
+        patched = split_frontend(model_content, constants['feature_index']) if constants else None
+        if patched is None:
+            logging.info(f"Frontend de {self.model_path} non séparable : log-mel calculé par le modèle")
+            return
+        interpreter = Interpreter(model_content=patched, num_threads=self.num_threads, **options)
+        interpreter.allocate_tensors()
+        input_details = interpreter.get_input_details()[0]
+
+        # Le modèle découpé doit donner les mêmes scores que le modèle complet
+        test = (0.1 * np.random.default_rng(0).standard_normal(self.window_size)).astype(np.float32)
+        expected, _ = self.infer([test])
+        interpreter.set_tensor(input_details['index'], LogMelFrontend(constants, self.window_size).patch(test)[None])
+        interpreter.invoke()
+        scores = interpreter.get_tensor(interpreter.get_output_details()[0]['index']).max(axis=0)
+        if np.abs(scores - expected[0]).max() > 0.05:
+            logging.warning("Le frontend log-mel calculé hors du modèle diverge : frontend intégré conservé")
+            return
+
+        window_size = self.window_size
+        self.interpreter = interpreter
+        self._read_io_details()
+        self.window_size = window_size
+        self.frontend_constants = constants
+        logging.info("Frontend log-mel calculé hors du modèle, trames mises en cache par source")
+
+    def prepare(self, window, sample_rate, source_id=None, end_index=None):
+        """
+        Ramène une fenêtre à 16 kHz et à la taille d'entrée du modèle.
+
+        Args:
+            window (numpy.ndarray): Fenêtre audio mono
+            sample_rate (int): Taux d'échantillonnage de la fenêtre
+            source_id (str, optional): Source de la fenêtre, pour le cache de trames log-mel
+            end_index (int, optional): Index absolu de l'échantillon suivant la fenêtre dans la source
+
+        Returns:
+            numpy.ndarray: Forme d'onde [15600], ou patch log-mel [96, 64] si le frontend est séparé
+        """
+        edge = 0
+        if sample_rate != YAMNET_SAMPLE_RATE:
+            from scipy.signal import resample_poly
+            g = math.gcd(int(sample_rate), YAMNET_SAMPLE_RATE)
+            up, down = YAMNET_SAMPLE_RATE // g, int(sample_rate) // g
+            window = resample_poly(window, up, down)
+            if end_index is not None:
+                # Index de fin sur la grille à 16 kHz, s'il tombe sur un échantillon entier
+                end_index = end_index * up // down if (end_index * up) % down == 0 else None
+            # Échantillons de fin faussés par le filtre de resample_poly (demi-longueur 10 * max(up, down))
+            edge = 10 * max(up, down) // down + 1
+        window = np.asarray(window, dtype=np.float32)
+        if len(window) >= self.window_size:
+            window = window[-self.window_size:]
+        else:
+            window = np.pad(window, (self.window_size - len(window), 0))
+        if self.frontend_constants is None:
+            return window
+
+        frontend = self.frontends.get(source_id)
+        if frontend is None:
+            from mel_frontend import LogMelFrontend
+            frontend = LogMelFrontend(self.frontend_constants, self.window_size)
+            if source_id is not None:
+                self.frontends[source_id] = frontend
+            else:
+                end_index = None
+        return frontend.patch(window, end_index, edge)
+
+    def forget(self, source_id):
+        """Libère le cache de trames d'une source retirée"""
+        self.frontends.pop(source_id, None)
+
+    def infer(self, windows):
+        """
+        Exécute le modèle sur des fenêtres préparées (voir prepare).
+
+        Returns:
+            tuple: (scores [n_fenêtres, n_classes], embeddings [n_fenêtres, 1024] ou None)
+        """
+        embedding_index = self.embedding_index
+        with self.lock:
+            if self.batched:
+                if self.batch_size != len(windows):
+                    self.interpreter.resize_tensor_input(self.input_index, [len(windows), self.window_size])
+                    self.interpreter.allocate_tensors()
+                    self.batch_size = len(windows)
+                self.interpreter.set_tensor(self.input_index, self._quantize_input(np.stack(windows)))
+                self.interpreter.invoke()
+                scores = self._dequantize(self.interpreter.get_tensor(self.output_index), self.output_quantization)
+                if embedding_index is None:
+                    return scores, None
+                embeddings = self.interpreter.get_tensor(embedding_index).reshape(len(windows), -1)
+                return scores, self._dequantize(embeddings, self.embedding_quantization)
+
+            scores = []
+            embeddings = []
+            for window in windows:
+                self.interpreter.set_tensor(self.input_index, self._quantize_input(window.reshape(self.input_shape)))
+                self.interpreter.invoke()
+                # Une ligne par patch de 0.96 s : une seule pour une fenêtre de 0.975 s
+                scores.append(self.interpreter.get_tensor(self.output_index).max(axis=0))
+                if embedding_index is not None:
+                    embeddings.append(self.interpreter.get_tensor(embedding_index).reshape(-1))
+            scores = self._dequantize(np.stack(scores), self.output_quantization)
+            if not embeddings:
+                return scores, None
+            return scores, self._dequantize(np.stack(embeddings), self.embedding_quantization)
+
+    def _quantize_input(self, data):
+        """Convertit l'entrée float32 pour les modèles à entrée entière (int8, uint8)"""
+        if self.input_dtype == np.float32:
+            return data
+        scale, zero_point = self.input_quantization
+        info = np.iinfo(self.input_dtype)
+        return np.clip(np.round(data / scale) + zero_point, info.min, info.max).astype(self.input_dtype)
+
+    @staticmethod
+    def _dequantize(data, quantization):
+        """Ramène en float32 une sortie entière (quantization = (échelle, zéro)), sans changer une sortie float"""
+        if data.dtype == np.float32:
+            return data
+        scale, zero_point = quantization
+        return (data.astype(np.float32) - zero_point) * scale
+
+    def _top_categories(self, row):
+        """Sélectionne les max_results meilleures catégories au-dessus du seuil"""
+        k = min(self.max_results, len(row))
+        top = np.argpartition(row, -k)[-k:]
+        top = top[np.argsort(row[top])[::-1]]
+        return [
+            Category(self.class_names[i], float(row[i]))
+            for i in top
+            if row[i] >= self.score_threshold
+        ]
+
+    def classify_batch(self, windows):
+        """
+        Classifie une liste de fenêtres préparées (voir prepare).
+
+        Returns:
+            list: Pour chaque fenêtre, la liste de ses catégories
+        """
+        scores, embeddings = self.infer(windows)
+        results = [self._top_categories(row) for row in scores]
+        if self.custom_index is not None and embeddings is not None:
+            # Un seul produit matriciel pour toutes les fenêtres et tous les sons enregistrés
+            for categories, matches in zip(results, self.custom_index.match(embeddings)):
+                categories.extend(matches)
+        return results
+
+
+class TFLiteBackend:
+    """
+    Backend de classification fenêtré partagé par toutes les sources.
+
+    Les fenêtres soumises par les différentes sources sont regroupées par un thread
+    unique (au plus max_batch fenêtres ou max_delay secondes d'attente) puis
+    classifiées en un seul passage. Même interface que InferencePool.
+    """
+
+    def __init__(self, model_path, num_threads=None, max_batch=8, max_delay=0.02, max_pending=64,
+                 max_results=5, score_threshold=0.3, custom_index=None, streaming_frontend=True):
+        """
+        Initialise le backend.
+
+        Args:
+            model_path (str): Chemin du modèle TFLite
+            num_threads (int, optional): Nombre de threads de l'interpréteur
+            max_batch (int): Nombre maximal de fenêtres par passage
+            max_delay (float): Attente maximale (s) pour compléter un batch
+            max_pending (int): Nombre maximal de fenêtres en attente
+            max_results (int): Nombre maximal de catégories par résultat
+            score_threshold (float): Score minimal des catégories renvoyées
+            custom_index (EmbeddingIndex, optional): Sons personnalisés comparés à chaque fenêtre
+            streaming_frontend (bool): Calculer le log-mel par source avec un cache de trames
+        """
+        self.classifier = TFLiteClassifier(
+            model_path,
+            num_threads=num_threads,
+            max_results=max_results,
+            score_threshold=score_threshold,
+            custom_index=custom_index,
+            streaming_frontend=streaming_frontend
+        )
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.callbacks = {}
+        self.dropped = 0  # Fenêtres abandonnées (file pleine)
+        self.pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self.running = False
+
+    def start(self):
+        """Démarre le thread de batching"""
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._batch_loop, daemon=True)
+        self._thread.start()
+        logging.info(
+            f"Backend TFLite démarré (threads: {self.classifier.num_threads}, "
+            f"batch max: {self.max_batch}, batch natif: {self.classifier.batched})"
+        )
+
+    def register(self, source_id, callback):
+        """Enregistre le callback de résultats d'une source"""
+        with self._condition:
+            self.callbacks[source_id] = callback
+
+    def unregister(self, source_id):
+        """Retire le callback d'une source"""
+        with self._condition:
+            self.callbacks.pop(source_id, None)
+        self.classifier.forget(source_id)
+
+    def submit(self, source_id, window, sample_rate, tag):
+        """
+        Ajoute une fenêtre au prochain batch.
+
+        Le tag des détecteurs est l'index de fin de fenêtre : il situe la fenêtre
+        dans le flux de la source pour réutiliser les trames log-mel déjà calculées.
+
+        Returns:
+            bool: False si la fenêtre a été abandonnée (file pleine)
+        """
+        if not self.running:
+            return False
+        end_index = tag if isinstance(tag, (int, np.integer)) else None
+        window = self.classifier.prepare(window, sample_rate, source_id, end_index)
+        with self._condition:
+            if len(self.pending) >= self.max_pending:
+                self.dropped += 1
+                DROPPED.labels(source_id, 'backend').inc()
+                return False
+            self.pending.append((source_id, window, tag))
+            self._condition.notify()
+        return True
+
+    def _batch_loop(self):
+        """Regroupe les fenêtres en attente et les classifie en un seul passage"""
+        while True:
+            with self._condition:
+                while self.running and not self.pending:
+                    self._condition.wait()
+                if not self.running:
+                    return
+                # Laisser aux autres sources le temps de compléter le batch
+                deadline = time.monotonic() + self.max_delay
+                while self.running and len(self.pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self.pending[:self.max_batch]
+                del self.pending[:self.max_batch]
+
+            try:
+                results = self.classifier.classify_batch([window for _, window, _ in batch])
+            except Exception as e:
+                # Comme les workers du pool : un résultat vide par fenêtre, pour que chaque envoi soit rappelé
+                logging.error(f"Erreur lors de la classification TFLite: {str(e)}")
+                results = [[] for _ in batch]
+
+            for (source_id, _, tag), categories in zip(batch, results):
+                callback = self.callbacks.get(source_id)
+                if callback:
+                    try:
+                        callback(source_id, tag, categories)
+                    except Exception as e:
+                        logging.error(f"Erreur dans le callback de résultats pour {source_id}: {str(e)}")
+
+    def stop(self):
+        """Arrête le thread de batching"""
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        logging.info("Backend TFLite arrêté")
+
+
+# Instance globale partagée par les détecteurs, et options avec lesquelles elle a été créée
+tflite_backend = None
+_backend_options = None
+_backend_lock = threading.Lock()
+
+def _options_key(model_path, kwargs):
+    """Options comparables d'un appel (seule la présence d'un index de sons personnalisés compte)"""
+    return model_path, {
+        key: (value is not None if key == 'custom_index' else value) for key, value in kwargs.items()
+    }
+
+def get_tflite_backend(model_path, **kwargs):
+    """
+    Retourne le backend TFLite global, créé et démarré au premier appel.
+
+    Les appels suivants reçoivent la même instance : des options différentes de
+    celles de la création sont signalées, elles ne peuvent pas être appliquées.
+    """
+    global tflite_backend, _backend_options
+    with _backend_lock:
+        if tflite_backend is None:
+            tflite_backend = TFLiteBackend(model_path, **kwargs)
+            tflite_backend.start()
+            _backend_options = _options_key(model_path, kwargs)
+        else:
+            model, options = _options_key(model_path, kwargs)
+            created_model, created = _backend_options
+            differences = {
+                key: value for key, value in options.items()
+                if key in created and created[key] != value
+            }
+            if model != created_model or differences:
+                logging.warning(
+                    f"Backend TFLite déjà créé avec d'autres options ({created_model}, {created}), "
+                    f"ignorées: {model} {differences}"
+                )
+        return tflite_backend
+
+def shutdown_tflite_backend():
+    """Arrête le backend TFLite global"""
+    global tflite_backend, _backend_options
+    with _backend_lock:
+        if tflite_backend:
+            try:
+                tflite_backend.stop()
+            except Exception as e:
+                logging.error(f"Erreur lors de l'arrêt du backend TFLite: {e}")
+            tflite_backend = None
+            _backend_options = None
@@ -0,0 +1,317 @@
+import logging
+import socket
+import threading
+import time
+
+import numpy as np
+
+from metrics import registry
+from source_registry import BoundedSourceTable
+
+VBAN_PORT = 6980
+VBAN_HEADER_SIZE = 28
+VBAN_SAMPLE_RATES = [
+    6000, 12000, 24000, 48000, 96000, 192000, 384000,
+    8000, 16000, 32000, 64000, 128000, 256000, 512000,
+    11025, 22050, 44100, 88200, 176400, 352800
+]
+VBAN_PROTOCOL_AUDIO = 0x00
+VBAN_DATATYPE_INT16 = 0x01
+VBAN_MAX_PACKET_SIZE = VBAN_HEADER_SIZE + 1436  # En-tête + données maximales d'un paquet VBAN
+RECEIVE_BUFFER_SIZE = 2048  # Plus grand qu'un paquet VBAN : un datagramme plus long est détecté
+
+VBAN_PACKETS = registry.counter(
+    'claptrap_vban_packets_total', "Paquets audio VBAN reçus par émetteur", ['sender', 'stream']
+)
+
+
+def clean_stream_name(raw_name):
+    """Décode le nom de flux VBAN : s'arrête au premier caractère nul ou non imprimable"""
+    end = 0
+    while end < len(raw_name) and 32 <= raw_name[end] <= 126:
+        end += 1
+    return raw_name[:end].decode('ascii').strip()
+
+
+class VBANFrame:
+    """
+    Paquet audio VBAN dont l'en-tête a été décodé une seule fois.
+
+    Transmis par référence à tous les abonnés : ils ne doivent pas le modifier.
+    """
+
+    __slots__ = ('ip', 'port', 'stream_name', 'sample_rate', 'channels',
+                 'samples_per_frame', 'frame_counter', 'received_at', 'data')
+
+    def __init__(self, ip, port, stream_name, sample_rate, channels, samples_per_frame,
+                 frame_counter, received_at, data):
+        self.ip = ip
+        self.port = port
+        self.stream_name = stream_name
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.samples_per_frame = samples_per_frame
+        self.frame_counter = frame_counter
+        self.received_at = received_at
+        self.data = data  # Datagramme complet, en-tête compris
+
+    def samples(self):
+        """Échantillons int16 entrelacés du paquet (vue sans copie), tronqués à des trames complètes"""
+        count = (len(self.data) - VBAN_HEADER_SIZE) // (2 * self.channels) * self.channels
+        return np.frombuffer(self.data, dtype='<i2', offset=VBAN_HEADER_SIZE, count=count)
+
+    def to_float32(self, keep_channels=False):
+        """
+        Convertit les échantillons en float32 dans [-1, 1].
+
+        Returns:
+            numpy.ndarray: Bloc mono, ou [n_échantillons, n_canaux] si keep_channels et plusieurs canaux
+        """
+        audio_data = self.samples().astype(np.float32) / 32768.0
+        if self.channels > 1:
+            audio_data = audio_data.reshape(-1, self.channels)
+            if not keep_channels:
+                audio_data = audio_data.mean(axis=1)
+        return audio_data
+
+
+def parse_vban_frame(data, addr, received_at=None):
+    """
+    Décode l'en-tête d'un datagramme VBAN.
+
+    Octet 4 : sous-protocole (3 bits de poids fort) et index du taux d'échantillonnage,
+    octet 5 : échantillons par canal - 1, octet 6 : canaux - 1, octet 7 : format des
+    données, octets 8 à 23 : nom du flux, octets 24 à 27 : compteur de trames.
+
+    Returns:
+        VBANFrame: Paquet audio PCM int16, ou None pour tout autre datagramme
+    """
+    if len(data) <= VBAN_HEADER_SIZE or data[:4] != b'VBAN':
+        return None
+    if data[4] & 0xE0 != VBAN_PROTOCOL_AUDIO or data[7] & 0x07 != VBAN_DATATYPE_INT16:
+        return None
+    sr_index = data[4] & 0x1F
+    if sr_index >= len(VBAN_SAMPLE_RATES):
+        return None
+    return VBANFrame(
+        ip=addr[0],
+        port=addr[1],
+        stream_name=clean_stream_name(data[8:24]),
+        sample_rate=VBAN_SAMPLE_RATES[sr_index],
+        channels=data[6] + 1,
+        samples_per_frame=data[5] + 1,
+        frame_counter=int.from_bytes(data[24:28], 'little'),
+        received_at=received_at if received_at is not None else time.time(),
+        data=data
+    )
+
+
+class TokenBucket:
+    """Seau à jetons d'un émetteur : rate paquets/s en régime établi, burst paquets en rafale"""
+
+    __slots__ = ('tokens', 'last')
+
+    def __init__(self, burst, now):
+        self.tokens = float(burst)
+        self.last = now
+
+    def allow(self, rate, burst, now):
+        self.tokens = min(burst, self.tokens + (now - self.last) * rate)
+        self.last = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class VBANDispatcher:
+    """
+    Unique récepteur des paquets VBAN du port 6980.
+
+    Chaque datagramme est décodé une seule fois puis transmis à tous les
+    abonnés (découverte, détection, métriques). Le socket n'est ouvert que par
+    start() ; en mode d'ingestion asyncio, la boucle reçoit les datagrammes et
+    les transmet par feed().
+
+    Les datagrammes sont reçus dans un buffer préalloué. Ceux qui ne sont pas
+    des paquets audio VBAN, ou sont trop longs, sont rejetés avant toute
+    allocation. Un seau à jetons par émetteur (table LRU bornée) limite ensuite
+    le débit de chacun, pour qu'un appareil défaillant ou un flot d'adresses
+    usurpées ne puisse ni épuiser la mémoire ni affamer les flux légitimes.
+    """
+
+    def __init__(self, port=VBAN_PORT, bind_ip='0.0.0.0', max_senders=64, sender_rate=1000.0,
+                 sender_burst=200, report_interval=60.0):
+        """
+        Initialise le répartiteur.
+
+        Args:
+            port (int): Port UDP VBAN
+            bind_ip (str): Adresse d'écoute
+            max_senders (int): Nombre d'émetteurs suivis par la limitation de débit
+            sender_rate (float): Débit maximal (paquets/s) par émetteur
+            sender_burst (int): Rafale maximale (paquets) par émetteur
+            report_interval (float): Intervalle minimal (s) entre deux journalisations des rejets
+        """
+        self.port = port
+        self.bind_ip = bind_ip
+        self.subscribers = ()  # Remplacé en bloc : parcouru sans verrou par le thread de réception
+        self.sender_rate = sender_rate
+        self.sender_burst = sender_burst
+        self.senders = BoundedSourceTable(max_entries=max_senders, max_age=60.0)  # ip -> TokenBucket
+        self.report_interval = report_interval
+        self.packets = 0
+        self.invalid = 0  # Datagrammes non VBAN ou non audio
+        self.oversized = 0  # Datagrammes plus longs qu'un paquet VBAN
+        self.rate_limited = 0  # Paquets au-delà du débit autorisé de leur émetteur
+        self._reported = (0, 0, 0)
+        self._next_report = 0.0
+        self._buffer = bytearray(RECEIVE_BUFFER_SIZE)
+        self.running = False
+        self._sock = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.subscribe(count_packet)
+
+    def subscribe(self, callback):
+        """Abonne callback(frame) à tous les paquets audio reçus"""
+        with self._lock:
+            if callback not in self.subscribers:
+                self.subscribers = self.subscribers + (callback,)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self.subscribers = tuple(cb for cb in self.subscribers if cb != callback)
+
+    def start(self):
+        """Ouvre le socket et démarre le thread de réception"""
+        with self._lock:
+            if self.running:
+                return
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            # Marge dans le noyau pour absorber une rafale sans perdre les paquets des flux légitimes
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            self._sock.settimeout(0.5)
+            self._sock.bind((self.bind_ip, self.port))
+            self.running = True
+            self._thread = threading.Thread(target=self._receive_loop, name="vban-dispatcher", daemon=True)
+            self._thread.start()
+        logging.info(f"Démarrage de l'écoute VBAN sur le port {self.port}")
+
+    def _receive_loop(self):
+        view = memoryview(self._buffer)
+        while self.running:
+            try:
+                nbytes, addr = self._sock.recvfrom_into(self._buffer)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if self._accept(self._buffer, nbytes, addr[0]):
+                # Seuls les paquets acceptés sont copiés : le buffer est réutilisé à la réception suivante
+                self._dispatch(parse_vban_frame(bytes(view[:nbytes]), addr))
+
+    def _accept(self, data, nbytes, ip):
+        """Filtre un datagramme sur son en-tête et le débit de son émetteur, sans allocation"""
+        self.packets += 1
+        if nbytes > VBAN_MAX_PACKET_SIZE:
+            self.oversized += 1
+        elif (nbytes <= VBAN_HEADER_SIZE or not data.startswith(b'VBAN')
+                or data[4] & 0xE0 != VBAN_PROTOCOL_AUDIO or data[7] & 0x07 != VBAN_DATATYPE_INT16):
+            self.invalid += 1
+        else:
+            now = time.monotonic()
+            bucket = self.senders.touch(ip, None, now)
+            if bucket is None:
+                bucket = self.senders.touch(ip, TokenBucket(self.sender_burst, now), now)
+            if bucket.allow(self.sender_rate, self.sender_burst, now):
+                return True
+            self.rate_limited += 1
+        self._maybe_report()
+        return False
+
+    def _maybe_report(self):
+        """Journalise les rejets au plus une fois par report_interval"""
+        now = time.monotonic()
+        if now < self._next_report:
+            return
+        self._next_report = now + self.report_interval
+        counts = (self.invalid, self.oversized, self.rate_limited)
+        delta = [current - previous for current, previous in zip(counts, self._reported)]
+        self._reported = counts
+        if any(delta):
+            logging.warning(
+                f"VBAN: {delta[0]} datagrammes non VBAN, {delta[1]} trop longs et "
+                f"{delta[2]} au-delà du débit autorisé rejetés ({len(self.senders)} émetteurs suivis)"
+            )
+
+    def feed(self, data, addr):
+        """Filtre et décode un datagramme reçu par ailleurs (boucle asyncio), puis le transmet aux abonnés"""
+        if self._accept(data, len(data), addr[0]):
+            self._dispatch(parse_vban_frame(data, addr))
+
+    def _dispatch(self, frame):
+        if frame is None:
+            self.invalid += 1
+            return
+        for callback in self.subscribers:
+            try:
+                callback(frame)
+            except Exception as e:
+                logging.error(f"Erreur dans un abonné VBAN: {e}")
+
+    def stop(self):
+        """Ferme le socket (les abonnés restent inscrits)"""
+        self.running = False
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+
+MAX_LABELLED_STREAMS = 64  # Au-delà, les paquets sont comptés sous sender="other" (adresses usurpées)
+
+def count_packet(frame):
+    key = (frame.ip, frame.stream_name)
+    if key not in VBAN_PACKETS and len(VBAN_PACKETS) >= MAX_LABELLED_STREAMS:
+        key = ('other', '')
+    VBAN_PACKETS.labels(*key).inc()
+
+
+def collect_metrics():
+    """Datagrammes reçus et rejetés (collecteur du registre de métriques)"""
+    if vban_dispatcher:
+        yield 'claptrap_vban_datagrams_total', 'counter', "Datagrammes reçus sur le port VBAN", [({}, vban_dispatcher.packets)]
+        yield 'claptrap_vban_rejected_total', 'counter', "Datagrammes rejetés par le répartiteur VBAN", [
+            ({'reason': 'invalid'}, vban_dispatcher.invalid),
+            ({'reason': 'oversized'}, vban_dispatcher.oversized),
+            ({'reason': 'rate_limited'}, vban_dispatcher.rate_limited),
+        ]
+        yield 'claptrap_vban_senders', 'gauge', "Émetteurs VBAN suivis", [({}, len(vban_dispatcher.senders))]
+        yield 'claptrap_vban_senders_evicted_total', 'counter', "Émetteurs évincés de la table (pleine)", [({}, vban_dispatcher.senders.evicted)]
+
+registry.register_collector(collect_metrics)
+
+
+# Instance globale partagée par la découverte, le détecteur et le cœur d'ingestion
+vban_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_vban_dispatcher():
+    """Retourne le répartiteur VBAN global (son socket est ouvert par start())"""
+    global vban_dispatcher
+    with _dispatcher_lock:
+        if vban_dispatcher is None:
+            vban_dispatcher = VBANDispatcher()
+        return vban_dispatcher
+
+def shutdown_vban_dispatcher():
+    """Ferme le socket du répartiteur VBAN global"""
+    global vban_dispatcher
+    with _dispatcher_lock:
+        if vban_dispatcher:
+            vban_dispatcher.stop()
+            vban_dispatcher = None
@@ -1,7 +1,6 @@
 import logging
 
-from vban_detector_new import VBANDetector
-import time
+from vban_dispatcher import shutdown_vban_dispatcher
 
 # Global VBAN detector instance
 vban_detector = None
@@ -11,16 +10,12 @@ def init_vban_detector():
     global vban_detector
     try:
         if vban_detector is None:
-            vban_detector = VBANDetector()
-            vban_detector.start_listening()
-            # Attendre que le socket soit initialisé
-            for _ in range(10):  # Attendre jusqu'à 1 seconde
-                if vban_detector._socket is not None:
-                    print("VBANDetector initialized and listening")
-                    return True
-                time.sleep(0.1)
-            print("Timeout waiting for VBANDetector to initialize")
-            return False
+            from vban_detector_new import VBANDetector
+            detector = VBANDetector()
+            # Le socket est ouvert de manière synchrone par le répartiteur partagé
+            detector.start_listening()
+            vban_detector = detector
+            logging.info("VBANDetector initialized and listening")
         return True
     except Exception as e:
         logging.error(f"Error initializing VBANDetector: {e}")
@@ -40,7 +35,8 @@ def cleanup_vban_detector():
     if vban_detector:
         try:
             vban_detector.stop_listening()
-            print("Stopping VBAN detector...")
+            logging.info("Stopping VBAN detector...")
         except Exception as e:
             logging.error(f"Error stopping VBAN detector: {e}")
         vban_detector = None
+    shutdown_vban_dispatcher()
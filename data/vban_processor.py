@@ -8,6 +8,8 @@ from mediapipe.tasks.python.components import containers
 from mqtt_client import MQTTClient
 from vban_manager import get_vban_detector
 from circular_buffer import CircularAudioBuffer
+from metrics import register_buffer, unregister_buffer
+from hot_log import hot_log
 from vban_signal_processor import VBANSignalProcessor
 
 class VBANAudioProcessor:
@@ -63,6 +65,7 @@ class VBANAudioProcessor:
         
         # Buffer circulaire pour stocker les échantillons audio
         self.circular_buffer = CircularAudioBuffer(self.buffer_size, channels=1)
+        register_buffer(f"vban_{self.stream_name}", self.circular_buffer)
         
         # État interne
         self.is_running = False
@@ -210,6 +213,7 @@ class VBANAudioProcessor:
                 self.detector.remove_callback(self.audio_callback)
             self.is_running = False
             self.circular_buffer.clear()  # Vide le buffer à l'arrêt
+            unregister_buffer(f"vban_{self.stream_name}")
             logging.info(f"Arrêt du traitement audio VBAN pour {self.stream_name}")
             return True
             
@@ -319,7 +323,8 @@ class VBANAudioProcessor:
             
             # Écriture dans le buffer circulaire
             if not self.circular_buffer.write(audio_data):
-                logging.warning("Échec de l'écriture dans le buffer circulaire")
+                hot_log.count(f"VBAN {self.stream_name}", 'blocs perdus (buffer plein)')
+                hot_log.log(logging.WARNING, (self.stream_name, 'buffer'), "Échec de l'écriture dans le buffer circulaire")
                 return
                 
             # Lecture du buffer pour le traitement